@@ -8,16 +8,41 @@ HyperSpider - 高性能分布式爬虫框架 v3.0
 5. 可视化监控（Prometheus + Grafana）
 """
 import os
+import re
+import sys
+import array
+import html
+import json
+import time
+import math
+import mmap
+import shutil
+import struct
 import pickle
-import redis
+import sqlite3
+import heapq
+import queue
+import socket
+import bisect
+import hashlib
+import zlib
+import functools
+import unicodedata
+import multiprocessing
 from pathlib import Path
+from datetime import datetime, timezone
+from itertools import compress
+from collections import deque, OrderedDict, defaultdict
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import asyncio
 import aiohttp
-from typing import Dict, List, Optional, Any
+from aiohttp.abc import AbstractResolver
+from typing import Dict, List, Optional, Any, Tuple, Callable, Awaitable, AsyncIterator
 from pydantic import BaseModel, Field, validator
 from dependency_injector import containers, providers
 from loguru import logger
-from prometheus_client import start_http_server, Counter, Histogram
+from prometheus_client import start_http_server, Counter, Gauge, Histogram
 
 
 # ----------------------
@@ -30,6 +55,24 @@ class RequestConfig(BaseModel):
     timeout: float = Field(10.0, ge=1.0, le=60.0)
     retries: int = Field(3, ge=0)
     delay_range: tuple = Field((1, 3))
+    max_body_bytes: int = Field(10 * 1024 * 1024, gt=0)
+    chunk_size: int = Field(64 * 1024, gt=0)
+    allowed_content_types: List[str] = [
+        "text/html", "application/xhtml+xml", "text/plain", "text/xml", "application/xml"
+    ]
+    # 按偏好顺序声明的内容编码；aiohttp 无法解码的（缺 brotli / backports.zstd）自动略去
+    accept_encoding: List[str] = ["zstd", "br", "gzip", "deflate"]
+    limit_per_host: int = Field(8, ge=0)  # 0 表示不限制
+    keepalive_timeout: float = Field(30.0, gt=0)
+    dns_ttl: float = Field(300.0, ge=0)  # 0 表示不缓存成功结果
+    dns_negative_ttl: float = Field(30.0, ge=0)
+    dns_cache_size: int = Field(100_000, gt=0)
+    breaker_failures: int = Field(5, ge=0)  # 连续失败多少次熔断，0 表示不启用
+    breaker_cooldown: float = Field(30.0, gt=0)  # 熔断后多久放行半开探测（秒）
+    breaker_give_up: float = Field(600.0, gt=0)  # 持续熔断超过该时长后不再暂存该主机的URL
+    retry_budget_ratio: float = Field(0.1, ge=0)  # 重试次数上限占请求数的比例
+    retry_budget_burst: float = Field(100.0, ge=1)
+    user_agent: str = "HyperSpider/3.0"
 
     @validator('delay_range')
     def check_delay_range(cls, v):
@@ -38,78 +81,763 @@ class RequestConfig(BaseModel):
         return v
 
 
+class FrontierConfig(BaseModel):
+    """URL队列配置"""
+    directory: str = "./.frontier"
+    hot_capacity: int = Field(100_000, gt=0)
+    segment_bytes: int = Field(64 * 1024 * 1024, gt=0)
+    expected_urls: int = Field(10_000_000, gt=0)
+    false_positive_rate: float = Field(0.01, gt=0, lt=1)
+    priority_levels: int = Field(8, ge=1)  # 优先级档数，1 表示不评分、先进先出
+
+
+class ScoringConfig(BaseModel):
+    """URL优先级评分配置（见 UrlScorer）：分数在 0~1 之间，越高越先抓取"""
+    depth_penalty: float = Field(0.05, ge=0)  # 链接深度每加一层扣的分
+    patterns: Dict[str, float] = {  # URL正则 → 加减分（全部命中的累加）
+        r'[?&](page|p|start|offset)=\d+|/page/\d+': -0.3,
+        r'/(tag|tags|category|categories|archive)/': -0.3,
+        r'[?&](sort|order|filter)=': -0.2,
+    }
+    anchor_keywords: Dict[str, float] = {  # 锚文本关键词（小写子串）→ 加减分
+        'next': -0.2,
+        '下一页': -0.2,
+    }
+    host_budget: int = Field(0, ge=0)  # 每主机超过该数量后的新URL降到最低档（0 表示不限）
+
+
+class SchedulerConfig(BaseModel):
+    """按主机礼貌调度配置（延迟上下限取自 RequestConfig.delay_range）"""
+    buffer_size: int = Field(10_000, gt=0)
+    host_queue_size: int = Field(64, gt=0)
+    fill_batch: int = Field(1_000, gt=0)
+    backlog_size: int = Field(10_000, gt=0)  # 主机队列已满时暂存在各主机积压中的URL总数上限
+    error_threshold: float = Field(0.2, gt=0, le=1)
+    latency_factor: float = Field(1.0, ge=0)
+
+
+class RobotsConfig(BaseModel):
+    """robots.txt 配置：规则按主机缓存 ttl 秒，Crawl-delay 作为该主机请求间隔的下限"""
+    enabled: bool = True
+    user_agent: Optional[str] = None  # 匹配 User-agent 组的产品名，默认取 RequestConfig.user_agent 斜杠前部分
+    ttl: float = Field(86400.0, gt=0)
+    error_ttl: float = Field(600.0, gt=0)  # 5xx/网络错误时按全部禁止处理的时长
+    max_bytes: int = Field(512 * 1024, gt=0)  # 超出部分不解析
+    max_crawl_delay: float = Field(60.0, ge=0)
+    cache_size: int = Field(100_000, gt=0)
+
+
+class SitemapConfig(BaseModel):
+    """站点地图播种配置：urls（可以是索引）在后台流式读取，与抓取同时进行
+
+    只入队 lastmod 晚于 since 的URL：since 取 modified_since 与 state_file 中该站点地图
+    上次完整读取的时间两者中较晚者，重复抓取时只入队有变化的页面。
+    """
+    urls: List[str] = []
+    from_robots: bool = False  # 同时读取起始URL所在站点 robots.txt 中声明的站点地图
+    modified_since: Optional[datetime] = None  # 无时区按 UTC
+    state_file: Optional[str] = None  # 记录各站点地图上次读取的时间，抓取正常结束后写回
+    keep_undated: bool = True  # 按 lastmod 过滤时，没有 lastmod 的URL是否入队
+    max_depth: int = Field(3, ge=0)  # 索引嵌套层数上限
+    max_bytes: int = Field(64 * 1024 * 1024, gt=0)  # 单个文件（解压后）的字节上限，协议规定 50MB
+    max_pending: int = Field(200_000, gt=0)  # URL队列积压超过该数时暂停读取下一个文件
+    concurrency: int = Field(4, gt=0)  # 同时读取的文件数
+    timeout: float = Field(60.0, ge=1.0, le=600.0)  # 单个文件的下载时限
+
+
+class AdaptiveConfig(BaseModel):
+    """AIMD 自适应并发配置
+
+    全局在途上限在 [minimum, request.concurrency] 间调整，每主机在途上限在
+    [1, host_maximum] 间调整（默认 1：每主机串行）。adaptive=False 时固定取上限。
+    """
+    adaptive: bool = True
+    initial: int = Field(16, gt=0)
+    minimum: int = Field(1, gt=0)
+    host_maximum: int = Field(1, gt=0)
+    increase: float = Field(1.0, gt=0)
+    decrease: float = Field(0.7, gt=0, lt=1)
+    latency_tolerance: float = Field(2.0, gt=1)
+    error_tolerance: float = Field(0.1, gt=0, lt=1)
+
+
+class CacheConfig(BaseModel):
+    """分级缓存配置（未配置 redis_host 时不启用Redis层）"""
+    memory_bytes: int = Field(256 * 1024 * 1024, gt=0)
+    disk_dir: str = "./.cache"
+    disk_segment_bytes: int = Field(256 * 1024 * 1024, gt=0)
+    ttl: int = Field(3600, gt=0)
+    redis_host: Optional[str] = None
+    redis_port: int = 6379
+    redis_password: Optional[str] = None
+    redis_db: int = 0
+    redis_max_connections: int = Field(32, gt=0)
+    redis_batch_window: float = Field(0.002, ge=0)
+    redis_max_batch: int = Field(512, gt=0)
+    compression: str = "zstd"  # zstd / zlib / none；未安装 zstandard 时 zstd 回退为 zlib
+    compression_level: int = Field(3, ge=1, le=9)
+    dictionary_samples: int = Field(32, ge=0)  # 每主机积累多少页面后训练 zstd 字典，0 表示不用字典
+    dictionary_bytes: int = Field(16 * 1024, ge=1024)
+    dictionary_training_hosts: int = Field(64, gt=0)  # 同时积累样本的主机数上限
+    dictionary_cache: int = Field(256, gt=0)  # 常驻内存的字典（压缩/解压上下文）数上限
+    offload_bytes: int = Field(64 * 1024, ge=0)  # 不小于此大小的正文在磁盘缓存的执行器线程中压缩
+
+    @validator('compression')
+    def check_compression(cls, v):
+        if v not in ('zstd', 'zlib', 'none'):
+            raise ValueError("compression 只能是 zstd、zlib 或 none")
+        return v
+
+
+class ParseConfig(BaseModel):
+    """解析阶段配置（workers=0 时在事件循环内直接解析）"""
+    workers: int = Field(default_factory=lambda: os.cpu_count() or 1, ge=0)
+    max_in_flight: int = Field(64, gt=0)
+
+
+class LinkConfig(BaseModel):
+    """链接提取配置（allowed_domains 为空时不限制范围，子域名随父域名放行）"""
+    allowed_domains: List[str] = []
+    cache_size: int = Field(65536, ge=0)
+
+
+class DedupConfig(BaseModel):
+    """近重复检测配置（SimHash + 分段 LSH）
+
+    汉明距离不超过 max_distance 的页面视为近重复；指纹最多保留 capacity 个，
+    内存约 capacity × (max_distance + 1) × 8 字节。
+    """
+    enabled: bool = True
+    max_distance: int = Field(3, ge=0, le=7)
+    shingle: int = Field(3, gt=0)  # 按几个连续词组成一个特征
+    sample: int = Field(4, gt=0)  # 只取约 1/sample 的特征（按词哈希选取，同样的内容选中同样的特征）
+    min_tokens: int = Field(50, ge=1)  # 词数过少的页面不做判断
+    capacity: int = Field(10_000_000, gt=0)
+
+
+class BatchConfig(BaseModel):
+    """数据加工微批次配置：攒满 size 条或等待 interval 秒后整批处理"""
+    size: int = Field(256, gt=0)
+    interval: float = Field(0.05, gt=0)
+
+
+class BackpressureConfig(BaseModel):
+    """阶段间背压配置
+
+    抓取受 request.concurrency、解析受 parse.max_in_flight 限制；解析结果在收集器中至多积压
+    collect_capacity 条，至多 store_batches 个微批次同时加工落盘，占满后工作协程交付条目时等待。
+    进程常驻内存超过 memory_high 字节时暂停取新URL，回落到 memory_low（默认为 memory_high
+    的 85%）以下或在途条目全部落盘后恢复。
+    """
+    collect_capacity: int = Field(8192, gt=0)
+    store_batches: int = Field(2, gt=0)
+    memory_high: Optional[int] = Field(None, gt=0)
+    memory_low: Optional[int] = Field(None, gt=0)
+
+    @validator('memory_low')
+    def check_memory_low(cls, v, values):
+        if v is not None and (values.get('memory_high') is None or v >= values['memory_high']):
+            raise ValueError("memory_low 必须小于 memory_high")
+        return v
+
+
+class CheckpointConfig(BaseModel):
+    """断点续爬配置：每 interval 秒把URL队列、去重集合和主机状态快照到 directory"""
+    enabled: bool = False
+    directory: str = "./.checkpoint"
+    interval: float = Field(60.0, gt=0)
+
+
+class StorageConfig(BaseModel):
+    """存储管道配置：攒满 batch_rows 行或 batch_bytes 字节即落盘一个批次"""
+    directory: str = "./output"
+    batch_rows: int = Field(10_000, gt=0)
+    batch_bytes: int = Field(64 * 1024 * 1024, gt=0)
+
+
 class SpiderConfig(BaseModel):
     """爬虫全局配置"""
     name: str
     start_urls: List[str]
     request: RequestConfig
+    frontier: FrontierConfig = Field(default_factory=FrontierConfig)
+    scheduler: SchedulerConfig = Field(default_factory=SchedulerConfig)
+    robots: RobotsConfig = Field(default_factory=RobotsConfig)
+    sitemaps: SitemapConfig = Field(default_factory=SitemapConfig)
+    concurrency: AdaptiveConfig = Field(default_factory=AdaptiveConfig)
+    parse: ParseConfig = Field(default_factory=ParseConfig)
+    parsing_rules: Dict[str, str] = {}
+    links: LinkConfig = Field(default_factory=LinkConfig)
+    scoring: ScoringConfig = Field(default_factory=ScoringConfig)
+    dedup: DedupConfig = Field(default_factory=DedupConfig)
     pipelines: List[str] = ["json", "parquet"]
+    batch: BatchConfig = Field(default_factory=BatchConfig)
+    backpressure: BackpressureConfig = Field(default_factory=BackpressureConfig)
+    storage: StorageConfig = Field(default_factory=StorageConfig)
+    checkpoint: CheckpointConfig = Field(default_factory=CheckpointConfig)
     cache_enabled: bool = True
+    shards: int = Field(1, gt=0)
+    metrics_port: Optional[int] = Field(8000, gt=0)  # None 表示不启动指标端点；分片模式下依次加分片号
+    monitor_interval: float = Field(0.25, gt=0)  # 事件循环延迟采样与队列深度刷新周期（秒）
+    cache: CacheConfig = Field(default_factory=CacheConfig)
 
 
 # ----------------------
-# 容器依赖注入
+# 网络层模块
 # ----------------------
 
-class Container(containers.DeclarativeContainer):
-    """IoC容器"""
-    config = providers.Configuration()
-    http_client = providers.Singleton(
-        "network.AsyncHttpClient",
-        config=config.request
-    )
-    parser = providers.Factory(
-        "parser.HybridParser",
-        rules=config.parsing_rules
-    )
-    pipeline = providers.Selector(
-        config.pipelines,
-        json=providers.Factory("storage.JsonPipeline"),
-        parquet=providers.Factory("storage.ParquetPipeline")
-    )
+class ResponseRejected(Exception):
+    """响应因类型或大小不符被提前放弃（不重试）"""
 
+    def __init__(self, reason: str, detail: Any):
+        super().__init__(f"{reason}: {detail}")
+        self.reason = reason
+
+
+class RetryableStatus(Exception):
+    """服务端错误或限流状态码（计入熔断并按预算重试）"""
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class HostUnavailable(Exception):
+    """目标主机处于熔断状态，retry_in 秒后可再尝试"""
+
+    def __init__(self, url: str, retry_in: float):
+        super().__init__(f"主机熔断中，{retry_in:.1f}s 后重试: {url}")
+        self.retry_in = retry_in
+
+
+class StreamingBody:
+    """流式响应体：按块读取，超出字节上限即中止，边读边计算摘要
+
+    响应头不符合要求（Content-Type 不在白名单、Content-Length 超限）时在构造阶段
+    直接抛出 ResponseRejected，不读取任何正文。可作为异步迭代器交给逐块解析器；
+    retain=False 时读过的块不保留（read() 只读完剩余正文，返回空字节串）。
+    给定 truncate 时不检查 Content-Type，正文只读前 truncate 字节、其余丢弃而不是放弃响应
+    （robots.txt 之类的类型常被配错、协议规定只解析开头的文件）。
+    """
+
+    def __init__(self, resp: aiohttp.ClientResponse, config: RequestConfig, retain: bool = True,
+                 truncate: Optional[int] = None):
+        if truncate is None:
+            content_type = resp.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type and config.allowed_content_types and \
+                    not content_type.startswith(tuple(config.allowed_content_types)):
+                raise ResponseRejected('content_type', content_type)
+            if resp.content_length is not None and resp.content_length > config.max_body_bytes:
+                raise ResponseRejected('too_large', resp.content_length)
+        self._resp = resp
+        self.status = resp.status
+        self.retain = retain
+        self.truncate = truncate
+        self.max_bytes = config.max_body_bytes if truncate is None else truncate
+        self.chunk_size = config.chunk_size
+        self.received = 0
+        self.chunks: List[bytes] = []
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._done = False
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[bytes]:
+        async for chunk in self._resp.content.iter_chunked(self.chunk_size):
+            self.received += len(chunk)
+            full = self.received >= self.max_bytes
+            if self.received > self.max_bytes:
+                if self.truncate is None:
+                    raise ResponseRejected('too_large', self.received)
+                chunk = chunk[:len(chunk) - (self.received - self.max_bytes)]
+                self.received = self.max_bytes
+            self._hash.update(chunk)
+            if self.retain:
+                self.chunks.append(chunk)
+            yield chunk
+            if full and self.truncate is not None:
+                break
+        self._done = True
+
+    async def read(self) -> bytes:
+        """读完剩余正文（逐块解析器提前停止时继续读取）并返回完整内容"""
+        if not self._done:
+            async for _ in self:
+                pass
+        return b''.join(self.chunks)
+
+    @property
+    def digest(self) -> bytes:
+        return self._hash.digest()
+
+
+class CachedResponse:
+    """可缓存的响应：正文 + 条件请求校验信息（ETag / Last-Modified）+ 新鲜度
+
+    写入缓存的是只含压缩正文的副本（见 compressed()）；副本的 body 首次访问时才
+    用 codec 解压并留在该实例上。各缓存层保存的实例不带解压结果：TieredCache 读出时
+    返回 copy()，再次写入时 compressed() 丢弃解压结果。codec 与解压结果不参与序列化，
+    codec 由 TieredCache 读出后挂回。
+    """
+    __slots__ = ('_body', '_decoded', 'encoded', 'codec', 'size', 'digest', 'status', 'etag',
+                 'last_modified', 'fetched_at', 'max_age', 'cacheable')
+
+    MAX_AGE_PATTERN = re.compile(r'max-age\s*=\s*(\d+)', re.I)
+
+    def __init__(self, body: bytes, headers: Optional[Dict[str, str]] = None,
+                 digest: Optional[bytes] = None, status: int = 200):
+        self._body = body
+        self._decoded: Optional[bytes] = None
+        self.status = status
+        self.encoded: Optional[bytes] = None
+        self.codec: Optional['BodyCodec'] = None
+        self.size = len(body)
+        self.digest = digest
+        self.etag = None
+        self.last_modified = None
+        self.refresh(headers or {})
+
+    def refresh(self, headers) -> 'CachedResponse':
+        """按（200 或 304）响应头更新校验信息与新鲜度"""
+        self.etag = headers.get('ETag', self.etag)
+        self.last_modified = headers.get('Last-Modified', self.last_modified)
+        self.fetched_at = time.time()
+        directives = headers.get('Cache-Control', '').lower()
+        max_age = self.MAX_AGE_PATTERN.search(directives)
+        self.max_age = int(max_age.group(1)) if max_age and 'no-cache' not in directives else 0
+        self.cacheable = 'no-store' not in directives
+        return self
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.fetched_at + self.max_age
+
+    @property
+    def body(self) -> bytes:
+        if self._body is not None:
+            return self._body
+        if self._decoded is None:
+            self._decoded = self.codec.decompress(self.encoded)
+        return self._decoded
+
+    @property
+    def stored_bytes(self) -> int:
+        return self.size if self.encoded is None else len(self.encoded)
+
+    def copy(self) -> 'CachedResponse':
+        """浅拷贝（不带解压结果）"""
+        copy = object.__new__(CachedResponse)
+        for name in self.__slots__:
+            setattr(copy, name, getattr(self, name))
+        copy._decoded = None
+        return copy
+
+    def compressed(self, codec: 'BodyCodec', host: str,
+                   encoded: Optional[bytes] = None) -> 'CachedResponse':
+        """返回只保存压缩正文的副本（本身已是不带解压结果的压缩副本时原样返回）
+
+        encoded 为已经压缩好的正文（见 BodyCodec.compress_in）；省略时就地压缩。
+        """
+        if self._body is None:
+            return self if self._decoded is None else self.copy()
+        copy = self.copy()
+        copy._body = None
+        copy.encoded = encoded if encoded is not None else codec.compress(host, self._body)
+        copy.codec = codec
+        return copy
+
+    def __getstate__(self):
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state['codec'] = state['_decoded'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.status = 200  # 早期缓存条目没有状态码
+        self._decoded = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class CachingResolver(AbstractResolver):
+    """进程内共享的DNS缓存解析器
+
+    包装实际解析器（默认为 aiohttp 的线程池解析器），按 (主机, 端口, 地址族) 做LRU缓存。
+    解析结果带 ttl 字段时按记录TTL过期，否则使用 dns_ttl；解析失败按 dns_negative_ttl
+    负缓存。同一主机的并发查询合并为一次。
+    """
+    metrics = {
+        'lookups': Counter('dns_lookups', 'DNS查询统计', ['result']),
+        'latency': Histogram('dns_latency', 'DNS实际解析耗时')
+    }
+
+    def __init__(self, config: RequestConfig, resolver: Optional[AbstractResolver] = None):
+        self.ttl = config.dns_ttl
+        self.negative_ttl = config.dns_negative_ttl
+        self.capacity = config.dns_cache_size
+        self.resolver = resolver
+        self.entries: OrderedDict = OrderedDict()
+        self.pending: Dict[tuple, asyncio.Future] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'collapsed': 0, 'errors': 0, 'lookup_seconds': 0.0}
+
+    async def resolve(self, host: str, port: int = 0,
+                      family: socket.AddressFamily = socket.AF_INET) -> List[Dict[str, Any]]:
+        key = (host, port, family)
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if time.monotonic() < expires_at:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                self.metrics['lookups'].labels('hit').inc()
+                if isinstance(result, Exception):
+                    raise result
+                return list(result)
+            del self.entries[key]
+
+        pending = self.pending.get(key)
+        if pending is not None:
+            self.stats['collapsed'] += 1
+            self.metrics['lookups'].labels('collapsed').inc()
+            return list(await asyncio.shield(pending))
+
+        if self.resolver is None:
+            self.resolver = aiohttp.DefaultResolver()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        self.stats['misses'] += 1
+        self.metrics['lookups'].labels('miss').inc()
+        start = time.perf_counter()
+        try:
+            result = await self.resolver.resolve(host, port, family)
+        except OSError as e:
+            self.stats['errors'] += 1
+            self.metrics['lookups'].labels('error').inc()
+            self._store(key, e, self.negative_ttl)
+            future.set_exception(e)
+            future.exception()  # 无并发等待者时避免未取回异常的告警
+            raise
+        else:
+            ttls = [record['ttl'] for record in result if record.get('ttl')]
+            self._store(key, result, min(ttls) if ttls else self.ttl)
+            future.set_result(result)
+            return list(result)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats['lookup_seconds'] += elapsed
+            self.metrics['latency'].observe(elapsed)
+            self.pending.pop(key, None)
+            if not future.done():
+                future.cancel()
+
+    def _store(self, key: tuple, result: Any, ttl: float):
+        if ttl <= 0:
+            return
+        self.entries[key] = (time.monotonic() + ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    async def close(self):
+        if self.resolver is not None:
+            await self.resolver.close()
+
+
+class CircuitBreaker:
+    """单主机熔断器
+
+    closed：正常放行，连续失败达到阈值即 open；open：快速失败，冷却 cooldown 秒后转
+    half_open；half_open：只放行一个探测请求，成功则 closed，失败则重新 open。
+    """
+    __slots__ = ('threshold', 'cooldown', 'state', 'failures', 'opened_at', 'open_since', 'probing')
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_since = 0.0  # 本轮熔断开始的时刻（半开探测失败不重置）
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.state == 'closed':
+            return True
+        if self.state == 'open' and time.monotonic() >= self.opened_at + self.cooldown:
+            self.state = 'half_open'
+        if self.state == 'half_open' and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def retry_in(self) -> float:
+        """距离下一次可以探测的秒数"""
+        if self.state == 'open':
+            return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+        return min(1.0, self.cooldown) if self.state == 'half_open' else 0.0
+
+    def record(self, ok: bool):
+        self.probing = False
+        if ok:
+            self.state = 'closed'
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.threshold:
+            if self.state == 'closed':
+                self.open_since = time.monotonic()
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """全局重试预算（令牌桶）：每个请求存入 ratio 个令牌，每次重试取出一个
+
+    重试量因此被限制在总请求量的 ratio 比例以内（外加 burst 的初始余量），
+    大面积故障时不会因重试放大流量。
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.capacity = burst
+        self.tokens = burst
+
+    def deposit(self):
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
 
-# ----------------------
-# 网络层模块
-# ----------------------
 
 class AsyncHttpClient:
-    """智能HTTP客户端"""
+    """智能HTTP客户端
 
-    def __init__(self, config: RequestConfig):
+    连接器按主机限制并发连接数并保持长连接；DNS解析交给注入的共享解析器。
+    连接异常、5xx 与 429 计为失败：按主机熔断，重试受全局预算约束。熔断器只为
+    出过错的主机创建，恢复后即删除。
+    """
+    metrics = {
+        'requests': Counter('http_requests', 'HTTP请求统计', ['method', 'status']),
+        'latency': Histogram('http_latency', '请求延迟分布'),
+        'rejected': Counter('http_rejected', '提前放弃的响应', ['reason']),
+        'connections': Counter('http_connections', '连接获取统计', ['kind']),
+        'connect_latency': Histogram('http_connect_latency', '新建连接耗时（含DNS与握手）'),
+        'pool_wait': Histogram('http_pool_wait', '等待连接池空位的耗时'),
+        'in_flight': Gauge('http_in_flight', '在途HTTP请求数'),
+        'retries': Counter('http_retries', '重试统计（按预算放行/拒绝）', ['outcome']),
+        'short_circuited': Counter('http_short_circuited', '因主机熔断未发出的请求'),
+        'circuits_open': Gauge('http_circuits_open', '未闭合的主机熔断器数'),
+        'encodings': Counter('http_content_encoding', '响应内容编码统计', ['encoding'])
+    }
+
+    def __init__(self, config: RequestConfig, resolver: Optional[AbstractResolver] = None):
         self.config = config
+        self.resolver = resolver
         self.session: Optional[aiohttp.ClientSession] = None
-        self.metrics = {
-            'requests': Counter('http_requests', 'HTTP请求统计', ['method', 'status']),
-            'latency': Histogram('http_latency', '请求延迟分布')
-        }
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.retry_budget = RetryBudget(config.retry_budget_ratio, config.retry_budget_burst)
+        self.stats = {'connections_new': 0, 'connections_reused': 0,
+                      'connect_seconds': 0.0, 'pool_wait_seconds': 0.0,
+                      'retries': 0, 'retries_denied': 0, 'short_circuited': 0}
 
     async def __aenter__(self):
+        # DNS缓存由共享解析器负责，连接器自身的缓存关闭
         self.session = aiohttp.ClientSession(
             connector=aiohttp.TCPConnector(
                 limit=self.config.concurrency,
+                limit_per_host=self.config.limit_per_host,
+                keepalive_timeout=self.config.keepalive_timeout,
+                resolver=self.resolver,
+                use_dns_cache=self.resolver is None,
                 ssl=False
             ),
-            timeout=aiohttp.ClientTimeout(total=self.config.timeout)
+            timeout=aiohttp.ClientTimeout(total=self.config.timeout),
+            headers={
+                'Accept-Encoding': self.accept_encoding(self.config.accept_encoding),
+                'User-Agent': self.config.user_agent,
+            },
+            trace_configs=[self._trace_config()]
         )
         return self
 
+    @staticmethod
+    def accept_encoding(preferred: List[str]) -> str:
+        """只声明 aiohttp 能解码的编码：br 需要 brotli，zstd 需要 backports.zstd（3.14 起内置）"""
+        from aiohttp import compression_utils
+        available = {'gzip', 'deflate', 'identity'}
+        if getattr(compression_utils, 'HAS_BROTLI', False):
+            available.add('br')
+        if getattr(compression_utils, 'HAS_ZSTD', False):
+            available.add('zstd')
+        return ', '.join(encoding for encoding in preferred if encoding in available) or 'identity'
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        """统计连接复用、建连耗时与连接池排队耗时"""
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_queued_start.append(self._on_queued_start)
+        trace.on_connection_queued_end.append(self._on_queued_end)
+        trace.on_connection_create_start.append(self._on_create_start)
+        trace.on_connection_create_end.append(self._on_create_end)
+        trace.on_connection_reuseconn.append(self._on_reuse)
+        return trace
+
+    async def _on_queued_start(self, session, context, params):
+        context.queued_at = time.perf_counter()
+
+    async def _on_queued_end(self, session, context, params):
+        elapsed = time.perf_counter() - context.queued_at
+        self.stats['pool_wait_seconds'] += elapsed
+        self.metrics['pool_wait'].observe(elapsed)
+
+    async def _on_create_start(self, session, context, params):
+        context.connect_at = time.perf_counter()
+
+    async def _on_create_end(self, session, context, params):
+        elapsed = time.perf_counter() - context.connect_at
+        self.stats['connections_new'] += 1
+        self.stats['connect_seconds'] += elapsed
+        self.metrics['connections'].labels('new').inc()
+        self.metrics['connect_latency'].observe(elapsed)
+
+    async def _on_reuse(self, session, context, params):
+        self.stats['connections_reused'] += 1
+        self.metrics['connections'].labels('reused').inc()
+
     async def __aexit__(self, *exc):
         await self.session.close()
 
-    @logger.catch
-    async def fetch(self, url: str) -> Optional[bytes]:
-        """执行带熔断机制的请求"""
-        for attempt in range(self.config.retries + 1):
-            try:
-                async with self.session.get(url) as resp:
-                    content = await resp.read()
-                    self._record_metrics(resp.status)
-                    return content
-            except Exception as e:
-                logger.warning(f"请求失败 [{attempt + 1}/{self.config.retries}]: {str(e)}")
-                await self._handle_retry(attempt, url)
-        return None
+    @staticmethod
+    def host_of(url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    def retry_in(self, url: str) -> Optional[float]:
+        """主机熔断中时返回距下次探测的秒数；未熔断或已熔断过久（放弃暂存）时返回 None"""
+        breaker = self.breakers.get(self.host_of(url))
+        if breaker is None or breaker.state == 'closed':
+            return None
+        if time.monotonic() - breaker.open_since > self.config.breaker_give_up:
+            return None
+        return breaker.retry_in()
+
+    def _allow(self, host: str) -> bool:
+        breaker = self.breakers.get(host)
+        return breaker is None or breaker.allow()
+
+    def _record_result(self, host: str, ok: bool):
+        breaker = self.breakers.get(host)
+        if ok:
+            if breaker is not None:
+                if breaker.state != 'closed':
+                    self.metrics['circuits_open'].dec()
+                del self.breakers[host]
+            return
+        if not self.config.breaker_failures:
+            return
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(
+                self.config.breaker_failures, self.config.breaker_cooldown
+            )
+        was_closed = breaker.state == 'closed'
+        breaker.record(False)
+        if was_closed and breaker.state == 'open':
+            self.metrics['circuits_open'].inc()
+            logger.warning(f"主机熔断: {host}（连续失败 {breaker.failures} 次）")
+
+    async def fetch(self, url: str,
+                    cached: Optional[CachedResponse] = None,
+                    consumer: Optional[Callable[[StreamingBody], Awaitable[Any]]] = None,
+                    retain: bool = True, truncate: Optional[int] = None) -> Optional[CachedResponse]:
+        """同 request()，只返回响应"""
+        response, _ = await self.request(url, cached, consumer, retain, truncate)
+        return response
+
+    @logger.catch(exclude=HostUnavailable, default=(None, 'failed'))
+    async def request(self, url: str,
+                      cached: Optional[CachedResponse] = None,
+                      consumer: Optional[Callable[[StreamingBody], Awaitable[Any]]] = None,
+                      retain: bool = True, truncate: Optional[int] = None
+                      ) -> Tuple[Optional[CachedResponse], str]:
+        """执行带熔断机制的请求，返回 (响应, 结果)
+
+        主机熔断中时不发请求，抛出 HostUnavailable（熔断过久、已放弃暂存时返回 None）；
+        实际发出后失败的请求一律返回 None。重试受全局预算限制，请求途中主机被熔断时不再重试。
+        传入已缓存的响应时发送条件请求；服务端返回 304 时刷新并原样返回该缓存对象。
+        正文按块流式读取并受 max_body_bytes 限制；传入 consumer 时正文块边下载边交给它，
+        retain=False 时正文只交给 consumer、不在内存中拼接，返回的响应正文为空。
+        truncate 见 StreamingBody：不按类型放弃，正文截断到该长度。
+        结果为 ok（含 304）、rejected（响应因类型或大小被放弃，主机正常）、failed（请求失败）
+        或 short_circuited（熔断中未发请求）；调用方据此只把真正的网络结果反馈给限速。
+        """
+        host = self.host_of(url)
+        if not self._allow(host):
+            self.stats['short_circuited'] += 1
+            self.metrics['short_circuited'].inc()
+            retry_in = self.retry_in(url)
+            if retry_in is not None:
+                raise HostUnavailable(url, retry_in)
+            return None, 'short_circuited'
+        self.retry_budget.deposit()
+        headers = cached.validators() if cached is not None else None
+        ok = False
+        try:
+            for attempt in range(self.config.retries + 1):
+                try:
+                    # 每次尝试单独计时（含正文下载，不含重试退避）
+                    with self.metrics['in_flight'].track_inprogress(), self.metrics['latency'].time():
+                        async with self.session.get(url, headers=headers) as resp:
+                            self._record_metrics(resp.status)
+                            if resp.status >= 500 or resp.status == 429:
+                                raise RetryableStatus(resp.status)
+                            if resp.status == 304 and cached is not None:
+                                ok = True
+                                return cached.refresh(resp.headers), 'ok'
+                            body = StreamingBody(resp, self.config, retain, truncate)
+                            self.metrics['encodings'].labels(resp.headers.get('Content-Encoding', 'identity')).inc()
+                            if consumer is not None:
+                                await consumer(body)
+                            content = await body.read()
+                            ok = True
+                            return CachedResponse(content, resp.headers, digest=body.digest, status=resp.status), 'ok'
+                except ResponseRejected as e:
+                    logger.info(f"放弃响应 {url}: {str(e)}")
+                    self.metrics['rejected'].labels(e.reason).inc()
+                    ok = True
+                    return None, 'rejected'
+                except Exception as e:
+                    logger.warning(f"请求失败 [{attempt + 1}/{self.config.retries}]: {str(e)}")
+                    self._record_result(host, False)
+                    if attempt == self.config.retries or not self._allow_retry(host):
+                        return None, 'failed'
+                    await self._handle_retry(attempt, url)
+            return None, 'failed'
+        finally:
+            if ok:
+                self._record_result(host, True)
+            elif host in self.breakers:
+                self.breakers[host].probing = False
+
+    def _allow_retry(self, host: str) -> bool:
+        breaker = self.breakers.get(host)
+        if breaker is not None and breaker.state != 'closed':
+            return False
+        if not self.retry_budget.withdraw():
+            self.stats['retries_denied'] += 1
+            self.metrics['retries'].labels('denied').inc()
+            return False
+        self.stats['retries'] += 1
+        self.metrics['retries'].labels('allowed').inc()
+        return True
 
     def _record_metrics(self, status: int):
         self.metrics['requests'].labels('GET', status).inc()
@@ -119,189 +847,3415 @@ class AsyncHttpClient:
         logger.info(f"等待 {backoff} 秒后重试 {url}")
         await asyncio.sleep(backoff)
 
-class DiskCache:
-    """磁盘缓存实现"""
-    def __init__(self, cache_dir: str = "./cache", ttl: int = 3600):
-        self.cache_dir = Path(cache_dir)
-        self.ttl = ttl
-        self.cache_dir.mkdir(exist_ok=True)
 
-    def _get_path(self, key: str) -> Path:
-        return self.cache_dir / f"{hash(key)}.pkl"
+class RobotsRules:
+    """单个主机编译后的 robots.txt 规则
 
-    async def get(self, key: str) -> Optional[Any]:
-        file_path = self._get_path(key)
-        if not file_path.exists():
-            return None
+    生效规则是匹配路径的最长规则，等长时 Allow 优先。纯前缀规则按长度分组存入字典，
+    检查时从长到短对每种长度查一次 path[:长度]，代价只与不同长度的个数有关；含 * 或 $
+    的规则按同样的优先顺序编成一个正则的各个分支，命中的第一个分支即其中最优者，
+    两边取更长的一条。没有规则时直接放行。
+    """
+    __slots__ = ('prefixes', 'wildcard', 'wildcard_rules', 'crawl_delay', 'sitemaps')
 
-        import time
-        if time.time() - file_path.stat().st_mtime > self.ttl:
-            return None
+    def __init__(self, rules: List[Tuple[str, bool]] = (), crawl_delay: Optional[float] = None,
+                 sitemaps: List[str] = ()):
+        prefixes: Dict[int, Dict[str, bool]] = defaultdict(dict)
+        wildcards = []
+        for path, allow in rules:
+            if '*' in path or path.endswith('$'):
+                wildcards.append((path, allow))
+            else:
+                group = prefixes[len(path)]
+                group[path] = group.get(path, False) or allow
+        self.prefixes = sorted(prefixes.items(), reverse=True)
+        wildcards.sort(key=lambda rule: (-len(rule[0]), not rule[1]))
+        self.wildcard = re.compile('|'.join(f'({self._translate(path)})' for path, _ in wildcards)) if wildcards else None
+        self.wildcard_rules = [(len(path), allow) for path, allow in wildcards]
+        self.crawl_delay = crawl_delay
+        self.sitemaps = list(sitemaps)
 
-        try:
-            with open(file_path, 'rb') as f:
-                return pickle.load(f)
-        except (pickle.UnpicklingError, EOFError) as e:
-            print(f"缓存损坏: {e}")
-            return None
+    @property
+    def empty(self) -> bool:
+        return not self.prefixes and self.wildcard is None
 
-    async def set(self, key: str, value: Any):
-        file_path = self._get_path(key)
-        with open(file_path, 'wb') as f:
-            pickle.dump(value, f)
+    @staticmethod
+    def _translate(path: str) -> str:
+        """* 匹配任意字符序列，结尾的 $ 锚定路径结尾，其余按字面匹配前缀"""
+        anchored = path.endswith('$')
+        if anchored:
+            path = path[:-1]
+        return '.*'.join(map(re.escape, path.split('*'))) + (r'\Z' if anchored else '')
 
-class RedisCache:
-    """Redis缓存实现"""
-    def __init__(self,
-                 host: str = "localhost",
-                 port: int = 6379,
-                 password: str = None,
-                 db: int = 0,
-                 ttl: int = 3600):
-        self.client = redis.Redis(
-            host=host,
-            port=port,
-            password=password,
-            db=db,
-            decode_responses=False
-        )
-        self.ttl = ttl
+    @classmethod
+    def parse(cls, text: str, agent: str) -> 'RobotsRules':
+        """按 RFC 9309 解析：连续的 User-agent 行共用其后的规则；取与 agent 同名的组
+        （多个同名组合并），没有则取 *；Sitemap 不属于任何组"""
+        groups: Dict[str, List[Tuple[str, bool]]] = {}
+        delays: Dict[str, float] = {}
+        sitemaps, agents, in_rules = [], [], False
+        for line in text.splitlines():
+            key, sep, value = line.split('#', 1)[0].partition(':')
+            if not sep:
+                continue
+            key, value = key.strip().lower(), value.strip()
+            if key == 'user-agent':
+                if in_rules:
+                    agents, in_rules = [], False
+                name = value.split('/', 1)[0].strip().lower()
+                agents.append(name)
+                groups.setdefault(name, [])
+            elif key in ('allow', 'disallow'):
+                in_rules = True
+                if value:
+                    for name in agents:
+                        groups[name].append((value, key == 'allow'))
+            elif key == 'crawl-delay':
+                in_rules = True
+                try:
+                    delay = float(value)
+                except ValueError:
+                    continue
+                for name in agents:
+                    delays[name] = delay
+            elif key == 'sitemap' and value:
+                sitemaps.append(value)
+        name = agent if agent in groups else '*'
+        return cls(groups.get(name, ()), delays.get(name), sitemaps)
 
-    async def get(self, key: str) -> Optional[Any]:
-        try:
-            data = self.client.get(key)
-            return pickle.loads(data) if data else None
-        except redis.RedisError as e:
-            print(f"Redis错误: {e}")
-            return None
+    def allowed(self, path: str) -> bool:
+        """path 为 URL 的路径加查询串"""
+        length, allow = 0, True
+        for size, group in self.prefixes:
+            if size <= len(path):
+                verdict = group.get(path[:size])
+                if verdict is not None:
+                    length, allow = size, verdict
+                    break
+        if self.wildcard is not None and self.wildcard_rules[0][0] >= length:
+            match = self.wildcard.match(path)
+            if match is not None:
+                size, verdict = self.wildcard_rules[match.lastindex - 1]
+                if size > length or (size == length and verdict):
+                    allow = verdict
+        return allow
 
-    async def set(self, key: str, value: Any):
-        try:
-            self.client.setex(
-                name=key,
-                time=self.ttl,
-                value=pickle.dumps(value)
-            )
-        except redis.RedisError as e:
-            print(f"Redis写入错误: {e}")
 
-# ----------------------
-# 数据处理模块
-# ----------------------
+class RobotsCache:
+    """按主机缓存编译后的 robots.txt 规则
 
-class DataPipeline:
-    """数据处理管道"""
+    规则按 (协议, 主机) 在内存中 LRU 缓存 ttl 秒。过期或未命中时先查共享的 TieredCache
+    （键为 robots.txt 的URL，抓取时间在 ttl 内即直接使用），否则经 HTTP 客户端抓取
+    （带缓存条目的校验信息，304 时沿用旧正文）并写回；同一主机的并发查询合并为一次。
+    2xx 按 RFC 9309 解析，其余 4xx 视为不限制；5xx、429 与网络错误视为全部禁止，
+    error_ttl 秒后重试。每次加载后经 on_delay 把 Crawl-delay（上限 max_crawl_delay，
+    未声明为 0）交给调度器。
+    """
+    ALLOW_ALL = RobotsRules()
+    DISALLOW_ALL = RobotsRules([('/', False)])
 
-    def __init__(self, config: SpiderConfig):
-        self.processors = [
-            self._clean_html,
-            self._normalize_text,
-            self._validate_data
-        ]
+    metrics = {
+        'checks': Counter('robots_checks', 'robots.txt 检查结果', ['result']),
+        'loads': Counter('robots_loads', 'robots.txt 规则加载来源', ['source']),
+    }
+
+    def __init__(self, config: RobotsConfig, user_agent: str, cache: Optional['TieredCache'] = None,
+                 on_delay: Optional[Callable[[str, float], Any]] = None):
+        self.config = config
+        self.agent = (config.user_agent or user_agent).split('/', 1)[0].strip().lower()
+        self.cache = cache
+        self.on_delay = on_delay
+        self.entries: OrderedDict = OrderedDict()
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.stats = {'allowed': 0, 'disallowed': 0, 'memory': 0, 'cache': 0, 'network': 0,
+                      'collapsed': 0, 'errors': 0}
+
+    @staticmethod
+    def split(url: str) -> Tuple[str, str]:
+        """规范URL拆成 (源, 路径加查询串)，不做完整解析"""
+        slash = url.find('/', url.find('//') + 2)
+        if slash < 0:
+            return url, '/'
+        origin, path = url[:slash], url[slash:]
+        fragment = path.find('#')
+        return origin, path if fragment < 0 else path[:fragment]
+
+    def permits(self, url: str) -> bool:
+        """同步检查：规则已在内存中且禁止时返回 False，否则放行（入队前过滤用）"""
+        origin, path = self.split(url)
+        entry = self.entries.get(origin)
+        if entry is None or entry[1].empty or time.monotonic() >= entry[0]:
+            return True
+        return entry[1].allowed(path)
 
-    async def process(self, data: Dict) -> Dict:
-        """数据加工流水线"""
+    async def allowed(self, client: 'AsyncHttpClient', url: str) -> bool:
+        origin, path = self.split(url)
+        allowed = (await self.rules(client, origin)).allowed(path)
+        result = 'allowed' if allowed else 'disallowed'
+        self.stats[result] += 1
+        self.metrics['checks'].labels(result).inc()
+        return allowed
+
+    async def rules(self, client: 'AsyncHttpClient', origin: str) -> RobotsRules:
+        entry = self.entries.get(origin)
+        if entry is not None:
+            expires_at, rules = entry
+            if time.monotonic() < expires_at:
+                self.entries.move_to_end(origin)
+                self.stats['memory'] += 1
+                return rules
+            del self.entries[origin]
+
+        pending = self.pending.get(origin)
+        if pending is not None:
+            self.stats['collapsed'] += 1
+            self.metrics['loads'].labels('collapsed').inc()
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[origin] = future
         try:
-            for processor in self.processors:
-                data = await processor(data)
-            return data
+            rules, ttl = await self._load(client, origin)
         except Exception as e:
-            logger.error(f"数据处理失败: {str(e)}")
+            # 主机熔断（HostUnavailable）等：并发等待者一起放弃，规则不缓存
+            future.set_exception(e)
+            future.exception()
             raise
+        else:
+            self._store(origin, rules, ttl)
+            if self.on_delay is not None:
+                self.on_delay(urlsplit(origin).netloc.lower(), min(rules.crawl_delay or 0.0, self.config.max_crawl_delay))
+            future.set_result(rules)
+            return rules
+        finally:
+            self.pending.pop(origin, None)
+            if not future.done():
+                future.cancel()
 
-    async def _clean_html(self, data: Dict) -> Dict:
-        # HTML清洗逻辑
-        return data
+    async def _load(self, client: 'AsyncHttpClient', origin: str) -> Tuple[RobotsRules, float]:
+        url = origin + '/robots.txt'
+        response = None
+        cached = await self.cache.get(url) if self.cache is not None else None
+        if not isinstance(cached, CachedResponse):
+            cached = None
+        elif time.time() < cached.fetched_at + self.config.ttl:
+            response, source = cached, 'cache'
+        if response is None:
+            # 不按 Content-Type 放弃、超长只取开头：否则配错类型或过大的 robots.txt 会被当作
+            # 抓取失败，整个主机按全部禁止处理（RFC 9309 要求至少解析前 500 KiB）
+            response, source = await client.fetch(url, cached, truncate=self.config.max_bytes), 'network'
+            if response is not None and response.cacheable and self.cache is not None:
+                await self.cache.set(url, response)
+        if response is None or response.status >= 500:
+            source = 'error'
+        self.stats['errors' if source == 'error' else source] += 1
+        self.metrics['loads'].labels(source).inc()
 
-    async def _normalize_text(self, data: Dict) -> Dict:
-        # 文本规范化
-        return data
+        if source == 'error':
+            return self.DISALLOW_ALL, self.config.error_ttl
+        if response.status >= 400:
+            return self.ALLOW_ALL, self.config.ttl
+        text = response.body[:self.config.max_bytes].decode('utf-8', errors='ignore')
+        rules = RobotsRules.parse(text, self.agent)
+        return rules, self.config.ttl
 
-    async def _validate_data(self, data: Dict) -> Dict:
-        # 数据验证
-        return data
+    def _store(self, origin: str, rules: RobotsRules, ttl: float):
+        self.entries[origin] = (time.monotonic() + ttl, rules)
+        self.entries.move_to_end(origin)
+        while len(self.entries) > self.config.cache_size:
+            self.entries.popitem(last=False)
 
 
-# ----------------------
-# 核心引擎
-# ----------------------
+class SitemapReader:
+    """站点地图流式读取（sitemaps.org 协议）
 
-class SpiderEngine:
-    """爬虫核心引擎"""
+    每个文件经独立的 HTTP 客户端流式下载（正文不保留）；gzip 按魔数识别后逐块解压，
+    解压输出按块限长，超过 max_bytes 即放弃该文件。XMLPullParser 每处理完一条
+    <url>/<sitemap> 就清空已建的树，内存占用与文件大小、URL总数无关。
+    索引中 lastmod 不晚于 since 的子站点地图整个跳过；URL 的 lastmod 不晚于 since 时
+    不入队。每读完一个数据块，本块内的URL成批交给 emit。
+    背压以文件为单位：backlog() 达到 max_pending 时暂停开始下一个文件，已开始的文件
+    （协议规定至多 5 万条）一直读完，不会让连接挂起到超时。
+    完整读完（所有子文件都成功）的站点地图记录本次开始读取的时间，commit() 时写回 state_file。
+    """
+    CONTENT_TYPES = [
+        "text/xml", "application/xml", "text/plain",
+        "application/gzip", "application/x-gzip", "application/octet-stream",
+    ]
+    GZIP_MAGIC = b'\x1f\x8b'
+    INFLATE_BYTES = 256 * 1024  # 每次解压输出的上限，防止压缩炸弹一次性展开
+    POLL_INTERVAL = 0.1
 
-    def __init__(self, container: Container):
-        self.container = container
-        self.queue = asyncio.Queue()
-        self.cache = TieredCache()
-        self.rate_limiter = AdaptiveRateLimiter()
-        self.metrics = {
-            'processed': Counter('items_processed', '已处理项目数')
-        }
+    metrics = {
+        'files': Counter('sitemap_files', '站点地图文件读取结果', ['result']),
+        'urls': Counter('sitemap_urls', '站点地图中的URL', ['result']),
+    }
 
-    async def run(self):
-        """启动爬虫"""
-        start_http_server(8000)
-        async with self.container.http_client() as client:
-            await self._seed_urls()
-            workers = [self._worker(client) for _ in range(self.config.concurrency)]
-            await asyncio.gather(*workers)
+    def __init__(self, config: SitemapConfig, request: RequestConfig,
+                 canonicalize: Callable[[str], Optional[str]], resolver: Optional[AbstractResolver] = None):
+        self.config = config
+        self.request = request.copy(update={
+            'max_body_bytes': config.max_bytes,
+            'allowed_content_types': self.CONTENT_TYPES,
+            'timeout': config.timeout,
+            'concurrency': config.concurrency,
+        })
+        self.canonicalize = canonicalize
+        self.resolver = resolver
+        modified_since = config.modified_since
+        if modified_since is not None and modified_since.tzinfo is None:
+            modified_since = modified_since.replace(tzinfo=timezone.utc)
+        self.modified_since = modified_since.timestamp() if modified_since is not None else None
+        self.state: Dict[str, float] = {}
+        if config.state_file and Path(config.state_file).exists():
+            self.state = json.loads(Path(config.state_file).read_text('utf-8'))
+        self.completed: Dict[str, float] = {}
+        self.stats = {'files': 0, 'indexes': 0, 'skipped': 0, 'failed': 0, 'bytes': 0,
+                      'urls': 0, 'unchanged': 0, 'invalid': 0, 'paused_seconds': 0.0}
 
-    async def _worker(self, client: AsyncHttpClient):
-        """工作协程"""
+    @staticmethod
+    def timestamp(value: Optional[str]) -> Optional[float]:
+        """W3C Datetime（lastmod 的格式）转 Unix 时间戳；无时区按 UTC，无法解析时返回 None"""
+        if not value:
+            return None
+        value = value.strip()
+        if len(value) == 4:
+            value += '-01-01'
+        elif len(value) == 7:
+            value += '-01'
+        elif value.endswith(('Z', 'z')):
+            value = value[:-1] + '+00:00'
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+    def since(self, root: str) -> Optional[float]:
+        bounds = [bound for bound in (self.modified_since, self.state.get(root)) if bound is not None]
+        return max(bounds) if bounds else None
+
+    async def read(self, roots: List[str], emit: Callable[[List[str]], Any],
+                   backlog: Callable[[], int] = lambda: 0):
+        """读取 roots 及其引用的全部站点地图，URL 按文件内顺序分批交给 emit"""
+        started = time.time()
+        pending: asyncio.Queue = asyncio.Queue()
+        failed = set()
+        for root in dict.fromkeys(roots):
+            pending.put_nowait((root, root, 0, self.since(root)))
+        async with AsyncHttpClient(self.request, self.resolver) as client:
+            workers = [
+                asyncio.create_task(self._worker(client, pending, emit, backlog, failed))
+                for _ in range(self.config.concurrency)
+            ]
+            try:
+                await pending.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        for root in dict.fromkeys(roots):
+            if root not in failed:
+                self.completed[root] = started
+
+    def commit(self):
+        """把本次完整读取的站点地图及其开始时间写回 state_file（抓取正常结束后调用）"""
+        if not self.config.state_file or not self.completed:
+            return
+        self.state.update(self.completed)
+        path = Path(self.config.state_file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_text(json.dumps(self.state, ensure_ascii=False, indent=1), 'utf-8')
+        os.replace(tmp_path, path)
+        self.completed = {}
+
+    async def _worker(self, client: AsyncHttpClient, pending: asyncio.Queue,
+                      emit: Callable[[List[str]], Any], backlog: Callable[[], int], failed: set):
+        loop = asyncio.get_running_loop()
         while True:
-            url = await self.queue.get()
-            await self._process_url(client, url)
-            self.queue.task_done()
+            url, root, depth, since = await pending.get()
+            try:
+                if backlog() >= self.config.max_pending:
+                    paused = loop.time()
+                    while backlog() >= self.config.max_pending:
+                        await asyncio.sleep(self.POLL_INTERVAL)
+                    self.stats['paused_seconds'] += loop.time() - paused
+                try:
+                    ok = await self._read_file(client, url, root, depth, since, pending, emit)
+                except HostUnavailable as e:
+                    # 主机熔断：稍后重读该文件，不算失败
+                    await asyncio.sleep(e.retry_in)
+                    pending.put_nowait((url, root, depth, since))
+                    continue
+                if not ok:
+                    failed.add(root)
+                    self.stats['failed'] += 1
+                    self.metrics['files'].labels('failed').inc()
+            finally:
+                pending.task_done()
 
-    async def _process_url(self, client: AsyncHttpClient, url: str):
-        """处理单个URL"""
-        try:
-            content = await self._fetch_content(client, url)
-            if not content:
+    async def _read_file(self, client: AsyncHttpClient, url: str, root: str, depth: int,
+                         since: Optional[float], pending: asyncio.Queue,
+                         emit: Callable[[List[str]], Any]) -> bool:
+        """流式读取一个站点地图文件，返回是否完整读取"""
+        from xml.etree.ElementTree import XMLPullParser, ParseError
+        found = []  # 文件类型：首条记录是 <url> 还是 <sitemap>
+
+        async def consume(body: StreamingBody):
+            if body.status >= 400:
                 return
+            found.clear()  # 失败重试时从头再读
+            parser = XMLPullParser(events=('start', 'end'))
+            document = None
+            inflater = None
+            size = 0
+            async for chunk in body:
+                if size == 0 and inflater is None and chunk[:2] == self.GZIP_MAGIC:
+                    inflater = zlib.decompressobj(31)
+                while chunk:
+                    if inflater is not None:
+                        try:
+                            data = inflater.decompress(chunk, self.INFLATE_BYTES)
+                        except zlib.error as e:
+                            raise ResponseRejected('sitemap_malformed', e)
+                        chunk = inflater.unconsumed_tail
+                        if inflater.eof and inflater.unused_data:
+                            # 多成员 gzip：后续成员另起解压器
+                            chunk, inflater = inflater.unused_data, zlib.decompressobj(31)
+                    else:
+                        data, chunk = chunk, b''
+                    size += len(data)
+                    if size > self.config.max_bytes:
+                        raise ResponseRejected('too_large', size)
+                    try:
+                        parser.feed(data)
+                    except ParseError as e:
+                        raise ResponseRejected('sitemap_malformed', e)
+                    urls = []
+                    for event, element in parser.read_events():
+                        if event == 'start':
+                            if document is None:
+                                document = element
+                            continue
+                        tag = element.tag[element.tag.rfind('}') + 1:]
+                        if tag == 'url':
+                            self._collect_url(element, since, urls)
+                        elif tag == 'sitemap':
+                            self._collect_sitemap(element, root, depth, since, pending)
+                        else:
+                            continue
+                        if not found:
+                            found.append('index' if tag == 'sitemap' else 'urlset')
+                        document.clear()
+                    if urls:
+                        self.stats['urls'] += len(urls)
+                        self.metrics['urls'].labels('queued').inc(len(urls))
+                        emit(urls)
+            try:
+                parser.close()  # 文档不完整（如被截断）时报错
+            except ParseError as e:
+                raise ResponseRejected('sitemap_malformed', e)
+            self.stats['bytes'] += size
 
-            parsed = self.container.parser().parse(content)
-            processed = await self.container.pipeline().process(parsed)
-            await self._store_data(processed)
+        response = await client.fetch(url, consumer=consume, retain=False)
+        if response is None or response.status >= 400:
+            return False
+        kind = found[0] if found else 'empty'
+        self.stats['indexes' if kind == 'index' else 'files'] += 1
+        self.metrics['files'].labels(kind).inc()
+        return True
 
-            self.metrics['processed'].inc()
-            await self._discover_links(content)
-        finally:
-            await self.rate_limiter.adjust()
+    @staticmethod
+    def _fields(element) -> Tuple[Optional[str], Optional[str]]:
+        loc = lastmod = None
+        for child in element:
+            tag = child.tag[child.tag.rfind('}') + 1:]
+            if tag == 'loc':
+                loc = (child.text or '').strip()
+            elif tag == 'lastmod':
+                lastmod = child.text
+        return loc, lastmod
 
+    def _collect_url(self, element, since: Optional[float], urls: List[str]):
+        loc, lastmod = self._fields(element)
+        if since is not None:
+            modified = self.timestamp(lastmod)
+            if (modified is None and not self.config.keep_undated) or (modified is not None and modified <= since):
+                self.stats['unchanged'] += 1
+                self.metrics['urls'].labels('unchanged').inc()
+                return
+        url = self.canonicalize(loc) if loc else None
+        if url is None:
+            self.stats['invalid'] += 1
+            self.metrics['urls'].labels('invalid').inc()
+            return
+        urls.append(url)
 
-# ----------------------
-# 辅助模块
-# ----------------------
+    def _collect_sitemap(self, element, root: str, depth: int, since: Optional[float],
+                         pending: asyncio.Queue):
+        loc, lastmod = self._fields(element)
+        if not loc or depth >= self.config.max_depth:
+            return
+        modified = self.timestamp(lastmod) if since is not None else None
+        if modified is not None and modified <= since:
+            # 子站点地图自上次读取后没有变化：其中的URL也都没有变化
+            self.stats['skipped'] += 1
+            self.metrics['files'].labels('skipped').inc()
+            return
+        pending.put_nowait((loc, root, depth + 1, since))
+
+
+class BodyCodec:
+    """缓存正文压缩
+
+    优先 zstd：每个主机积累 dictionary_samples 个页面后在后台线程训练专属字典，之后
+    该主机的正文用字典压缩（同站小页面共享大量模板，字典能显著提高压缩率）。字典按
+    dict_id 持久化到 directory，zstd 帧头自带 dict_id，解压时按需加载；字典缺失的
+    条目视为缓存未命中。压缩结果首字节标记编码方式。未安装 zstandard 时回退到 zlib。
+    大正文可用 compress_in 交给执行器线程压缩：该线程使用自己的一套压缩上下文，
+    因此执行器只能是单线程的（磁盘缓存的执行器即是）。
+    """
+    RAW, ZLIB, ZSTD = b'-', b'd', b'z'
+    SAMPLE_BYTES = 16 * 1024  # 单个训练样本截断长度
+
+    metrics = {
+        'bytes': Counter('cache_body_bytes', '写入缓存的正文字节数', ['kind']),
+        'dictionaries': Counter('cache_dictionaries_trained', '已训练的主机zstd字典数')
+    }
+
+    def __init__(self, config: CacheConfig, directory: str):
+        self.config = config
+        self.method = config.compression
+        self.zstd = None
+        if self.method == 'zstd':
+            try:
+                import zstandard
+                self.zstd = zstandard
+            except ImportError:
+                logger.warning("未安装 zstandard，缓存压缩回退到 zlib：pip install zstandard")
+                self.method = 'zlib'
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.samples: OrderedDict = OrderedDict()  # 主机 -> 训练样本
+        self.host_dictionaries: Dict[str, int] = {}  # 主机 -> dict_id（0 表示训练失败，不再尝试）
+        self.compressors: OrderedDict = OrderedDict()
+        self.thread_compressors: OrderedDict = OrderedDict()  # 只在执行器线程内使用
+        self.decompressors: OrderedDict = OrderedDict()
+        self.training: set = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zstd-dict")
+        self.stats = {'raw_bytes': 0, 'stored_bytes': 0, 'dictionaries': 0, 'missing_dictionaries': 0}
+        if self.zstd is not None:
+            self.plain_compressor = self.zstd.ZstdCompressor(level=config.compression_level)
+            self.thread_plain_compressor = self.zstd.ZstdCompressor(level=config.compression_level)
+            self.plain_decompressor = self.zstd.ZstdDecompressor()
+            self._load()
+
+    def _load(self):
+        index = self.directory / "hosts.tsv"
+        if index.exists():
+            for line in index.read_text('utf-8').splitlines():
+                host, _, dict_id = line.rpartition('\t')
+                if host:
+                    self.host_dictionaries[host] = int(dict_id)
 
-class AdaptiveRateLimiter:
-    """智能限速器"""
+    def compress(self, host: str, body: bytes) -> bytes:
+        blob = self._encode(self._prepare(host, body), body, threaded=False)
+        self._account(body, blob)
+        return blob
 
-    def __init__(self):
-        self.delay = 1.0
-        self.error_count = 0
+    async def compress_in(self, executor: ThreadPoolExecutor, host: str, body: bytes) -> bytes:
+        """在单线程执行器中压缩，不阻塞事件循环；采样与记账仍在事件循环内完成"""
+        dict_id = self._prepare(host, body)
+        loop = asyncio.get_running_loop()
+        blob = await loop.run_in_executor(executor, self._encode, dict_id, body, True)
+        self._account(body, blob)
+        return blob
+
+    def _prepare(self, host: str, body: bytes) -> Optional[int]:
+        """事件循环内：积累字典训练样本，返回该主机可用的 dict_id（没有时为 None）"""
+        if self.method != 'zstd':
+            return None
+        dict_id = self.host_dictionaries.get(host)
+        if dict_id is None and self.config.dictionary_samples:
+            self._sample(host, body)
+        return dict_id or None
 
-    async def adjust(self):
-        """动态调整请求间隔"""
-        if self.error_count > 5:
-            self.delay = min(self.delay * 1.5, 10.0)
+    def _encode(self, dict_id: Optional[int], body: bytes, threaded: bool) -> bytes:
+        if self.method == 'none':
+            return self.RAW + body
+        if self.method == 'zlib':
+            return self.ZLIB + zlib.compress(body, self.config.compression_level)
+        if threaded:
+            contexts, plain = self.thread_compressors, self.thread_plain_compressor
         else:
-            self.delay = max(self.delay * 0.9, 0.1)
+            contexts, plain = self.compressors, self.plain_compressor
+        compressor = self._context(contexts, dict_id, compress=True) if dict_id else None
+        return self.ZSTD + (compressor or plain).compress(body)
 
-        await asyncio.sleep(self.delay)
+    def _account(self, body: bytes, blob: bytes):
+        self.stats['raw_bytes'] += len(body)
+        self.stats['stored_bytes'] += len(blob)
+        self.metrics['bytes'].labels('raw').inc(len(body))
+        self.metrics['bytes'].labels('stored').inc(len(blob))
+
+    def readable(self, blob: bytes) -> bool:
+        """能否解压（zstd 条目需要对应字典仍然存在）"""
+        tag = blob[:1]
+        if tag != self.ZSTD:
+            return tag in (self.RAW, self.ZLIB)
+        if self.zstd is None:
+            return False
+        dict_id = self.zstd.get_frame_parameters(blob[1:19]).dict_id
+        if dict_id and self._context(self.decompressors, dict_id, compress=False) is None:
+            self.stats['missing_dictionaries'] += 1
+            return False
+        return True
+
+    def decompress(self, blob: bytes) -> bytes:
+        tag, data = blob[:1], memoryview(blob)[1:]
+        if tag == self.RAW:
+            return bytes(data)
+        if tag == self.ZLIB:
+            return zlib.decompress(data)
+        dict_id = self.zstd.get_frame_parameters(data[:18]).dict_id
+        decompressor = self._context(self.decompressors, dict_id, compress=False) if dict_id else None
+        if decompressor is None and dict_id:
+            raise LookupError(f"缺少 zstd 字典 {dict_id}")
+        return (decompressor or self.plain_decompressor).decompress(data)
+
+    def _context(self, cache: OrderedDict, dict_id: int, compress: bool):
+        """按 dict_id 取压缩/解压上下文（LRU，未命中时从磁盘加载字典）"""
+        context = cache.get(dict_id)
+        if context is not None:
+            cache.move_to_end(dict_id)
+            return context
+        path = self.directory / f"{dict_id:08x}.zdict"
+        if not path.exists():
+            return None
+        dictionary = self.zstd.ZstdCompressionDict(path.read_bytes())
+        if compress:
+            context = self.zstd.ZstdCompressor(level=self.config.compression_level, dict_data=dictionary)
+        else:
+            context = self.zstd.ZstdDecompressor(dict_data=dictionary)
+        cache[dict_id] = context
+        if len(cache) > self.config.dictionary_cache:
+            cache.popitem(last=False)
+        return context
+
+    def _sample(self, host: str, body: bytes):
+        samples = self.samples.get(host)
+        if samples is None:
+            samples = self.samples[host] = []
+            if len(self.samples) > self.config.dictionary_training_hosts:
+                self.samples.popitem(last=False)
+        samples.append(body[:self.SAMPLE_BYTES])
+        if len(samples) >= self.config.dictionary_samples:
+            del self.samples[host]
+            self.host_dictionaries[host] = 0  # 训练中：期间不再积累样本
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self._train, host, samples)
+            self.training.add(future)
+            future.add_done_callback(functools.partial(self._trained, host))
+
+    def _trained(self, host: str, future: asyncio.Future):
+        """训练完成（事件循环内）：该主机的新条目改用字典压缩"""
+        self.training.discard(future)
+        if future.cancelled() or future.exception() is not None or not future.result():
+            return
+        self.host_dictionaries[host] = future.result()
+        self.stats['dictionaries'] += 1
+        self.metrics['dictionaries'].inc()
+
+    def _train(self, host: str, samples: List[bytes]) -> int:
+        """后台线程：训练字典并持久化，返回 dict_id（失败返回 0）"""
+        try:
+            dictionary = self.zstd.train_dictionary(self.config.dictionary_bytes, samples)
+        except self.zstd.ZstdError as e:
+            logger.debug(f"字典训练失败 {host}: {str(e)}")
+            return 0
+        dict_id = dictionary.dict_id()
+        path = self.directory / f"{dict_id:08x}.zdict"
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_bytes(dictionary.as_bytes())
+        os.replace(tmp_path, path)
+        with open(self.directory / "hosts.tsv", 'a', encoding='utf-8') as f:
+            f.write(f"{host}\t{dict_id}\n")
+        return dict_id
+
+    async def close(self):
+        if self.training:
+            await asyncio.gather(*self.training, return_exceptions=True)
+        self.executor.shutdown()
+
+
+class MemoryCache:
+    """内存LRU缓存（按字节预算淘汰）"""
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl: int = 3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.entries: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def sizeof(value: Any) -> int:
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return len(value)
+        if isinstance(value, CachedResponse):
+            return value.stored_bytes + 256
+        if isinstance(value, str):
+            return len(value.encode('utf-8'))
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if time.monotonic() > expires_at:
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any):
+        size = self.sizeof(value) + len(key)
+        if key in self.entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, time.monotonic() + self.ttl, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, _, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+
+    def _remove(self, key: str):
+        _, _, size = self.entries.pop(key)
+        self.size -= size
+
+
+class DiskCache:
+    """日志结构磁盘缓存
+
+    值追加写入大段文件；索引 key摘要 -> (段号, 偏移, 长度, 过期时间) 常驻内存，
+    同时追加到 index.log 持久化，重启后回放恢复。已封存的段通过 mmap 读取。
+    所有文件操作都在专用单线程执行器中完成，不阻塞事件循环；索引回放也推迟到首次
+    访问时在该执行器中进行，构造本身不做IO。被覆盖或过期的记录由后台压缩回收。
+    """
+    INDEX_RECORD = struct.Struct('<16sIQId')
+
+    def __init__(self,
+                 cache_dir: str = "./cache",
+                 ttl: int = 3600,
+                 segment_bytes: int = 256 * 1024 * 1024,
+                 compact_ratio: float = 0.5):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.segment_bytes = segment_bytes
+        self.compact_ratio = compact_ratio
+        self.loaded = False
+        self.keydir: Dict[bytes, tuple] = {}
+        self.live_bytes: Dict[int, int] = {}
+        self.sealed: Dict[int, int] = {}
+        self.maps: Dict[int, mmap.mmap] = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-cache")
+        self._compaction: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.cache_dir / f"{segment:08d}.seg"
+
+    def _load(self):
+        """回放 index.log 重建内存索引；新写入总是进入一个新段"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for path in self.cache_dir.glob("*.seg"):
+            segment = int(path.stem)
+            self.sealed[segment] = path.stat().st_size
+            self.live_bytes[segment] = 0
+
+        index_path = self.cache_dir / "index.log"
+        if index_path.exists():
+            data = index_path.read_bytes()
+            usable = len(data) - len(data) % self.INDEX_RECORD.size
+            now = time.time()
+            for digest, *entry in self.INDEX_RECORD.iter_unpack(data[:usable]):
+                if entry[0] in self.sealed:
+                    self._put_entry(digest, tuple(entry), persist=False)
+            for digest, entry in list(self.keydir.items()):
+                if entry[3] < now:
+                    self._drop(digest)
+
+        self.active = max(self.sealed, default=0) + 1
+        self.active_size = 0
+        self.live_bytes[self.active] = 0
+        self.active_fd = os.open(self._segment_path(self.active), os.O_RDWR | os.O_CREAT | os.O_APPEND)
+        self.index_fd = os.open(index_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        self.loaded = True
+
+    def _put_entry(self, digest: bytes, entry: tuple, persist: bool = True):
+        previous = self.keydir.get(digest)
+        if previous is not None:
+            self.live_bytes[previous[0]] -= previous[2]
+        self.keydir[digest] = entry
+        self.live_bytes[entry[0]] += entry[2]
+        if persist:
+            os.write(self.index_fd, self.INDEX_RECORD.pack(digest, *entry))
+
+    def _drop(self, digest: bytes):
+        segment, _, length, _ = self.keydir.pop(digest)
+        self.live_bytes[segment] -= length
+
+    def _read(self, segment: int, offset: int, length: int) -> bytes:
+        if segment == self.active:
+            return os.pread(self.active_fd, length, offset)
+        view = self.maps.get(segment)
+        if view is None:
+            with open(self._segment_path(segment), 'rb') as f:
+                view = self.maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return view[offset:offset + length]
+
+    def _append(self, blob: bytes) -> tuple:
+        """追加写入当前段，返回 (段号, 偏移, 是否封存了旧段)"""
+        rotated = False
+        if self.active_size and self.active_size + len(blob) > self.segment_bytes:
+            os.close(self.active_fd)
+            self.sealed[self.active] = self.active_size
+            self.active += 1
+            self.active_size = 0
+            self.live_bytes[self.active] = 0
+            self.active_fd = os.open(self._segment_path(self.active), os.O_RDWR | os.O_CREAT | os.O_APPEND)
+            rotated = True
+        offset = self.active_size
+        os.write(self.active_fd, blob)
+        self.active_size += len(blob)
+        return self.active, offset, rotated
+
+    def _get_sync(self, key: str) -> Optional[Any]:
+        if not self.loaded:
+            self._load()
+        digest = self._digest(key)
+        entry = self.keydir.get(digest)
+        if entry is None:
+            return None
+        segment, offset, length, expires_at = entry
+        if time.time() > expires_at:
+            self._drop(digest)
+            return None
+        try:
+            return pickle.loads(self._read(segment, offset, length))
+        except (pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"缓存损坏: {e}")
+            self._drop(digest)
+            return None
+
+    def _set_sync(self, key: str, value: Any) -> bool:
+        if not self.loaded:
+            self._load()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        segment, offset, rotated = self._append(blob)
+        self._put_entry(self._digest(key), (segment, offset, len(blob), time.time() + self.ttl))
+        return rotated
+
+    async def get(self, key: str) -> Optional[Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._get_sync, key)
+
+    async def set(self, key: str, value: Any):
+        loop = asyncio.get_running_loop()
+        rotated = await loop.run_in_executor(self.executor, self._set_sync, key, value)
+        if rotated and (self._compaction is None or self._compaction.done()):
+            self._compaction = loop.create_task(self.compact())
+
+    async def compact(self):
+        """后台压缩：逐段迁移有效记录，删除有效数据低于阈值的已封存段"""
+        loop = asyncio.get_running_loop()
+        candidates = await loop.run_in_executor(self.executor, self._compaction_candidates)
+        for segment in candidates:
+            await loop.run_in_executor(self.executor, self._compact_segment, segment)
+        if candidates:
+            await loop.run_in_executor(self.executor, self._rewrite_index)
+
+    def _compaction_candidates(self) -> List[int]:
+        return [
+            segment for segment, size in self.sealed.items()
+            if self.live_bytes[segment] <= size * self.compact_ratio
+        ]
+
+    def _compact_segment(self, segment: int):
+        now = time.time()
+        moving = [
+            (digest, entry) for digest, entry in self.keydir.items()
+            if entry[0] == segment
+        ]
+        for digest, (_, offset, length, expires_at) in moving:
+            if expires_at < now:
+                self._drop(digest)
+                continue
+            target, target_offset, _ = self._append(self._read(segment, offset, length))
+            self._put_entry(digest, (target, target_offset, length, expires_at))
+        view = self.maps.pop(segment, None)
+        if view is not None:
+            view.close()
+        self._segment_path(segment).unlink(missing_ok=True)
+        del self.sealed[segment]
+        del self.live_bytes[segment]
+
+    def _rewrite_index(self):
+        """用当前内存索引重写 index.log，丢弃已失效的索引记录"""
+        tmp_path = self.cache_dir / "index.log.tmp"
+        with open(tmp_path, 'wb') as f:
+            for digest, entry in self.keydir.items():
+                f.write(self.INDEX_RECORD.pack(digest, *entry))
+        os.close(self.index_fd)
+        os.replace(tmp_path, self.cache_dir / "index.log")
+        self.index_fd = os.open(self.cache_dir / "index.log", os.O_WRONLY | os.O_APPEND)
+
+    async def close(self):
+        if self._compaction is not None:
+            await self._compaction
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._close_sync)
+        self.executor.shutdown()
+
+    def _close_sync(self):
+        if not self.loaded:
+            return
+        for view in self.maps.values():
+            view.close()
+        self.maps.clear()
+        os.close(self.active_fd)
+        os.close(self.index_fd)
+
+
+class RedisCache:
+    """Redis缓存实现
+
+    使用 redis.asyncio 客户端和阻塞式连接池；batch_window 时间窗内到达的
+    并发 get/set 合并成一次流水线请求（多条 SETEX + 一条 MGET）。没有在途批次时，
+    单独到达的请求立即发出，低并发下不必白等时间窗。
+    可通过 client 参数注入进程内替身用于测试。redis 包只在构造时才导入：
+    未配置 Redis 层的任务不承担它的导入开销。
+    """
+    def __init__(self,
+                 host: str = "localhost",
+                 port: int = 6379,
+                 password: str = None,
+                 db: int = 0,
+                 ttl: int = 3600,
+                 max_connections: int = 32,
+                 batch_window: float = 0.002,
+                 max_batch: int = 512,
+                 client: Any = None):
+        if client is None:
+            import redis.asyncio
+            # 连接池按需建连：构造时不连接 Redis
+            client = redis.asyncio.Redis(
+                connection_pool=redis.asyncio.BlockingConnectionPool(
+                    host=host,
+                    port=port,
+                    password=password,
+                    db=db,
+                    max_connections=max_connections
+                )
+            )
+        self.client = client
+        self.ttl = ttl
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._pending_gets: Dict[str, asyncio.Future] = {}
+        self._pending_sets: Dict[str, bytes] = {}
+        self._set_waiters: List[asyncio.Future] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushes = set()
+        self._in_flight = 0  # 尚未返回结果的批次数
+
+    async def get(self, key: str) -> Optional[Any]:
+        future = self._pending_gets.get(key)
+        if future is None:
+            future = self._pending_gets[key] = asyncio.get_running_loop().create_future()
+            self._schedule_flush()
+        data = await future
+        return pickle.loads(data) if data else None
+
+    async def set(self, key: str, value: Any):
+        future = asyncio.get_running_loop().create_future()
+        self._pending_sets[key] = pickle.dumps(value)
+        self._set_waiters.append(future)
+        self._schedule_flush()
+        await future
+
+    def _schedule_flush(self):
+        pending = len(self._pending_gets) + len(self._pending_sets)
+        if pending == 1 and not self._in_flight and self._flush_handle is None:
+            self._start_flush()
+        elif pending >= self.max_batch:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+            self._start_flush()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.batch_window, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        task = asyncio.get_running_loop().create_task(self._flush(
+            self._pending_gets, self._pending_sets, self._set_waiters
+        ))
+        self._pending_gets, self._pending_sets, self._set_waiters = {}, {}, []
+        self._in_flight += 1
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, gets: Dict[str, asyncio.Future], sets: Dict[str, bytes],
+                     waiters: List[asyncio.Future]):
+        """一次往返：先写后读，保证同一批次内读到最新写入
+
+        任何失败（连接错误、注入客户端抛出的其他异常、关闭时被取消）都按未命中处理，
+        批次内的等待者总会得到结果。
+        """
+        keys = list(gets)
+        values = [None] * len(keys)
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key, data in sets.items():
+                    pipe.setex(key, self.ttl, data)
+                if keys:
+                    pipe.mget(keys)
+                results = await pipe.execute()
+            if keys:
+                values = results[-1]
+        except Exception as e:
+            logger.warning(f"Redis错误: {e}")
+        finally:
+            self._in_flight -= 1
+            for future, value in zip(gets.values(), values):
+                if not future.done():
+                    future.set_result(value)
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._start_flush()
+        await asyncio.gather(*self._flushes)
+        await self.client.aclose()
+
+# ----------------------
+# 数据处理模块
+# ----------------------
+
+class HybridParser:
+    """规则解析器（标题 + 正则规则提取）"""
+
+    TITLE_PATTERN = re.compile(r'<title[^>]*>(.*?)</title>', re.I | re.S)
+
+    def __init__(self, rules: Optional[Dict[str, str]] = None):
+        self.rules = {
+            name: re.compile(pattern, re.S)
+            for name, pattern in (rules or {}).items()
+        }
+
+    def parse(self, content: bytes) -> Dict:
+        text = content.decode('utf-8', errors='ignore')
+        title = self.TITLE_PATTERN.search(text)
+        data = {'title': title.group(1).strip() if title else None}
+        for name, pattern in self.rules.items():
+            data[name] = pattern.findall(text)
+        return data
+
+
+class LinkExtractor:
+    """链接提取与URL规范化
+
+    直接在原始字节上匹配 <a>/<area> 标签的 href 属性，不构建DOM（<link> 样式表、图标及
+    data-href 之类的属性不算链接）。链接按页面URL补全（页面声明了 <base href> 时以它为准）后规范化：
+    协议和主机小写、去默认端口、查询参数排序、去片段，再按域名范围过滤。
+    规范化结果按 (基准, href) 做LRU缓存，相对路径的基准取页面所在目录，
+    站内导航这类在许多页面重复出现的链接只解析一次。锚文本取标签后到下一个标签前的
+    原始字节（至多 256 字节），供 URL 评分使用；解码留给评分，多数链接在去重时就已丢弃。
+    """
+
+    HREF_PATTERN = re.compile(
+        rb'''<(?:a|area)\s(?:[^>]*?\s)?href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))(?:[^>]*>([^<]{0,256}))?''',
+        re.I
+    )
+    BASE_PATTERN = re.compile(rb'''<base\s(?:[^>]*?\s)?href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''', re.I)
+    SCHEME_PATTERN = re.compile(rb'[a-zA-Z][a-zA-Z0-9+.-]*:')
+    DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+    def __init__(self, config: LinkConfig):
+        self.config = config
+        self.domains = tuple(domain.lower().strip('.') for domain in config.allowed_domains)
+        self._build_cache()
+
+    def _build_cache(self):
+        self._resolve_cached = functools.lru_cache(maxsize=self.config.cache_size)(self._resolve)
+
+    def __getstate__(self):
+        # 传给解析进程时不携带缓存，各进程各自建立
+        state = self.__dict__.copy()
+        del state['_resolve_cached']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_cache()
+
+    def extract(self, base_url: str, content: bytes) -> List[Tuple[str, bytes]]:
+        """提取页面内范围内的链接，返回去重后的 (规范URL, 锚文本字节)（保持出现顺序）"""
+        declared = self.BASE_PATTERN.search(content)
+        if declared is not None:
+            href = (declared.group(1) or declared.group(2) or declared.group(3)).decode('utf-8', errors='ignore')
+            href = html.unescape(href).strip()
+            if href:
+                base_url = urljoin(base_url, href)
+        parts = urlsplit(base_url)
+        origin = f'{parts.scheme}://{parts.netloc}'
+        page = origin + (parts.path or '/')
+        directory = page[:page.rfind('/') + 1]
+        resolve = self._resolve_cached
+        scheme = self.SCHEME_PATTERN
+
+        links, seen, seen_raw = [], set(), set()
+        for groups in self.HREF_PATTERN.findall(content):
+            raw = groups[0] or groups[1] or groups[2]
+            if raw in seen_raw:
+                continue
+            seen_raw.add(raw)
+            # 基准只影响缓存共享范围：站内绝对路径按站点、完整URL全局共享
+            if raw[:1] == b'/':
+                base = origin
+            elif raw[:1] == b'?':
+                base = page
+            elif b':' in raw and scheme.match(raw):
+                base = ''
+            else:
+                base = directory
+            link = resolve(base, raw)
+            if link is not None and link not in seen:
+                seen.add(link)
+                links.append((link, groups[3]))
+        return links
+
+    def canonicalize(self, url: str) -> Optional[str]:
+        """规范化绝对URL；不支持的协议或超出范围时返回 None"""
+        return self._canonicalize(url)
+
+    def _resolve(self, base: str, raw: bytes) -> Optional[str]:
+        href = raw.decode('utf-8', errors='ignore').strip()
+        if '&' in href:
+            href = html.unescape(href)
+        if not href or href[0] == '#':
+            return None  # 页内锚点指向页面自身
+        return self._canonicalize(urljoin(base, href) if base else href)
+
+    def _canonicalize(self, url: str) -> Optional[str]:
+        try:
+            parts = urlsplit(url)
+            scheme = parts.scheme.lower()
+            port = parts.port
+        except ValueError:
+            return None  # 端口或IPv6地址非法
+        host = parts.hostname
+        if scheme not in self.DEFAULT_PORTS or not host or not self.in_scope(host):
+            return None
+
+        netloc = f'[{host}]' if ':' in host else host
+        if port is not None and port != self.DEFAULT_PORTS[scheme]:
+            netloc = f'{netloc}:{port}'
+        userinfo = parts.netloc.rpartition('@')[0]
+        if userinfo:
+            netloc = f'{userinfo}@{netloc}'
+        query = '&'.join(sorted(param for param in parts.query.split('&') if param))
+        return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+    def in_scope(self, host: str) -> bool:
+        if not self.domains:
+            return True
+        return any(host == domain or host.endswith('.' + domain) for domain in self.domains)
+
+
+_SIMHASH_TAGS = re.compile(rb'<(script|style)\b.*?</\1\s*>|<[^>]*>', re.S | re.I)
+_SIMHASH_CJK = re.compile(r'([\u3040-\u30ff\u3400-\u9fff])')
+_SIMHASH_BITS = [bytes((value >> bit) & 1 for value in range(256)) for bit in range(8)]
+_SIMHASH_MIX = 0x9E3779B97F4A7C15
+_UINT64 = (1 << 64) - 1
+
+
+def simhash(content: bytes, config: DedupConfig) -> Optional[int]:
+    """正文的 64 位 SimHash；词数不足 min_tokens 时返回 None
+
+    去掉标签、脚本和样式后按空白切词（中日文按单字）。只以 crc32 落在前 1/sample 的词为
+    起点，取 shingle 个连续词作为特征，选取只取决于内容，近重复页面选中的特征基本相同。
+    特征哈希是把后续词接续进 crc32（跨进程稳定，可在解析进程池中计算），再乘常数扩展
+    到 64 位；全程用 map/compress 在C层迭代，各位的多数票按字节列用 translate/count 统计。
+    """
+    text = _SIMHASH_TAGS.sub(b' ', content).lower()
+    if not text.isascii():
+        text = _SIMHASH_CJK.sub(r' \1 ', text.decode('utf-8', 'ignore')).encode('utf-8')
+    words = text.split()
+    count = len(words) - config.shingle + 1
+    if len(words) < config.min_tokens or count <= 0:
+        return None
+    hashes = list(map(zlib.crc32, words[:count]))
+    selected = list(map(((1 << 32) // config.sample).__gt__, hashes))
+    features = compress(hashes, selected)
+    for offset in range(1, config.shingle):
+        features = map(zlib.crc32, compress(words[offset:], selected), features)
+    digests = array.array('Q', map(_UINT64.__and__, map(_SIMHASH_MIX.__mul__, features)))
+    if not digests:
+        return None
+    if sys.byteorder == 'big':
+        digests.byteswap()
+    data = digests.tobytes()
+    half = len(digests) // 2
+    fingerprint = 0
+    for column in range(8):
+        values = data[column::8]
+        for bit, table in enumerate(_SIMHASH_BITS):
+            if values.translate(table).count(1) > half:
+                fingerprint |= 1 << (column * 8 + bit)
+    return fingerprint
+
+
+class NearDuplicateIndex:
+    """近重复页面索引：64 位 SimHash 指纹 + 分段 LSH
+
+    指纹均分为 max_distance + 1 段，按鸽巢原理，距离不超过 max_distance 的两个指纹
+    至少有一段完全相同，因此只需比较同段桶里的候选。每段的桶是 array('Q')。
+    容量分两代：当前代存满 capacity/2 后整体降为旧代，原旧代丢弃，内存有上界。
+    指纹只在内存中，不随检查点保存。
+    """
+
+    metrics = {
+        'checks': Counter('dedup_checks', '近重复检测结果', ['result']),
+        'latency': Histogram('dedup_lookup_latency', '指纹索引查询与插入耗时',
+                             buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001)),
+        'fingerprints': Gauge('dedup_fingerprints', '索引中的指纹数')
+    }
+
+    def __init__(self, config: DedupConfig):
+        self.config = config
+        self.bands = config.max_distance + 1
+        self.band_bits = 64 // self.bands
+        self.band_mask = (1 << self.band_bits) - 1
+        self.generations = [self._new_tables(), self._new_tables()]  # [当前代, 旧代]
+        self.counts = [0, 0]
+        self.stats = {'checked': 0, 'duplicates': 0, 'skipped': 0}
+
+    def _new_tables(self) -> List[Dict[int, array.array]]:
+        return [{} for _ in range(self.bands)]
+
+    def find(self, fingerprint: int) -> Optional[int]:
+        """返回索引中与之距离不超过 max_distance 的一个指纹（没有则 None）"""
+        limit = self.config.max_distance
+        for tables in self.generations:
+            for band, table in enumerate(tables):
+                bucket = table.get((fingerprint >> (band * self.band_bits)) & self.band_mask)
+                if bucket is None:
+                    continue
+                for other in bucket:
+                    if (fingerprint ^ other).bit_count() <= limit:
+                        return other
+        return None
+
+    def add(self, fingerprint: int):
+        if self.counts[0] >= self.config.capacity // 2:
+            self.generations = [self._new_tables(), self.generations[0]]
+            self.counts = [0, self.counts[0]]
+        for band, table in enumerate(self.generations[0]):
+            key = (fingerprint >> (band * self.band_bits)) & self.band_mask
+            bucket = table.get(key)
+            if bucket is None:
+                bucket = table[key] = array.array('Q')
+            bucket.append(fingerprint)
+        self.counts[0] += 1
+
+    def check(self, fingerprint: Optional[int]) -> bool:
+        """指纹是否与已见页面近重复；不重复时加入索引（None 表示正文太短，不判断）"""
+        started = time.perf_counter()
+        self.stats['checked'] += 1
+        if fingerprint is None:
+            self.stats['skipped'] += 1
+            result = 'skipped'
+        elif self.find(fingerprint) is not None:
+            self.stats['duplicates'] += 1
+            result = 'duplicate'
+        else:
+            self.add(fingerprint)
+            result = 'unique'
+        self.metrics['checks'].labels(result).inc()
+        self.metrics['latency'].observe(time.perf_counter() - started)
+        return result == 'duplicate'
+
+    def __len__(self) -> int:
+        return sum(self.counts)
+
+    @property
+    def nbytes(self) -> int:
+        """桶数组占用的字节数（不含字典本身）"""
+        return sum(
+            bucket.buffer_info()[1] * bucket.itemsize
+            for tables in self.generations for table in tables for bucket in table.values()
+        )
+
+
+_stage_parser = None
+_stage_links = None
+
+
+def _init_parse_worker(parser, links):
+    global _stage_parser, _stage_links
+    _stage_parser = parser
+    _stage_links = links
+
+
+def _parse_page(url: str, content: bytes, parse: bool) -> Tuple[Optional[Dict], List[Tuple[str, bytes]]]:
+    """子进程内执行：解析页面并提取链接"""
+    parsed = _stage_parser.parse(content) if parse else None
+    return parsed, _stage_links.extract(url, content)
+
+
+class ParseStage:
+    """解析阶段：页面正文交给进程池解析，避免CPU密集的解析阻塞事件循环
+
+    在途任务数受 max_in_flight 限制，窗口占满时调用方等待，形成背压。
+    """
+
+    def __init__(self, parser: Any, links: LinkExtractor, config: ParseConfig):
+        self.window = asyncio.Semaphore(config.max_in_flight)
+        self.in_flight = 0
+        self.executor = None
+        if config.workers:
+            self.executor = ProcessPoolExecutor(
+                max_workers=config.workers,
+                initializer=_init_parse_worker,
+                initargs=(parser, links)
+            )
+        else:
+            _init_parse_worker(parser, links)
+
+    async def parse(self, url: str, content: bytes,
+                    parse: bool = True) -> Tuple[Optional[Dict], List[Tuple[str, bytes]]]:
+        """返回 (解析结果, 页面链接)；parse=False 时只提取链接"""
+        return await self._run(_parse_page, url, content, parse)
+
+    async def fingerprint(self, content: bytes, config: DedupConfig) -> Optional[int]:
+        """计算正文的 SimHash（同样在进程池中执行）"""
+        return await self._run(simhash, content, config)
+
+    async def _run(self, func: Callable, *args):
+        if self.executor is None:
+            return func(*args)
+        self.in_flight += 1
+        try:
+            async with self.window:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+
+class DataPipeline:
+    """数据处理管道
+
+    文本处理器作用于条目中所有字符串字段及字符串列表（url 除外）。批量模式把
+    整个微批次的文本用分隔符拼成一列，每个文本处理器只对这一列执行一次，
+    再按分隔符拆回原位。
+    """
+
+    SEPARATOR = '\x00'
+    TAG_PATTERN = re.compile(r'<[^>\x00]*>')
+    SPACE_PATTERN = re.compile(r'\s+')
+    EDGE_PATTERN = re.compile(r' ?\x00 ?')
+
+    def __init__(self, config: SpiderConfig):
+        self.processors = [
+            self._clean_html,
+            self._normalize_text,
+            self._validate_data
+        ]
+        self.text_processors = [
+            self._strip_tags,
+            self._collapse_space
+        ]
+
+    async def process(self, data: Dict) -> Optional[Dict]:
+        """数据加工流水线（未通过校验时返回 None）"""
+        try:
+            for processor in self.processors:
+                data = await processor(data)
+                if data is None:
+                    return None
+            return data
+        except Exception as e:
+            logger.error(f"数据处理失败: {str(e)}")
+            raise
+
+    async def process_batch(self, items: List[Dict]) -> List[Dict]:
+        """批量加工：文本处理器对整个微批次只执行一次，返回通过校验的条目"""
+        try:
+            self._map_text(items, self.text_processors)
+            return [item for item in items if self._is_valid(item)]
+        except Exception as e:
+            logger.error(f"批量数据处理失败: {str(e)}")
+            raise
+
+    @classmethod
+    def _strip_tags(cls, text: str) -> str:
+        return html.unescape(cls.TAG_PATTERN.sub('', text))
+
+    @classmethod
+    def _collapse_space(cls, text: str) -> str:
+        text = cls.SPACE_PATTERN.sub(' ', unicodedata.normalize('NFKC', text))
+        return cls.EDGE_PATTERN.sub(cls.SEPARATOR, text).strip(' ')
+
+    def _map_text(self, items: List[Dict], funcs: List[Callable[[str], str]]) -> List[Dict]:
+        """把所有条目的文本字段拼成一列，依次执行 funcs 后写回"""
+        slots, pieces, total = [], [], 0
+        for item in items:
+            for key, value in item.items():
+                if key == 'url':
+                    continue
+                if isinstance(value, str):
+                    slots.append((item, key, 0))
+                    pieces.append(value)
+                    total += 1
+                elif isinstance(value, list) and value:
+                    try:
+                        pieces.append(self.SEPARATOR.join(value))
+                    except TypeError:
+                        continue  # 非纯字符串列表不处理
+                    slots.append((item, key, len(value)))
+                    total += len(value)
+        if not slots:
+            return items
+
+        column = self.SEPARATOR.join(pieces)
+        if column.count(self.SEPARATOR) != total - 1:
+            # 文本本身含分隔符：退化为逐条处理
+            for item, key, size in slots:
+                values = [item[key]] if not size else item[key]
+                for func in funcs:
+                    values = [func(value) for value in values]
+                item[key] = values if size else values[0]
+            return items
+
+        for func in funcs:
+            column = func(column)
+        results = column.split(self.SEPARATOR)
+        position = 0
+        for item, key, size in slots:
+            if size:
+                item[key] = results[position:position + size]
+                position += size
+            else:
+                item[key] = results[position]
+                position += 1
+        return items
+
+    @staticmethod
+    def _is_valid(data: Dict) -> bool:
+        url = data.get('url')
+        return isinstance(url, str) and url.startswith(('http://', 'https://'))
+
+    async def _clean_html(self, data: Dict) -> Dict:
+        # HTML清洗：去标签、反转义实体
+        return self._map_text([data], [self._strip_tags])[0]
+
+    async def _normalize_text(self, data: Dict) -> Dict:
+        # 文本规范化：NFKC + 合并空白
+        return self._map_text([data], [self._collapse_space])[0]
+
+    async def _validate_data(self, data: Dict) -> Optional[Dict]:
+        # 数据验证
+        return data if self._is_valid(data) else None
+
+
+class BatchCollector:
+    """微批次收集器：攒满 size 条或首条到达后 interval 秒，整批交给 handler
+
+    批次在后台处理，至多 max_batches 个同时进行；未处理完的条目（含攒批中的）达到
+    capacity 条时 add 等待，把下游的慢速传导给上游。
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], Awaitable[Any]], config: BatchConfig,
+                 capacity: int, max_batches: int):
+        self.handler = handler
+        self.size = config.size
+        self.interval = config.interval
+        self.capacity = capacity
+        self.max_batches = max_batches
+        self.items: List[Any] = []
+        self.held = 0  # 已收下但未处理完的条目数
+        self.batches = 0  # 正在处理的批次数
+        self._slots = asyncio.Semaphore(max_batches)
+        self._room = asyncio.Event()
+        self._room.set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._pending = set()
+        self.stats = {'items': 0, 'waits': 0, 'wait_seconds': 0.0, 'max_held': 0}
+
+    async def add(self, item: Any):
+        if self.held >= self.capacity:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            self.stats['waits'] += 1
+            while self.held >= self.capacity:
+                self._room.clear()
+                await self._room.wait()
+            self.stats['wait_seconds'] += loop.time() - started
+        self.items.append(item)
+        self.held += 1
+        self.stats['items'] += 1
+        self.stats['max_held'] = max(self.stats['max_held'], self.held)
+        if len(self.items) >= self.size:
+            self._flush_in_background()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.interval, self._flush_in_background)
+
+    def _flush_in_background(self):
+        task = asyncio.ensure_future(self.flush())
+        self._pending.add(task)
+        task.add_done_callback(self._flushed)
+
+    def _flushed(self, task: asyncio.Task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"批次处理失败: {str(task.exception())}")
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.items:
+            return
+        items, self.items = self.items, []
+        try:
+            async with self._slots:
+                self.batches += 1
+                try:
+                    await self.handler(items)
+                finally:
+                    self.batches -= 1
+        finally:
+            self.held -= len(items)
+            self._room.set()
+
+    async def drain(self):
+        """交出当前批次并等待所有在途批次处理完"""
+        await self.flush()
+        await asyncio.gather(*self._pending)
+
+    async def close(self):
+        await self.drain()
+
+
+# ----------------------
+# 存储模块
+# ----------------------
+
+class BatchPipeline:
+    """批量存储管道基类
+
+    条目先编码进内存批次，按行数或字节数攒满后交给专用写线程落盘，
+    写入期间继续攒下一批；上一批未写完时新批次等待。等待中的批次各占收集器的一个处理名额
+    （backpressure.store_batches），内存中至多 store_batches + 1 个批次。
+    写入失败的批次记录日志后丢弃，不影响之后的批次；关闭时无论之前是否失败都收尾写入器
+    （Parquet 文件尾随之写出，已落盘的行组仍可读）。
+    """
+
+    metrics = {
+        'rows': Counter('storage_rows', '已落盘条目数', ['pipeline']),
+        'failed': Counter('storage_failed_rows', '写入失败而丢弃的条目数', ['pipeline']),
+        'flush_latency': Histogram('storage_flush_latency', '批次落盘耗时', ['pipeline'])
+    }
+
+    def __init__(self, name: str, config: StorageConfig, suffix: str):
+        self.config = config
+        self.directory = Path(config.directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / f"{name}{suffix}"
+        self.kind = type(self).__name__
+        self.batch: List[Any] = []
+        self.batch_bytes = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.kind)
+        self._flushing: Optional[asyncio.Future] = None
+        self.stats = {'rows': 0, 'flushes': 0, 'flush_seconds': 0.0, 'max_flush_seconds': 0.0,
+                      'failed_rows': 0}
+
+    def _encode(self, item: Dict) -> Tuple[Any, int]:
+        """条目 -> (批次内记录, 估算字节数)"""
+        raise NotImplementedError
+
+    def _write_batch(self, batch: List[Any]):
+        """在写线程中落盘一个批次"""
+        raise NotImplementedError
+
+    def _close_writer(self):
+        pass
+
+    async def write(self, item: Dict):
+        record, size = self._encode(item)
+        self.batch.append(record)
+        self.batch_bytes += size
+        if len(self.batch) >= self.config.batch_rows or self.batch_bytes >= self.config.batch_bytes:
+            await self.flush()
+
+    async def flush(self):
+        if not self.batch:
+            return
+        batch, self.batch, self.batch_bytes = self.batch, [], 0
+        # 多个批次同时写入时，醒来后可能已有别的批次接着在写
+        while self._flushing is not None and not self._flushing.done():
+            await self._flushing
+        self._flushing = asyncio.ensure_future(self._flush(batch))
+
+    async def _flush(self, batch: List[Any]):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            await loop.run_in_executor(self.executor, self._write_batch, batch)
+        except Exception as e:
+            logger.error(f"{self.kind} 批次写入失败，丢弃 {len(batch)} 条: {str(e)}")
+            self.stats['failed_rows'] += len(batch)
+            self.metrics['failed'].labels(self.kind).inc(len(batch))
+            return
+        elapsed = time.perf_counter() - started
+        self.stats['rows'] += len(batch)
+        self.stats['flushes'] += 1
+        self.stats['flush_seconds'] += elapsed
+        self.stats['max_flush_seconds'] = max(self.stats['max_flush_seconds'], elapsed)
+        self.metrics['rows'].labels(self.kind).inc(len(batch))
+        self.metrics['flush_latency'].labels(self.kind).observe(elapsed)
+
+    async def drain(self):
+        """写出当前批次并等待写线程完成"""
+        await self.flush()
+        if self._flushing is not None:
+            await self._flushing
+
+    async def close(self):
+        try:
+            await self.drain()
+        finally:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._close_writer)
+            self.executor.shutdown()
+
+
+class JsonPipeline(BatchPipeline):
+    """JSON Lines 存储：条目即时序列化，批次整体一次写入"""
+
+    def __init__(self, name: str, config: StorageConfig):
+        super().__init__(name, config, ".jsonl")
+        self.file = None
+
+    def _encode(self, item: Dict) -> Tuple[bytes, int]:
+        line = json.dumps(item, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+        return line, len(line)
+
+    def _write_batch(self, batch: List[bytes]):
+        if self.file is None:
+            self.file = open(self.path, 'ab', buffering=4 * 1024 * 1024)
+        self.file.write(b''.join(batch))
+        self.file.flush()
+
+    def _close_writer(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class ParquetPipeline(BatchPipeline):
+    """Parquet 存储：每个批次写成一个行组（依赖 pyarrow）
+
+    表结构由第一个批次推断，之后的批次按该结构对齐（缺失字段为空）。批次带来新字段或
+    更具体的类型时（常见于第一个批次某列全为空、被推断为 null 类型），按合并后的结构
+    另起一个分卷文件（<名称>.partN.parquet）继续写，不丢弃批次；各分卷可作为同一数据集读取。
+    """
+
+    def __init__(self, name: str, config: StorageConfig):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("ParquetPipeline 需要 pyarrow：pip install pyarrow") from e
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        super().__init__(name, config, f"-{int(time.time())}.parquet")
+        self.writer = None
+        self.parts = 0
+
+    def _encode(self, item: Dict) -> Tuple[Dict, int]:
+        return item, sum(len(str(value)) for value in item.values()) + 8 * len(item)
+
+    def _write_batch(self, batch: List[Dict]):
+        table = self.pa.Table.from_pylist(batch)
+        if self.writer is None:
+            self._open_writer(table.schema)
+        elif not table.schema.equals(self.writer.schema):
+            try:
+                schema = self.pa.unify_schemas([self.writer.schema, table.schema], promote_options='permissive')
+            except (self.pa.ArrowInvalid, self.pa.ArrowTypeError):
+                schema = table.schema  # 类型无法合并：新分卷按本批次的结构
+            if not schema.equals(self.writer.schema):
+                self.writer.close()
+                self._open_writer(schema)
+            table = self.pa.Table.from_pylist(batch, schema=schema)
+        self.writer.write_table(table, row_group_size=len(batch))
+
+    def _open_writer(self, schema):
+        path = self.path
+        if self.parts:
+            path = path.with_name(f"{path.stem}.part{self.parts}{path.suffix}")
+            logger.info(f"Parquet 表结构变化，改写分卷 {path.name}")
+        self.parts += 1
+        self.writer = self.pq.ParquetWriter(path, schema, compression='zstd')
+
+    def _close_writer(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+# ----------------------
+# 核心引擎
+# ----------------------
+
+class SpiderEngine:
+    """爬虫核心引擎
+
+    各阶段耗时记入 stage_latency（robots/fetch/dedup/parse/pipeline/store），排队等待与礼貌延迟由
+    HostScheduler 记录；队列深度、忙碌工作协程等 Gauge 由 LoopMonitor 周期刷新。
+    配置了站点地图时由 SitemapReader 在后台播种，与抓取同时进行。
+    解析结果经容量有限的 BatchCollector 交给加工与存储，下游变慢时工作协程在交付处等待；
+    MemoryWatermark 在内存超过高水位时暂停取新URL；各阶段占用率记入 stage_occupancy。
+    """
+
+    metrics = {
+        'processed': Counter('items_processed', '已处理项目数'),
+        'unchanged': Counter('pages_unchanged', '未变化页面数', ['source']),
+        'stage': Histogram('stage_latency', '各处理阶段耗时', ['stage']),
+        'queued': Gauge('frontier_queued_urls', 'URL队列中待抓取的URL数'),
+        'level_queued': Gauge('frontier_level_urls', '各优先级档待抓取的URL数', ['level']),
+        'busy': Gauge('workers_busy', '正在处理URL的工作协程数'),
+        'parse_in_flight': Gauge('parse_in_flight', '等待或正在进程池中解析的页面数'),
+        'collecting': Gauge('collector_pending_items', '微批次中等待加工的条目数'),
+        'limit': Gauge('concurrency_limit', '当前全局在途请求上限（AIMD）'),
+        'occupancy': Gauge('stage_occupancy', '各阶段在途数占容量的比例', ['stage'])
+    }
+
+    def __init__(self, container: 'Container', shard: Optional['ShardContext'] = None):
+        self.container = container
+        self.config = SpiderConfig.parse_obj(container.config())
+        checkpoint = self.config.checkpoint.enabled
+        if checkpoint and shard is not None:
+            logger.warning("分片模式不支持断点续爬，已忽略 checkpoint 配置")
+            checkpoint = False
+        self.frontier = UrlFrontier(
+            self.config.frontier,
+            checkpoint=checkpoint,
+            resume=checkpoint and Checkpointer.exists(self.config.checkpoint),
+            scorer=container.scorer()
+        )
+        self.scheduler = HostScheduler(
+            self.frontier, self.config.scheduler, self.config.request.delay_range, self.config.concurrency,
+            robots=self.config.robots.enabled
+        )
+        adaptive = self.config.concurrency
+        self.limiter = AdaptiveLimiter(
+            self.config.request.concurrency,
+            AimdController(adaptive, adaptive.initial, adaptive.minimum, self.config.request.concurrency)
+            if adaptive.adaptive else None
+        )
+        self.checkpointer = Checkpointer(
+            self.config.checkpoint, self.frontier, self.scheduler, self._drain_outputs
+        ) if checkpoint else None
+        self.router = ShardRouter(shard, self.scheduler) if shard is not None else None
+        self.cache = TieredCache(self.config.cache) if self.config.cache_enabled else None
+        self.robots = None
+        if self.config.robots.enabled:
+            self.robots = RobotsCache(
+                self.config.robots, self.config.request.user_agent, self.cache, self.scheduler.set_crawl_delay
+            )
+            self.frontier.admit = self.robots.permits
+        self.links = container.link_extractor()
+        sitemaps = self.config.sitemaps
+        self.sitemaps = SitemapReader(
+            sitemaps, self.config.request, self.links.canonicalize, container.resolver()
+        ) if sitemaps.urls or sitemaps.from_robots else None
+        self.dedup = NearDuplicateIndex(self.config.dedup) if self.config.dedup.enabled else None
+        self.parse_stage = ParseStage(container.parser(), self.links, self.config.parse)
+        self.storages = [container.storage(name) for name in self.config.pipelines]
+        backpressure = self.config.backpressure
+        self.collector = BatchCollector(
+            self._process_batch, self.config.batch, backpressure.collect_capacity, backpressure.store_batches
+        )
+        self.memory = MemoryWatermark(backpressure) if backpressure.memory_high is not None else None
+        self.busy = 0
+        self.fetching = 0
+        self.monitor = LoopMonitor(self.config.monitor_interval)
+        self.monitor.add_sampler(self._sample_gauges)
+        if self.memory is not None:
+            self.monitor.add_sampler(self._sample_memory)
+
+    async def run(self):
+        """启动爬虫"""
+        if self.config.metrics_port is not None:
+            start_http_server(self.config.metrics_port + (self.router.index if self.router else 0))
+        resumed = self.checkpointer is not None and self.checkpointer.restore()
+        # 无论正常结束、出错还是被取消（Ctrl-C），都停止后台任务并关闭各存储，已写数据可读
+        try:
+            async with self.container.http_client() as client:
+                workers: List[asyncio.Task] = []
+                ingest = None
+                completed = False
+                try:
+                    if not resumed:
+                        await self._seed_urls()
+                    if self.sitemaps is not None:
+                        # 站点地图在后台读取：先登记一个未完成任务，读完之前抓取不会结束
+                        (self.frontier if self.router is None else self.router).reserve()
+                        ingest = asyncio.create_task(self._ingest_sitemaps(client))
+                    self.monitor.start()
+                    self.scheduler.start()
+                    if self.router is not None:
+                        self.router.start()
+                    if self.checkpointer is not None:
+                        self.checkpointer.start()
+                    workers = [
+                        asyncio.create_task(self._worker(client))
+                        for _ in range(self.config.request.concurrency)
+                    ]
+                    if self.router is not None:
+                        await self.router.join()
+                    else:
+                        await self.scheduler.join()
+                    if ingest is not None:
+                        await ingest
+                        self.sitemaps.commit()
+                    completed = True
+                finally:
+                    tasks = workers + ([ingest] if ingest is not None else [])
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    if self.checkpointer is not None:
+                        await self.checkpointer.close(completed=completed)
+                    await self.scheduler.close()
+                    if self.router is not None:
+                        await self.router.close()
+                    await self.monitor.close()
+        finally:
+            self.frontier.close()
+            self.parse_stage.close()
+            try:
+                await self.collector.close()
+            finally:
+                for storage in self.storages:
+                    try:
+                        await storage.close()
+                    except Exception as e:
+                        logger.error(f"关闭存储失败 {type(storage).__name__}: {str(e)}")
+                if self.cache is not None:
+                    await self.cache.close()
+
+    async def _ingest_sitemaps(self, client: AsyncHttpClient):
+        """读取站点地图播种，结束时释放 run() 中登记的未完成任务
+
+        分片模式下每个分片只读取主机归自己的站点地图（robots.txt 中声明的按起始URL
+        所在站点归属），其中的URL照常按主机转交所属分片。
+        """
+        try:
+            config = self.config.sitemaps
+            owns = self.router.owns if self.router is not None else lambda url: True
+            roots = [url for url in config.urls if owns(url)]
+            if config.from_robots:
+                if self.robots is None:
+                    logger.warning("robots 未启用，忽略 sitemaps.from_robots")
+                else:
+                    origins = dict.fromkeys(
+                        RobotsCache.split(self.links.canonicalize(url) or url)[0] for url in self.config.start_urls
+                    )
+                    for origin in origins:
+                        if owns(origin + '/'):
+                            roots.extend((await self.robots.rules(client, origin)).sitemaps)
+            await self.sitemaps.read(roots, self._seed_batch, lambda: len(self.frontier))
+        except Exception as e:
+            logger.error(f"站点地图读取失败: {str(e)}")
+        finally:
+            (self.frontier if self.router is None else self.router).task_done()
+
+    def _seed_batch(self, urls: List[str]):
+        """站点地图中的一批URL入队（分片模式下按主机转交所属分片）"""
+        add = self.scheduler.add if self.router is None else self.router.add
+        for url in urls:
+            add(url)
+
+    async def _seed_urls(self):
+        """写入起始URL"""
+        for url in self.config.start_urls:
+            url = self.links.canonicalize(url) or url
+            if self.router is None:
+                self.scheduler.add(url)
+            elif self.router.owns(url):
+                self.router.add(url)
+
+    async def _worker(self, client: AsyncHttpClient):
+        """工作协程：先占用全局并发名额，再取URL处理（内存超过高水位时先等待回落）"""
+        while True:
+            if self.memory is not None:
+                await self.memory.wait()
+            await self.limiter.acquire()
+            try:
+                url = await self.scheduler.get()
+                self.busy += 1
+                parked = None
+                requested = True
+                try:
+                    requested = await self._process_url(client, url)
+                except HostUnavailable as e:
+                    parked = e.retry_in
+                except Exception as e:
+                    logger.error(f"处理失败 {url}: {str(e)}")
+                finally:
+                    self.busy -= 1
+                    if parked is not None:
+                        # 主机熔断：URL暂存回主机队列，工作协程转去处理其他主机
+                        self.scheduler.park(url, parked)
+                    else:
+                        self.scheduler.release(url, delay=requested)
+                        if self.router is not None:
+                            self.router.task_done()
+            finally:
+                self.limiter.release()
+
+    @staticmethod
+    def _make_consumer(parser, streamed: Dict) -> Callable:
+        """支持逐块解析的解析器：边下载边解析，结果写入 streamed['parsed']"""
+        async def consume(chunks: StreamingBody):
+            streamed['parsed'] = await parser.parse_stream(chunks)
+        return consume
+
+    async def _process_url(self, client: AsyncHttpClient, url: str) -> bool:
+        """处理单个URL，返回是否向该主机发出了请求（新鲜缓存命中时不发请求）"""
+        parser = self.container.parser()
+        streamed = {}
+        consumer = self._make_consumer(parser, streamed) if hasattr(parser, 'parse_stream') else None
+
+        loop = asyncio.get_running_loop()
+        if self.robots is not None:
+            started = loop.time()
+            allowed = await self.robots.allowed(client, url)
+            self.metrics['stage'].labels('robots').observe(loop.time() - started)
+            if not allowed:
+                return False
+        started = loop.time()
+        self.fetching += 1
+        try:
+            response, unchanged, outcome = await self._fetch_content(client, url, consumer)
+        finally:
+            self.fetching -= 1
+        fetched = loop.time()
+        requested = outcome in ('ok', 'failed', 'rejected')
+        if outcome in ('ok', 'failed'):
+            # 只有真正完成的网络请求反映主机状况：新鲜缓存命中、熔断短路不发请求，
+            # 因类型或大小被放弃的响应（CSS、PDF、超大正文）主机并无异常，其耗时也不完整
+            self.scheduler.observe(url, fetched - started, outcome == 'ok')
+            self.limiter.observe(fetched - started, outcome == 'ok')
+        self.metrics['stage'].labels('fetch').observe(fetched - started)
+        if response is None or not response.size or not 200 <= response.status < 300:
+            # 404/403/410 等错误页不去重、不解析、不入库，也不从中发现链接
+            return requested
+        body = response.body
+        if not unchanged and self.dedup is not None:
+            fingerprint = await self.parse_stage.fingerprint(body, self.dedup.config)
+            self.metrics['stage'].labels('dedup').observe(loop.time() - fetched)
+            if self.dedup.check(fingerprint):
+                # 近重复页面（会话参数、跟踪参数、打印版等）：跳过解析、加工与存储
+                return requested
+            fetched = loop.time()
+
+        # 未变化的页面此前已解析入库，只需继续发现链接
+        parse = not unchanged and 'parsed' not in streamed
+        parsed, links = await self.parse_stage.parse(url, body, parse)
+        self.metrics['stage'].labels('parse').observe(loop.time() - fetched)
+        if not unchanged:
+            if not parse:
+                parsed = streamed['parsed']
+            await self.collector.add({'url': url, **parsed})
+        await self._discover_links(links, self.scheduler.depth(url) + 1)
+        return requested
+
+    async def _drain_outputs(self):
+        """等待已收集的条目全部加工并落盘（检查点调用）"""
+        await self.collector.drain()
+        for storage in self.storages:
+            await storage.drain()
+
+    async def _process_batch(self, items: List[Dict]):
+        """微批次：批量加工后逐条写入存储管道（管道内部再攒批落盘）"""
+        started = time.perf_counter()
+        processed = await self.container.pipeline().process_batch(items)
+        transformed = time.perf_counter()
+        for item in processed:
+            await self._store_data(item)
+        self.metrics['stage'].labels('pipeline').observe(transformed - started)
+        self.metrics['stage'].labels('store').observe(time.perf_counter() - transformed)
+        self.metrics['processed'].inc(len(processed))
+
+    def _sample_gauges(self):
+        self.metrics['queued'].set(len(self.frontier))
+        for level, size in enumerate(self.frontier.level_sizes()):
+            self.metrics['level_queued'].labels(str(level)).set(size)
+        self.metrics['busy'].set(self.busy)
+        self.metrics['parse_in_flight'].set(self.parse_stage.in_flight)
+        self.metrics['collecting'].set(len(self.collector.items))
+        self.metrics['limit'].set(self.limiter.limit)
+        # 占用率接近 1 的阶段即瓶颈：下游占满时上游工作协程在交付处等待
+        occupancy = self.metrics['occupancy']
+        occupancy.labels('fetch').set(self.fetching / max(1, self.limiter.limit))
+        occupancy.labels('parse').set(self.parse_stage.in_flight / self.config.parse.max_in_flight)
+        occupancy.labels('collect').set(self.collector.held / self.collector.capacity)
+        occupancy.labels('store').set(self.collector.batches / self.collector.max_batches)
+        if self.dedup is not None:
+            self.dedup.metrics['fingerprints'].set(len(self.dedup))
+
+    def _sample_memory(self):
+        self.memory.sample(drained=self.busy == 0 and self.collector.held == 0)
+
+    async def _fetch_content(self, client: AsyncHttpClient, url: str,
+                             consumer: Optional[Callable] = None
+                             ) -> Tuple[Optional[CachedResponse], bool, Optional[str]]:
+        """先查分级缓存：新鲜条目直接返回，过期条目发条件请求重新验证
+
+        返回 (响应, 内容是否未变化, 请求结果)；请求结果见 AsyncHttpClient.request，
+        未发请求（新鲜缓存命中）时为 None。
+        """
+        if self.cache is None:
+            response, outcome = await client.request(url, consumer=consumer)
+            return response, False, outcome
+        cached = await self.cache.get(url)
+        if not isinstance(cached, CachedResponse):
+            cached = None
+        elif cached.fresh:
+            self.metrics['unchanged'].labels('fresh').inc()
+            return cached, True, None
+
+        response, outcome = await client.request(url, cached, consumer)
+        if response is None:
+            return None, False, outcome
+        unchanged = response is cached
+        if unchanged:
+            self.metrics['unchanged'].labels('not_modified').inc()
+        if response.cacheable and 200 <= response.status < 300:
+            await self.cache.set(url, response)
+        return response, unchanged, outcome
+
+    async def _store_data(self, data: Dict):
+        """写入所有已配置的存储管道（管道内部攒批落盘）"""
+        for storage in self.storages:
+            await storage.write(data)
+
+    async def _discover_links(self, links: List[Tuple[str, bytes]], depth: int):
+        """新发现的链接写入队列（队列负责去重和评分）；分片模式下外部主机的链接转交所属分片"""
+        add = self.router.add if self.router is not None else self.scheduler.add
+        for link, anchor in links:
+            add(link, depth, anchor)
+
+
+# ----------------------
+# URL队列（Frontier）
+# ----------------------
+
+def url_digest(url: str) -> bytes:
+    """URL的稳定128位摘要（跨进程、跨重启一致）"""
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+
+
+class BloomFilter:
+    """布隆过滤器（位数组 + 双重哈希）"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, digest: bytes) -> bool:
+        """写入摘要，返回写入前是否可能已存在"""
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        bits = self.bits
+        present = True
+        for i in range(self.hash_count):
+            pos = (h1 + i * h2) % self.size
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                present = False
+        return present
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+
+class SeenUrlStore:
+    """已见URL的精确集合（SQLite持久化摘要，批量写入）
+
+    autocommit=False 时写入留在未提交事务中，只在检查点 commit()，
+    进程崩溃后数据库自动回滚到最近一次检查点。
+    """
+
+    def __init__(self, path: Path, batch_size: int = 10_000, autocommit: bool = True):
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen (digest BLOB PRIMARY KEY) WITHOUT ROWID"
+        )
+        self.batch_size = batch_size
+        self.autocommit = autocommit
+        self.held = False
+        self.pending = set()
+
+    def add_new(self, digest: bytes):
+        """写入确定未见过的摘要（布隆过滤器未命中）"""
+        self.pending.add(digest)
+        if len(self.pending) >= self.batch_size and not self.held:
+            self.flush()
+
+    def add(self, digest: bytes) -> bool:
+        """精确检查并写入，返回是否为新URL"""
+        if digest in self.pending:
+            return False
+        row = self.conn.execute(
+            "SELECT 1 FROM seen WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row:
+            return False
+        self.add_new(digest)
+        return True
+
+    def flush(self):
+        if self.pending:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen VALUES (?)",
+                ((d,) for d in self.pending)
+            )
+            if self.autocommit:
+                self.conn.commit()
+            self.pending.clear()
+
+    def hold(self):
+        """检查点截取时刻：缓冲写入当前事务，之后暂停写库直到 commit()/release()"""
+        self.flush()
+        self.held = True
+
+    def commit(self):
+        self.conn.commit()
+        self.held = False
+
+    def release(self):
+        self.held = False
+
+    def close(self):
+        if self.autocommit:
+            self.flush()
+        self.conn.close()
+
+
+class SegmentLog:
+    """追加写分段日志，保存内存热区放不下的待抓取URL
+
+    retain=True 时读完的段不立即删除，留到检查点的读位置越过它之后再由 release() 回收。
+    """
+
+    def __init__(self, directory: Path, segment_bytes: int, retain: bool = False):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.write_index = 0
+        self.written = 0
+        self.writer = None
+        self.read_index = 0
+        self.reader = None
+        self.pending = 0
+        self.retain = retain
+        self.retired: List[int] = []
+
+    def _segment_path(self, index: int) -> Path:
+        return self.directory / f"segment-{index:08d}.log"
+
+    def append(self, url: str):
+        if self.writer is None:
+            self.writer = open(self._segment_path(self.write_index), 'ab')
+        line = url.encode('utf-8') + b'\n'
+        self.writer.write(line)
+        self.written += len(line)
+        self.pending += 1
+        if self.written >= self.segment_bytes:
+            self.writer.close()
+            self.writer = None
+            self.write_index += 1
+            self.written = 0
+
+    def read_batch(self, limit: int) -> List[str]:
+        """按写入顺序读出至多 limit 条URL，读完的段文件立即删除"""
+        if self.writer is not None:
+            self.writer.flush()
+        urls = []
+        while len(urls) < limit and self.pending:
+            if self.reader is None:
+                self.reader = open(self._segment_path(self.read_index), 'rb')
+            line = self.reader.readline()
+            if line:
+                urls.append(line[:-1].decode('utf-8'))
+                self.pending -= 1
+            elif self.read_index < self.write_index:
+                self._drop_read_segment()
+                self.read_index += 1
+            else:
+                break
+        if not self.pending and self.reader is not None:
+            # 读写指针重合：回收当前段，从新段重新开始
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+            self._drop_read_segment()
+            self.write_index += 1
+            self.read_index = self.write_index
+            self.written = 0
+        return urls
+
+    def _drop_read_segment(self):
+        self.reader.close()
+        self.reader = None
+        if self.retain:
+            self.retired.append(self.read_index)
+        else:
+            self._segment_path(self.read_index).unlink(missing_ok=True)
+
+    def position(self) -> Dict[str, int]:
+        """当前读写位置（写入端先刷盘）"""
+        if self.writer is not None:
+            self.writer.flush()
+        return {
+            'read_index': self.read_index,
+            'read_offset': self.reader.tell() if self.reader is not None else 0,
+            'write_index': self.write_index,
+            'written': self.written,
+            'pending': self.pending,
+        }
+
+    def restore(self, position: Dict[str, int]):
+        """回到检查点记录的位置：截掉之后追加的内容，删除范围外的段"""
+        self.read_index = position['read_index']
+        self.write_index = position['write_index']
+        self.written = position['written']
+        self.pending = position['pending']
+        for path in self.directory.glob("segment-*.log"):
+            index = int(path.stem.split('-')[1])
+            if index < self.read_index or index > self.write_index:
+                path.unlink()
+        write_path = self._segment_path(self.write_index)
+        if write_path.exists():
+            with open(write_path, 'r+b') as f:
+                f.truncate(self.written)
+        if self.pending:
+            self.reader = open(self._segment_path(self.read_index), 'rb')
+            self.reader.seek(position['read_offset'])
+
+    def release(self, before: int):
+        """删除编号早于 before 的已读段"""
+        for index in self.retired:
+            if index < before:
+                self._segment_path(index).unlink(missing_ok=True)
+        self.retired = [index for index in self.retired if index >= before]
+
+    def close(self):
+        for handle in (self.reader, self.writer):
+            if handle is not None:
+                handle.close()
+
+
+class UrlScorer:
+    """URL优先级评分：链接深度、URL模式、锚文本关键词与主机配额
+
+    score() 只对去重后的新URL调用一次，返回 0~1 的分数。需要其他策略时实现同名方法，
+    通过 Container.scorer 覆盖注入。主机计数只在内存中，断点续爬后重新累计。
+    """
+
+    def __init__(self, config: ScoringConfig):
+        self.config = config
+        self.patterns = [(re.compile(pattern), weight) for pattern, weight in config.patterns.items()]
+        self.keywords = [(keyword.lower(), weight) for keyword, weight in config.anchor_keywords.items()]
+        self.hosts: Dict[str, int] = defaultdict(int)
+
+    def score(self, url: str, anchor: bytes = b'', depth: int = 0) -> float:
+        if self.config.host_budget:
+            host = HostScheduler.host_of(url)
+            self.hosts[host] += 1
+            if self.hosts[host] > self.config.host_budget:
+                return 0.0
+        score = 1.0 - depth * self.config.depth_penalty
+        for pattern, weight in self.patterns:
+            if pattern.search(url):
+                score += weight
+        if anchor and self.keywords:
+            text = self.anchor_text(anchor).lower()
+            for keyword, weight in self.keywords:
+                if keyword in text:
+                    score += weight
+        return min(max(score, 0.0), 1.0)
+
+    @staticmethod
+    def anchor_text(raw: bytes) -> str:
+        """锚文本字节解码，合并空白并还原实体"""
+        text = b' '.join(raw.split()).decode('utf-8', errors='ignore')
+        return html.unescape(text) if '&' in text else text
+
+
+class UrlFrontier:
+    """去重优先级URL队列：分档有界内存热区 + 各档磁盘溢出日志 + 布隆过滤器/SQLite两级去重
+
+    新URL经 scorer 评分后落入 priority_levels 个档位之一，每档内先进先出；出队从最高档
+    开始找第一个非空档，入队与出队都是 O(档数)。热区各档共享 hot_capacity，某档一旦
+    溢出，该档后续URL也写入它自己的日志（每行 "深度 URL"）。热区的URL与链接深度分存
+    两个 deque，出队时交还深度，供子链接评分。
+    接口与 asyncio.Queue 保持一致（get/task_done/join），add() 负责去重入队。
+    checkpoint=True 时已见集合只在检查点提交、已读日志段延后删除；resume=True 时保留
+    目录，由 restore() 回到检查点状态。
+    """
+
+    def __init__(self, config: FrontierConfig, checkpoint: bool = False, resume: bool = False,
+                 scorer: Optional[UrlScorer] = None):
+        self.directory = Path(config.directory)
+        if not resume:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.hot_capacity = config.hot_capacity
+        self.levels = config.priority_levels
+        self.scorer = scorer if self.levels > 1 else None
+        self.hot = [deque() for _ in range(self.levels)]
+        self.depths = [deque() for _ in range(self.levels)]
+        self.hot_count = 0
+        self._order = range(self.levels - 1, -1, -1)  # 出队顺序：高档优先
+        self.bloom = BloomFilter(config.expected_urls, config.false_positive_rate)
+        self.seen = SeenUrlStore(self.directory / "seen.sqlite3", autocommit=not checkpoint)
+        self.logs = [
+            SegmentLog(self.directory / "segments" / f"level-{level}", config.segment_bytes, retain=checkpoint)
+            for level in range(self.levels)
+        ]
+        self.stats = {'added': 0, 'duplicates': 0, 'spilled': 0, 'rejected': 0}
+        self.level_added = [0] * self.levels
+        self.admit: Optional[Callable[[str], bool]] = None  # 去重之后的准入检查（如已知的 robots 规则）
+        self._unfinished = 0
+        self.ready = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def __len__(self) -> int:
+        return self.hot_count + sum(log.pending for log in self.logs)
+
+    def level_sizes(self) -> List[int]:
+        return [len(hot) + log.pending for hot, log in zip(self.hot, self.logs)]
+
+    def add(self, url: str, depth: int = 0, anchor: bytes = b'') -> bool:
+        """去重、准入、评分后入队，返回是否入队"""
+        digest = url_digest(url)
+        if not self.bloom.add(digest):
+            self.seen.add_new(digest)
+        elif not self.seen.add(digest):
+            self.stats['duplicates'] += 1
+            return False
+        if self.admit is not None and not self.admit(url):
+            # 仍记为已见：同一URL不再重复检查
+            self.stats['rejected'] += 1
+            return False
+
+        level = self.levels - 1
+        if self.scorer is not None:
+            level = min(level, int(self.scorer.score(url, anchor, depth) * self.levels))
+        self._push(level, url, depth)
+        self.level_added[level] += 1
+        self.stats['added'] += 1
+        self._unfinished += 1
+        self._finished.clear()
+        return True
+
+    def unpop(self, entries: List[Tuple[str, int, int]]):
+        """把刚取出但暂不处理的条目 (URL, 深度, 档位) 按原顺序放回各档队首（不去重、不计新任务）"""
+        for url, depth, level in reversed(entries):
+            self.hot[level].appendleft(url)
+            self.depths[level].appendleft(depth)
+        self.hot_count += len(entries)
+        if entries:
+            self.ready.set()
+
+    def _push(self, level: int, url: str, depth: int):
+        # 一旦发生溢出，该档后续URL也写入日志，保证档内先进先出
+        log = self.logs[level]
+        if log.pending or self.hot_count >= self.hot_capacity:
+            log.append(f'{depth} {url}')
+            self.stats['spilled'] += 1
+        else:
+            self.hot[level].append(url)
+            self.depths[level].append(depth)
+            self.hot_count += 1
+        self.ready.set()
+
+    def pop(self) -> Optional[Tuple[str, int, int]]:
+        """非阻塞取出最高档的队首条目 (URL, 深度, 档位)，队列为空时返回 None"""
+        for level in self._order:
+            hot = self.hot[level]
+            if hot or (self.logs[level].pending and self._refill(level)):
+                self.hot_count -= 1
+                return hot.popleft(), self.depths[level].popleft(), level
+        return None
+
+    def _refill(self, level: int) -> bool:
+        # 热区被低档占满时也至少读回一批，超出上限有界
+        batch = self.logs[level].read_batch(
+            max(self.hot_capacity - self.hot_count, self.hot_capacity // self.levels, 1)
+        )
+        hot, depths = self.hot[level], self.depths[level]
+        for line in batch:
+            depth, _, url = line.partition(' ')
+            hot.append(url)
+            depths.append(int(depth))
+        self.hot_count += len(batch)
+        return bool(batch)
+
+    async def get(self) -> Tuple[str, int, int]:
+        while True:
+            entry = self.pop()
+            if entry is not None:
+                return entry
+            self.ready.clear()
+            await self.ready.wait()
+
+    def reserve(self):
+        """登记一个不在队列中的未完成任务（如后台播种），结束时同样调用 task_done()"""
+        self._unfinished += 1
+        self._finished.clear()
+
+    def task_done(self):
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+    def snapshot(self) -> Tuple[Dict, bytes, List[Tuple[int, List[int], List[str]]]]:
+        """同步截取 (元数据, 布隆位数组副本, 各档热区 (档位, 深度, URL))；已见集合暂停写库直到 commit()"""
+        self.seen.hold()
+        state = {
+            'logs': [log.position() for log in self.logs],
+            'stats': dict(self.stats),
+            'level_added': list(self.level_added),
+        }
+        hot = [(level, list(self.depths[level]), list(urls)) for level, urls in enumerate(self.hot) if urls]
+        return state, bytes(self.bloom.bits), hot
+
+    def commit(self, state: Dict):
+        """快照已落盘：提交已见集合，回收检查点之前读完的日志段"""
+        self.seen.commit()
+        for log, position in zip(self.logs, state['logs']):
+            log.release(position['read_index'])
+
+    def abort(self):
+        """快照未能落盘：恢复写库，本次写入并入下一个检查点"""
+        self.seen.release()
+
+    def restore(self, state: Dict, bits: bytes, entries: List[str]):
+        """从检查点恢复；entries 为快照时热区及已取出未处理完的条目（"档位 深度 URL"）"""
+        if len(bits) != len(self.bloom.bits):
+            raise ValueError("布隆过滤器参数与检查点不一致")
+        if len(state['logs']) != self.levels:
+            raise ValueError("优先级档数与检查点不一致")
+        self.bloom.bits[:] = bits
+        for log, position in zip(self.logs, state['logs']):
+            log.restore(position)
+        self.stats.update(state['stats'])
+        self.level_added = state['level_added']
+        for entry in entries:
+            level, depth, url = entry.split(' ', 2)
+            self.hot[int(level)].append(url)
+            self.depths[int(level)].append(int(depth))
+        self.hot_count += len(entries)
+        self._unfinished = len(self)
+        if self._unfinished:
+            self._finished.clear()
+            self.ready.set()
+
+    def close(self):
+        self.seen.close()
+        for log in self.logs:
+            log.close()
+
+
+# ----------------------
+# 辅助模块
+# ----------------------
+
+class AimdController:
+    """AIMD 并发上限
+
+    请求成功且延迟正常时上限加 increase/上限（约每轮在途请求加 increase）；错误率
+    滑动平均超过 error_tolerance，或短期平均延迟超过长期基线 latency_tolerance 倍时
+    乘以 decrease。两次减小至少间隔一个短期平均延迟，同一波拥塞只惩罚一次；因延迟
+    减小后基线直接取当前延迟，延迟整体上移（如对端变慢）只付出一次代价。
+    """
+    FAST = 0.3
+    SLOW = 0.02
+    ERROR_SMOOTHING = 0.05
+    __slots__ = ('limit', 'minimum', 'maximum', 'increase', 'decrease', 'latency_tolerance',
+                 'error_tolerance', 'short', 'long', 'error_rate', 'last_decrease')
+
+    def __init__(self, config: AdaptiveConfig, initial: float, minimum: float, maximum: float):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(initial, minimum), maximum)
+        self.increase = config.increase
+        self.decrease = config.decrease
+        self.latency_tolerance = config.latency_tolerance
+        self.error_tolerance = config.error_tolerance
+        self.short = 0.0
+        self.long = 0.0
+        self.error_rate = 0.0
+        self.last_decrease = 0.0
+
+    def observe(self, latency: float, ok: bool, now: float):
+        self.error_rate += self.ERROR_SMOOTHING * ((not ok) - self.error_rate)
+        if ok:
+            if not self.long:
+                self.short = self.long = latency
+            else:
+                self.short += self.FAST * (latency - self.short)
+                self.long += self.SLOW * (latency - self.long)
+        slow = self.short > self.long * self.latency_tolerance
+        if slow or self.error_rate > self.error_tolerance:
+            if now - self.last_decrease >= self.short:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self.last_decrease = now
+                if slow:
+                    self.long = self.short
+        elif ok:
+            self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+
+
+class AdaptiveLimiter:
+    """全局在途请求上限（工作协程取URL前先占位）
+
+    controller 为 None 时上限固定为 maximum。释放名额时按先来后到唤醒等待者，
+    上限下调后超出的在途请求自然结束，不会被中断。
+    """
+
+    def __init__(self, maximum: int, controller: Optional[AimdController] = None):
+        self.maximum = maximum
+        self.controller = controller
+        self.in_use = 0
+        self.waiters: deque = deque()
+
+    @property
+    def limit(self) -> int:
+        if self.controller is None:
+            return self.maximum
+        return int(self.controller.limit)
+
+    async def acquire(self):
+        if self.in_use < self.limit and not self.waiters:
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # 名额已转交但等待者被取消
+            else:
+                self.waiters.remove(future)
+            raise
+
+    def release(self):
+        self.in_use -= 1
+        self._wake()
+
+    def observe(self, latency: float, ok: bool):
+        if self.controller is not None:
+            self.controller.observe(latency, ok, time.monotonic())
+            self._wake()
+
+    def _wake(self):
+        while self.waiters and self.in_use < self.limit:
+            future = self.waiters.popleft()
+            if not future.done():
+                self.in_use += 1
+                future.set_result(None)
+
+
+class HostState:
+    """单个主机的调度状态"""
+    __slots__ = ('queue', 'backlog', 'delay', 'floor', 'restricted', 'ready_at', 'eligible_at', 'scheduled', 'in_flight',
+                 'controller', 'latency', 'error_rate', 'requests', 'errors')
+
+    def __init__(self, delay: float, controller: Optional[AimdController] = None, restricted: bool = False):
+        self.queue = deque()
+        self.backlog = deque()  # 主机队列已满时从 frontier 取出的 (URL, 深度, 档位)，按序补入队列
+        self.delay = delay
+        self.floor = 0.0  # robots.txt 的 Crawl-delay：延迟下限，不受 delay_range 上限约束
+        self.restricted = restricted  # robots.txt 规则未到之前只放行一个请求
+        self.ready_at = 0.0
+        self.eligible_at = 0.0  # 最近一次有URL待发且在途未满的时刻
+        self.scheduled = False
+        self.in_flight: set = set()  # 在途URL
+        self.controller = controller  # 每主机 AIMD（上限为 1 时不创建）
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def limit(self) -> int:
+        return 1 if self.controller is None or self.restricted else int(self.controller.limit)
+
+    @property
+    def has_room(self) -> bool:
+        return len(self.in_flight) < self.limit
+
+
+class HostScheduler:
+    """按主机礼貌调度器
+
+    从 UrlFrontier 按优先级预取URL到各主机的有界队列，用 (就绪时间, 主机) 小根堆
+    选出下一个可访问的主机；同一主机的在途请求数受其上限约束（默认 1，配置
+    host_maximum > 1 时由每主机 AIMD 调整），相邻两次发出至少间隔该主机的
+    自适应延迟。延迟由错误率和延迟的指数滑动平均驱动，上下限取自
+    RequestConfig.delay_range；robots.txt 声明了 Crawl-delay 的主机以其为下限。
+    启用 robots 时，新主机在其规则加载前只放行一个请求，避免抢在 Crawl-delay 生效前并发。
+    """
+
+    SMOOTHING = 0.2
+
+    metrics = {
+        'hosts': Gauge('scheduler_hosts', '已知主机数'),
+        'buffered': Gauge('scheduler_buffered_urls', '调度器缓冲的URL数'),
+        'rate_limit_wait': Histogram('scheduler_rate_limit_wait', '主机礼貌延迟造成的等待'),
+        'queue_wait': Histogram('scheduler_queue_wait', 'URL就绪后等待空闲工作协程的时间'),
+        'parked': Counter('scheduler_parked', '因主机熔断放回队列的URL数'),
+    }
+
+    def __init__(self, frontier: UrlFrontier, config: SchedulerConfig, delay_range: tuple,
+                 adaptive: Optional[AdaptiveConfig] = None, robots: bool = False):
+        self.frontier = frontier
+        self.config = config
+        self.adaptive = adaptive
+        self.robots = robots
+        self.min_delay, self.max_delay = delay_range
+        self.hosts: Dict[str, HostState] = {}
+        self.heap = []
+        self.buffered = 0
+        self.backlogged = 0
+        self.entries: Dict[str, Tuple[int, int]] = {}  # 已预取未处理完的URL → (深度, 档位)
+        self.ready = asyncio.Queue(maxsize=1)
+        self._wakeup = asyncio.Event()
+        self._fill_stalled = False
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    def add(self, url: str, depth: int = 0, anchor: bytes = b'') -> bool:
+        """去重评分入队（委托 UrlFrontier），并唤醒调度协程"""
+        if not self.frontier.add(url, depth, anchor):
+            return False
+        self._fill_stalled = False
+        self._wakeup.set()
+        return True
+
+    def start(self):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    async def get(self) -> str:
+        """取出一个主机已就绪的URL"""
+        url, dispatched_at = await self.ready.get()
+        self.metrics['queue_wait'].observe(asyncio.get_running_loop().time() - dispatched_at)
+        return url
+
+    def depth(self, url: str) -> int:
+        """已取出URL的链接深度（处理完成前有效）"""
+        return self.entries.get(url, (0, 0))[0]
+
+    def _new_host(self, host: str) -> HostState:
+        controller = None
+        adaptive = self.adaptive
+        if adaptive is not None and adaptive.host_maximum > 1:
+            maximum = adaptive.host_maximum if adaptive.adaptive else 1
+            initial = 1 if adaptive.adaptive else adaptive.host_maximum
+            controller = AimdController(adaptive, initial, 1, max(maximum, initial))
+        state = self.hosts[host] = HostState(self.min_delay, controller, restricted=self.robots)
+        return state
+
+    def observe(self, url: str, latency: float, ok: bool):
+        """根据一次请求的结果调整该主机的延迟与在途上限"""
+        state = self.hosts[self.host_of(url)]
+        if state.controller is not None and self.adaptive.adaptive:
+            state.controller.observe(latency, ok, time.monotonic())
+        alpha = self.SMOOTHING
+        state.requests += 1
+        state.errors += not ok
+        state.error_rate += alpha * ((not ok) - state.error_rate)
+        if ok:
+            state.latency += alpha * (latency - state.latency)
+
+        if not ok or state.error_rate > self.config.error_threshold:
+            delay = state.delay * 1.5
+        else:
+            # 向 "延迟 × 系数" 收敛：慢主机拉长间隔，快主机逐步缩短
+            target = state.latency * self.config.latency_factor
+            if target < state.delay:
+                delay = max(target, state.delay * 0.9)
+            else:
+                delay = (state.delay + target) / 2
+        state.delay = min(max(delay, self.min_delay, state.floor), max(self.max_delay, state.floor))
+
+    def set_crawl_delay(self, host: str, delay: float):
+        """robots.txt 规则已加载：解除单请求限制；Crawl-delay 为此后相邻两次请求的最小间隔"""
+        state = self.hosts.get(host)
+        if state is None:
+            state = self._new_host(host)
+        state.restricted = False
+        state.floor = delay
+        state.delay = max(state.delay, delay)
+        # 规则加载时已有一个请求在途：其余请求与它至少间隔 Crawl-delay
+        state.ready_at = max(state.ready_at, asyncio.get_running_loop().time() + delay)
+
+    def park(self, url: str, retry_in: float):
+        """主机熔断：URL放回该主机队首，主机 retry_in 秒内不再调度（URL仍计为未完成）"""
+        host = self.host_of(url)
+        state = self.hosts[host]
+        state.in_flight.discard(url)
+        state.queue.appendleft(url)
+        self.buffered += 1
+        state.ready_at = max(state.ready_at, asyncio.get_running_loop().time() + retry_in)
+        if not state.scheduled:
+            self._schedule(host, state)
+        self.metrics['parked'].inc()
+        self._wakeup.set()
+
+    def release(self, url: str, delay: bool = True):
+        """请求处理完毕：按主机延迟设置下次就绪时间（delay=False 表示未发请求，不占礼貌间隔）"""
+        host = self.host_of(url)
+        state = self.hosts[host]
+        state.in_flight.discard(url)
+        self.entries.pop(url, None)
+        if delay:
+            state.ready_at = max(state.ready_at, asyncio.get_running_loop().time() + state.delay)
+        if state.queue and not state.scheduled and state.has_room:
+            self._schedule(host, state)
+        self.frontier.task_done()
+        self._fill_stalled = False
+        self._wakeup.set()
+
+    async def join(self):
+        await self.frontier.join()
+
+    def stats(self) -> Dict[str, Dict]:
+        """各主机的延迟、排队深度与错误率"""
+        return {
+            host: {
+                'delay': round(state.delay, 3),
+                'queued': len(state.queue) + len(state.backlog),
+                'in_flight': len(state.in_flight),
+                'limit': state.limit,
+                'latency': round(state.latency, 3),
+                'error_rate': round(state.error_rate, 3),
+                'requests': state.requests,
+                'errors': state.errors,
+            }
+            for host, state in self.hosts.items()
+        }
+
+    def snapshot(self) -> Tuple[Dict[str, Dict], List[Tuple[int, int, str]]]:
+        """同步截取各主机的限速状态，以及已从 frontier 取出但未处理完的 (档位, 深度, URL)"""
+        hosts, urls = {}, []
+        entries = self.entries
+        for host, state in self.hosts.items():
+            hosts[host] = {
+                'delay': state.delay,
+                'floor': state.floor,
+                'latency': state.latency,
+                'error_rate': state.error_rate,
+                'requests': state.requests,
+                'errors': state.errors,
+            }
+            for url in (*state.in_flight, *state.queue):
+                depth, level = entries.get(url, (0, 0))
+                urls.append((level, depth, url))
+            urls.extend((level, depth, url) for url, depth, level in state.backlog)
+        return hosts, urls
+
+    def restore(self, hosts: Dict[str, Dict]):
+        for host, values in hosts.items():
+            state = self._new_host(host)
+            state.delay = values['delay']
+            state.floor = values.get('floor', 0.0)
+            state.latency = values['latency']
+            state.error_rate = values['error_rate']
+            state.requests = values['requests']
+            state.errors = values['errors']
+
+    def _schedule(self, host: str, state: HostState):
+        state.scheduled = True
+        state.eligible_at = asyncio.get_running_loop().time()
+        heapq.heappush(self.heap, (state.ready_at, host))
+
+    def _enqueue(self, state: HostState, url: str, depth: int, level: int):
+        state.queue.append(url)
+        self.entries[url] = (depth, level)
+        self.buffered += 1
+
+    def _fill(self):
+        """从 frontier 按优先级预取URL到主机队列
+
+        主机队列已满的URL转入该主机的积压（内存，总数受 backlog_size 限制），本轮继续向后取，
+        排在大主机后面的其他主机不会被队首阻塞；该主机的队列腾出空间时先从积压按序补入。
+        积压已满时把刚取出的条目放回队首并结束本轮，不写回磁盘也不打乱档内顺序。
+        """
+        if self._fill_stalled:
+            return
+        progressed = False
+        for _ in range(min(self.config.fill_batch, len(self.frontier))):
+            if self.buffered >= self.config.buffer_size:
+                break
+            entry = self.frontier.pop()
+            if entry is None:
+                break
+            url, depth, level = entry
+            host = self.host_of(url)
+            state = self.hosts.get(host)
+            if state is None:
+                state = self._new_host(host)
+            if state.backlog or len(state.queue) >= self.config.host_queue_size:
+                if self.backlogged >= self.config.backlog_size:
+                    self.frontier.unpop([entry])
+                    break
+                state.backlog.append(entry)
+                self.backlogged += 1
+                progressed = True
+                continue
+            self._enqueue(state, url, depth, level)
+            progressed = True
+            if not state.scheduled and state.has_room:
+                self._schedule(host, state)
+        self._fill_stalled = not progressed
+        self.metrics['hosts'].set(len(self.hosts))
+        self.metrics['buffered'].set(self.buffered)
+
+    async def _dispatch(self):
+        """调度协程：把就绪主机的下一个URL交给空闲工作协程"""
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            self._fill()
+            while self.heap and self.heap[0][0] <= loop.time():
+                _, host = heapq.heappop(self.heap)
+                state = self.hosts[host]
+                now = loop.time()
+                if state.ready_at > now:
+                    # 入堆后就绪时间被推后（如其他在途请求结束）：按新时间重新入堆
+                    heapq.heappush(self.heap, (state.ready_at, host))
+                    continue
+                state.scheduled = False
+                url = state.queue.popleft()
+                state.in_flight.add(url)
+                self.buffered -= 1
+                if state.backlog:
+                    self.backlogged -= 1
+                    self._enqueue(state, *state.backlog.popleft())
+                self.metrics['rate_limit_wait'].observe(max(0.0, state.ready_at - state.eligible_at))
+                if state.queue and state.has_room:
+                    # 还能并发：下一个请求与本次至少间隔主机延迟
+                    state.ready_at = now + state.delay
+                    self._schedule(host, state)
+                await self.ready.put((url, now))
+            timeout = self.heap[0][0] - loop.time() if self.heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class LoopMonitor:
+    """事件循环延迟采样器
+
+    每 interval 秒醒来一次，实际唤醒时刻与预期之差即事件循环延迟：解析等CPU密集工作
+    或同步IO占住事件循环时随之升高。每次醒来顺带调用注册的采样函数刷新队列深度等 Gauge，
+    这些指标因此不必在热路径上逐次更新。
+    """
+    metrics = {
+        'lag': Histogram('event_loop_lag', '事件循环调度延迟',
+                         buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5)),
+        'lag_last': Gauge('event_loop_lag_last', '最近一次采样的事件循环延迟')
+    }
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samplers: List[Callable[[], Any]] = []
+        self.stats = {'samples': 0, 'max_lag': 0.0, 'total_lag': 0.0}
+        self._task: Optional[asyncio.Task] = None
+
+    def add_sampler(self, sampler: Callable[[], Any]):
+        self.samplers.append(sampler)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.stats['samples'] += 1
+            self.stats['total_lag'] += lag
+            self.stats['max_lag'] = max(self.stats['max_lag'], lag)
+            self.metrics['lag'].observe(lag)
+            self.metrics['lag_last'].set(lag)
+            for sampler in self.samplers:
+                sampler()
+
+
+class MemoryWatermark:
+    """内存高水位检测：常驻内存（RSS）超过 high 时暂停，回落到 low 以下时恢复
+
+    由 LoopMonitor 周期调用 sample()，工作协程取URL前调用 wait()。Python 释放的内存
+    未必归还操作系统，RSS 可能一直停在 low 之上，因此下游报告已排空时同样恢复。
+    RSS 读自 /proc/self/statm，没有该文件的平台上不做检测。
+    """
+    metrics = {
+        'rss': Gauge('process_rss_bytes', '进程常驻内存（背压采样）'),
+        'paused': Gauge('fetch_paused', '抓取是否因内存高水位暂停'),
+        'pauses': Counter('fetch_pauses', '抓取因内存高水位暂停的次数')
+    }
+
+    def __init__(self, config: BackpressureConfig):
+        self.high = config.memory_high
+        self.low = config.memory_low or int(config.memory_high * 0.85)
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self.enabled = self.rss() is not None
+        if not self.enabled:
+            logger.warning("无法读取进程常驻内存，已忽略 backpressure.memory_high")
+        self.paused_at: Optional[float] = None
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self.stats = {'pauses': 0, 'paused_seconds': 0.0, 'max_rss': 0}
+
+    def rss(self) -> Optional[int]:
+        try:
+            with open('/proc/self/statm', 'rb') as f:
+                return int(f.read().split()[1]) * self.page_size
+        except (OSError, ValueError, IndexError):
+            return None
+
+    @property
+    def paused(self) -> bool:
+        return self.paused_at is not None
+
+    def sample(self, drained: bool = False):
+        """drained: 下游已没有在途条目，继续等待也不会再释放内存"""
+        if not self.enabled:
+            return
+        rss = self.rss()
+        if rss is None:
+            return
+        self.metrics['rss'].set(rss)
+        self.stats['max_rss'] = max(self.stats['max_rss'], rss)
+        now = time.monotonic()
+        if self.paused_at is None:
+            if rss > self.high:
+                logger.warning(f"内存 {rss >> 20}MB 超过高水位 {self.high >> 20}MB，暂停抓取")
+                self.paused_at = now
+                self.stats['pauses'] += 1
+                self.metrics['pauses'].inc()
+                self.metrics['paused'].set(1)
+                self._resumed.clear()
+        elif rss < self.low or drained:
+            logger.info(f"内存 {rss >> 20}MB，恢复抓取")
+            self.stats['paused_seconds'] += now - self.paused_at
+            self.paused_at = None
+            self.metrics['paused'].set(0)
+            self._resumed.set()
+
+    async def wait(self):
+        await self._resumed.wait()
+
+
+class TieredCache:
+    """三级缓存系统（内存 -> 磁盘 -> Redis）
+
+    读穿透：按层次依次查询，下层命中后回填所有上层；写穿透：同时写入所有层。
+    CachedResponse 以压缩副本写入各层（键即URL，按其主机选用 zstd 字典），层间
+    回填直接搬运压缩正文；读出的正文在首次访问 body 时才解压。不小于 offload_bytes
+    的正文在磁盘缓存的执行器线程中压缩，不占用事件循环。
+    """
+    metrics = {
+        'requests': Counter('cache_requests', '缓存查询统计', ['tier', 'result']),
+        'latency': Histogram('cache_latency', '缓存查询延迟分布', ['tier'])
+    }
+
+    def __init__(self, config: CacheConfig):
+        self.codec = BodyCodec(config, str(Path(config.disk_dir) / "dictionaries"))
+        self.offload_bytes = config.offload_bytes
+        self.disk = DiskCache(
+            cache_dir=config.disk_dir,
+            ttl=config.ttl,
+            segment_bytes=config.disk_segment_bytes
+        )
+        self.tiers = [
+            ('memory', MemoryCache(max_bytes=config.memory_bytes, ttl=config.ttl)),
+            ('disk', self.disk),
+        ]
+        if config.redis_host:
+            self.tiers.append(('redis', RedisCache(
+                host=config.redis_host,
+                port=config.redis_port,
+                password=config.redis_password,
+                db=config.redis_db,
+                ttl=config.ttl,
+                max_connections=config.redis_max_connections,
+                batch_window=config.redis_batch_window,
+                max_batch=config.redis_max_batch
+            )))
+        self.stats = {
+            name: {'hits': 0, 'misses': 0, 'seconds': 0.0}
+            for name, _ in self.tiers
+        }
+
+    async def get(self, key: str) -> Optional[Any]:
+        for depth, (name, tier) in enumerate(self.tiers):
+            started = time.perf_counter()
+            value = await tier.get(key)
+            if isinstance(value, CachedResponse) and value.encoded is not None:
+                value.codec = self.codec
+                if not self.codec.readable(value.encoded):
+                    value = None
+            self._record(name, value is not None, time.perf_counter() - started)
+            if value is not None:
+                for _, upper in self.tiers[:depth]:
+                    await upper.set(key, value)
+                # 调用方拿到的副本才缓存解压结果，层内实例保持只含压缩正文
+                return value.copy() if isinstance(value, CachedResponse) else value
+        return None
+
+    async def set(self, key: str, value: Any):
+        if isinstance(value, CachedResponse):
+            host = urlsplit(key).netloc.lower()
+            encoded = None
+            if value.encoded is None and value.size >= self.offload_bytes:
+                encoded = await self.codec.compress_in(self.disk.executor, host, value.body)
+            value = value.compressed(self.codec, host, encoded)
+        for _, tier in self.tiers:
+            await tier.set(key, value)
+
+    async def close(self):
+        for _, tier in self.tiers:
+            if hasattr(tier, 'close'):
+                await tier.close()
+        await self.codec.close()
+
+    def _record(self, tier: str, hit: bool, elapsed: float):
+        stats = self.stats[tier]
+        stats['hits' if hit else 'misses'] += 1
+        stats['seconds'] += elapsed
+        self.metrics['requests'].labels(tier, 'hit' if hit else 'miss').inc()
+        self.metrics['latency'].labels(tier).observe(elapsed)
+
+
+# ----------------------
+# 断点续爬（Checkpoint）
+# ----------------------
+
+class Checkpointer:
+    """周期性快照URL队列、去重集合与主机限速状态，启动时据此恢复
+
+    截取状态在事件循环内同步完成，只做内存拷贝，工作协程不停顿；随后等待截取前
+    处理完的条目落盘，在后台线程写出快照文件并原子替换 manifest，最后提交已见集合
+    的 SQLite 事务。已见集合和溢出日志本身就在磁盘上，每次只提交增量；恢复时直接
+    打开它们并载入布隆位数组，无需重建。
+    """
+    MANIFEST = "manifest.json"
+
+    metrics = {
+        'checkpoints': Counter('checkpoints', '已完成的检查点数'),
+        'latency': Histogram('checkpoint_latency', '检查点总耗时'),
+        'capture': Histogram('checkpoint_capture_latency', '同步截取状态占用事件循环的时间')
+    }
+
+    def __init__(self, config: CheckpointConfig, frontier: UrlFrontier, scheduler: HostScheduler,
+                 drain: Callable[[], Awaitable[Any]]):
+        self.directory = Path(config.directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.interval = config.interval
+        self.frontier = frontier
+        self.scheduler = scheduler
+        self.drain = drain
+        self.generation = 0
+        self.stats = {'checkpoints': 0, 'last_seconds': 0.0, 'last_capture_seconds': 0.0}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def exists(cls, config: CheckpointConfig) -> bool:
+        return (Path(config.directory) / cls.MANIFEST).exists()
+
+    def restore(self) -> bool:
+        """载入最近一次检查点，不存在时返回 False"""
+        path = self.directory / self.MANIFEST
+        if not path.exists():
+            return False
+        manifest = json.loads(path.read_text('utf-8'))
+        if manifest['frontier_directory'] != str(self.frontier.directory):
+            raise ValueError(f"检查点属于另一个URL队列目录: {manifest['frontier_directory']}")
+        generation = manifest['generation']
+        bits = (self.directory / f"bloom-{generation}.bin").read_bytes()
+        urls = (self.directory / f"pending-{generation}.txt").read_text('utf-8').splitlines()
+        self.scheduler.restore(manifest['hosts'])
+        self.frontier.restore(manifest['frontier'], bits, urls)
+        self.generation = generation
+        logger.info(f"从检查点 {generation} 恢复：待抓取 {len(self.frontier)} 个URL，"
+                    f"{len(manifest['hosts'])} 个主机")
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                logger.error(f"检查点写入失败: {str(e)}")
+
+    async def checkpoint(self):
+        started = time.perf_counter()
+        hosts, in_progress = self.scheduler.snapshot()
+        state, bits, hot = self.frontier.snapshot()
+        captured = time.perf_counter() - started
+        committed = False
+        try:
+            # 截取时刻之前处理完的页面，其条目必须先落盘
+            await self.drain()
+            manifest = {
+                'generation': self.generation + 1,
+                'created_at': time.time(),
+                'frontier_directory': str(self.frontier.directory),
+                'frontier': state,
+                'hosts': hosts,
+            }
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._write, manifest, bits, in_progress, hot)
+            self.frontier.commit(state)
+            self.generation += 1
+            committed = True
+        finally:
+            if not committed:
+                self.frontier.abort()
+        elapsed = time.perf_counter() - started
+        self.stats['checkpoints'] += 1
+        self.stats['last_seconds'] = elapsed
+        self.stats['last_capture_seconds'] = captured
+        self.metrics['checkpoints'].inc()
+        self.metrics['latency'].observe(elapsed)
+        self.metrics['capture'].observe(captured)
+        logger.info(f"检查点 {self.generation} 完成，耗时 {elapsed:.2f}s（截取 {captured * 1000:.1f}ms）")
+
+    def _write(self, manifest: Dict, bits: bytes, in_progress: List[Tuple[int, int, str]],
+               hot: List[Tuple[int, List[int], List[str]]]):
+        """在后台线程写出快照文件（待抓取条目每行 "档位 深度 URL"）；manifest 最后原子替换"""
+        generation = manifest['generation']
+        self._write_file(f"bloom-{generation}.bin", bits)
+        lines = [f'{level} {depth} {url}\n' for level, depth, url in in_progress]
+        for level, depths, urls in hot:
+            prefix = f'{level} '
+            lines.extend(f'{prefix}{depth} {url}\n' for depth, url in zip(depths, urls))
+        self._write_file(f"pending-{generation}.txt", ''.join(lines).encode('utf-8'))
+        self._write_file(self.MANIFEST, json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+        for path in self.directory.glob("*-*.*"):
+            if path.stem.rsplit('-', 1)[-1] != str(generation):
+                path.unlink(missing_ok=True)
+
+    def _write_file(self, name: str, data: bytes):
+        tmp = self.directory / f"{name}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.directory / name)
+
+    async def close(self, completed: bool = False):
+        """停止周期快照；爬取完成时清除检查点，下次运行从起始URL开始"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.executor.shutdown()
+        if completed:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# ----------------------
+# 多进程分片
+# ----------------------
+
+class HashRing:
+    """一致性哈希环（虚拟节点）：增加一个分片只迁移约 1/(N+1) 的主机"""
+
+    def __init__(self, shards: int, vnodes: int = 128):
+        points = sorted(
+            (self._hash(f"shard-{shard}#{vnode}"), shard)
+            for shard in range(shards) for vnode in range(vnodes)
+        )
+        self.points = [point for point, _ in points]
+        self.owners = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def owner(self, key: str) -> int:
+        index = bisect.bisect(self.points, self._hash(key)) % len(self.points)
+        return self.owners[index]
+
+
+class ShardContext:
+    """分片进程间共享的IPC资源：各分片收件队列 + 全局未完成任务计数"""
+
+    def __init__(self, index: int, count: int, inboxes: List[multiprocessing.Queue],
+                 outstanding: Any):
+        self.index = index
+        self.count = count
+        self.inboxes = inboxes
+        self.outstanding = outstanding
+
+
+class ShardRouter:
+    """分片路由：本分片拥有的主机直接入队，其余主机的链接批量转交所属分片
+
+    全局计数 = 各分片未完成URL + 发件箱/在途批次中的URL + 尚未完成播种的分片数；
+    计数归零且本地队列清空时，整个分片集群的抓取结束。
+    """
+
+    metrics = {
+        'routed': Counter('shard_routed_urls', '转交其他分片的URL数'),
+        'received': Counter('shard_received_urls', '从其他分片接收的URL数'),
+    }
+
+    def __init__(self, context: ShardContext, scheduler: HostScheduler,
+                 batch_size: int = 256, flush_interval: float = 0.05):
+        self.index = context.index
+        self.context = context
+        self.ring = HashRing(context.count)
+        self.scheduler = scheduler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.outbox: Dict[int, List[Tuple[str, int, bytes]]] = defaultdict(list)
+        self._tasks: List[asyncio.Task] = []
+
+    def owns(self, url: str) -> bool:
+        return self.ring.owner(HostScheduler.host_of(url)) == self.index
+
+    def add(self, url: str, depth: int = 0, anchor: bytes = b''):
+        """深度和锚文本随URL转交，由所属分片去重后评分（主机配额也按所属分片计）"""
+        owner = self.ring.owner(HostScheduler.host_of(url))
+        if owner == self.index:
+            if self.scheduler.add(url, depth, anchor):
+                self._adjust(1)
+            return
+        # 进入发件箱即计数：否则本分片任务完成时发件箱中的URL会被漏算
+        self._adjust(1)
+        batch = self.outbox[owner]
+        batch.append((url, depth, anchor))
+        if len(batch) >= self.batch_size:
+            self._send(owner)
+
+    def task_done(self):
+        self._adjust(-1)
+
+    def reserve(self):
+        """登记一个本分片的后台任务（如站点地图播种），结束前整个集群不会判定完成"""
+        self._adjust(1)
+
+    def start(self):
+        """播种完成后调用：释放本分片的启动计数并开始收发"""
+        self._adjust(-1)
+        self._tasks = [
+            asyncio.create_task(self._receive()),
+            asyncio.create_task(self._flush_periodically()),
+        ]
+
+    async def join(self):
+        """等待全局计数归零（所有分片都没有待处理和在途的URL）"""
+        while True:
+            await self.scheduler.join()
+            self.flush()
+            if self.context.outstanding.value == 0:
+                return
+            await asyncio.sleep(self.flush_interval)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def flush(self):
+        for owner in list(self.outbox):
+            self._send(owner)
+
+    def _adjust(self, delta: int):
+        with self.context.outstanding.get_lock():
+            self.context.outstanding.value += delta
+
+    def _send(self, owner: int):
+        batch = self.outbox.pop(owner)
+        self.context.inboxes[owner].put(batch)
+        self.metrics['routed'].inc(len(batch))
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def _get_batch(self) -> Optional[List[Tuple[str, int, bytes]]]:
+        try:
+            return self.context.inboxes[self.index].get(timeout=self.flush_interval)
+        except queue.Empty:
+            return None
+
+    async def _receive(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await loop.run_in_executor(None, self._get_batch)
+            if not batch:
+                continue
+            for url, depth, anchor in batch:
+                if self.scheduler.add(url, depth, anchor):
+                    self._adjust(1)
+            # 先计入新任务再扣除在途数，保证计数不会提前归零
+            self._adjust(-len(batch))
+            self.metrics['received'].inc(len(batch))
+
+
+def _shard_main(config: Dict, context: ShardContext):
+    """分片子进程入口：每个分片使用独立的队列、磁盘缓存和输出目录"""
+    config = SpiderConfig.parse_obj(config)
+    config.frontier.directory = str(Path(config.frontier.directory) / f"shard-{context.index}")
+    config.cache.disk_dir = str(Path(config.cache.disk_dir) / f"shard-{context.index}")
+    config.storage.directory = str(Path(config.storage.directory) / f"shard-{context.index}")
+    if config.sitemaps.state_file:
+        # 各分片只读取主机归自己的站点地图，读取记录分开保存
+        config.sitemaps.state_file = f"{config.sitemaps.state_file}.shard-{context.index}"
+    container = Container()
+    container.config.from_dict(config.dict())
+    asyncio.run(SpiderEngine(container, shard=context).run())
+
+
+def run_sharded(config: SpiderConfig):
+    """启动 config.shards 个引擎进程，按主机一致性哈希划分抓取范围"""
+    inboxes = [multiprocessing.Queue() for _ in range(config.shards)]
+    # 每个分片持有一个启动计数，避免其他分片尚未播种时提前判定结束
+    outstanding = multiprocessing.Value('q', config.shards)
+    processes = [
+        multiprocessing.Process(
+            target=_shard_main,
+            args=(config.dict(), ShardContext(index, config.shards, inboxes, outstanding)),
+            name=f"{config.name}-shard-{index}"
+        )
+        for index in range(config.shards)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+# ----------------------
+# 容器依赖注入
+# ----------------------
+
+class Container(containers.DeclarativeContainer):
+    """IoC容器"""
+    config = providers.Configuration()
+    resolver = providers.Singleton(
+        CachingResolver,
+        config=providers.Callable(RequestConfig.parse_obj, config.request)
+    )
+    http_client = providers.Singleton(
+        AsyncHttpClient,
+        config=providers.Callable(RequestConfig.parse_obj, config.request),
+        resolver=resolver
+    )
+    parser = providers.Factory(
+        HybridParser,
+        rules=config.parsing_rules
+    )
+    link_extractor = providers.Factory(
+        LinkExtractor,
+        config=providers.Callable(LinkConfig.parse_obj, config.links)
+    )
+    scorer = providers.Factory(
+        UrlScorer,
+        config=providers.Callable(ScoringConfig.parse_obj, config.scoring)
+    )
+    pipeline = providers.Factory(
+        DataPipeline,
+        config=providers.Callable(SpiderConfig.parse_obj, config)
+    )
+    storage = providers.FactoryAggregate(
+        json=providers.Factory(
+            JsonPipeline,
+            name=config.name,
+            config=providers.Callable(StorageConfig.parse_obj, config.storage)
+        ),
+        parquet=providers.Factory(
+            ParquetPipeline,
+            name=config.name,
+            config=providers.Callable(StorageConfig.parse_obj, config.storage)
+        )
+    )
 
 
-class TieredCache:
-    """三级缓存系统"""
-    def __init__(self):
-        self.memory = {}
-        self.disk = DiskCache(cache_dir="./.cache")  # 指定缓存目录
-        self.redis = RedisCache(
-            host="your_redis_host",
-            port=6379,
-            password="your_password",
-            db=0
-        )
 # ----------------------
 # 运行入口
 # ----------------------
@@ -319,5 +4273,8 @@ if __name__ == "__main__":
     container = Container()
     container.config.from_pydantic(config)
 
-    # 启动引擎
-    asyncio.run(SpiderEngine(container).run())
\ No newline at end of file
+    # 启动引擎（多分片时每个分片一个进程）
+    if config.shards > 1:
+        run_sharded(config)
+    else:
+        asyncio.run(SpiderEngine(container).run())
\ No newline at end of file
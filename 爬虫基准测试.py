@@ -0,0 +1,2068 @@
+"""
+HyperSpider 基准测试
+用法：python 爬虫基准测试.py frontier --urls 1000000
+      python 爬虫基准测试.py scheduler --hosts 5000 --workers 1000
+      python 爬虫基准测试.py disk-cache --entries 1000000
+      python 爬虫基准测试.py redis [--redis-url redis://localhost:6379/0]
+      python 爬虫基准测试.py parse --max-workers 8
+      python 爬虫基准测试.py links [--corpus ./pages]
+      python 爬虫基准测试.py sharding --shards 8
+      python 爬虫基准测试.py storage --items 200000
+      python 爬虫基准测试.py pipeline --batch-size 256
+      python 爬虫基准测试.py connections --vhosts 200
+      python 爬虫基准测试.py compression --pages 4000 --hosts 40
+      python 爬虫基准测试.py checkpoint --urls 1000000
+      python 爬虫基准测试.py startup --repeat 7
+      python 爬虫基准测试.py crawl --pages 5000 --output crawl.json
+      python 爬虫基准测试.py breaker --down-hosts 3
+      python 爬虫基准测试.py concurrency --capacity 40 --swing 4
+      python 爬虫基准测试.py dedup --duplicate-rate 0.3 --fingerprints 2000000
+      python 爬虫基准测试.py priority --listing-rate 0.6 --budget 1000
+      python 爬虫基准测试.py robots --rules 400 --crawl-delay 0.2
+      python 爬虫基准测试.py sitemaps --files 16 --urls-per-file 50000
+      python 爬虫基准测试.py backpressure --store-rate 25 --capacity 128
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import resource
+import socket
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, List, Optional
+from urllib import robotparser
+from urllib.parse import urljoin
+
+import redis.asyncio
+from dependency_injector import providers
+from prometheus_client import REGISTRY
+import aiohttp
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
+
+import 可扩展版爬虫程序 as spider
+
+
+def _report(name: str, result: dict):
+    print(json.dumps({'benchmark': name, **result}, ensure_ascii=False, indent=2))
+
+
+# ----------------------
+# URL队列
+# ----------------------
+
+def bench_frontier(args):
+    """URL队列：入队/出队吞吐与每百万URL内存占用"""
+    urls = [f"https://host{i % 997}.example/page/{i}" for i in range(args.urls)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = spider.FrontierConfig(
+            directory=tmp, hot_capacity=args.hot_capacity, expected_urls=args.urls
+        )
+
+        # 内存：仅统计队列自身的Python堆分配
+        tracemalloc.start()
+        frontier = spider.UrlFrontier(config)
+        for url in urls:
+            frontier.add(url)
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        frontier.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = spider.FrontierConfig(
+            directory=tmp, hot_capacity=args.hot_capacity, expected_urls=args.urls
+        )
+        frontier = spider.UrlFrontier(config)
+
+        start = time.perf_counter()
+        for url in urls:
+            frontier.add(url)
+        enqueue = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for url in urls[: len(urls) // 2]:
+            frontier.add(url)
+        duplicate = time.perf_counter() - start
+
+        async def drain():
+            for _ in range(len(urls)):
+                await frontier.get()
+                frontier.task_done()
+
+        start = time.perf_counter()
+        asyncio.run(drain())
+        dequeue = time.perf_counter() - start
+        stats = dict(frontier.stats)
+        frontier.close()
+
+    _report('frontier', {
+        'urls': args.urls,
+        'hot_capacity': args.hot_capacity,
+        'memory_mb_per_million': round(memory / 2 ** 20 * 1_000_000 / args.urls, 2),
+        'bloom_mb': round(frontier.bloom.nbytes / 2 ** 20, 2),
+        'enqueue_ops_per_sec': round(args.urls / enqueue),
+        'duplicate_ops_per_sec': round(len(urls) // 2 / duplicate),
+        'dequeue_ops_per_sec': round(args.urls / dequeue),
+        'stats': stats,
+    })
+
+
+# ----------------------
+# 按主机调度
+# ----------------------
+
+def bench_scheduler(args):
+    """按主机调度：多主机下的工作协程利用率与单主机最小请求间隔"""
+    delay_range = (args.min_delay, args.max_delay)
+
+    async def crawl(tmp):
+        frontier = spider.UrlFrontier(spider.FrontierConfig(directory=tmp))
+        scheduler = spider.HostScheduler(frontier, spider.SchedulerConfig(), delay_range)
+        for i in range(args.urls):
+            scheduler.add(f"https://host{i % args.hosts}.example/page/{i}")
+
+        loop = asyncio.get_running_loop()
+        last_seen, min_gap, busy = {}, {}, 0.0
+
+        async def worker():
+            nonlocal busy
+            while True:
+                url = await scheduler.get()
+                host = scheduler.host_of(url)
+                now = loop.time()
+                if host in last_seen:
+                    min_gap[host] = min(min_gap.get(host, 1e9), now - last_seen[host])
+                # 模拟抓取：慢主机（编号能被10整除）延迟为其他主机的10倍
+                latency = args.latency * (10 if int(host[4:].split('.')[0]) % 10 == 0 else 1)
+                await asyncio.sleep(latency)
+                busy += latency
+                scheduler.observe(url, latency, True)
+                last_seen[host] = loop.time()
+                scheduler.release(url)
+
+        scheduler.start()
+        start = loop.time()
+        workers = [asyncio.create_task(worker()) for _ in range(args.workers)]
+        await scheduler.join()
+        elapsed = loop.time() - start
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await scheduler.close()
+        frontier.close()
+
+        stats = scheduler.stats()
+        return {
+            'urls': args.urls,
+            'hosts': args.hosts,
+            'workers': args.workers,
+            'elapsed_sec': round(elapsed, 2),
+            'pages_per_sec': round(args.urls / elapsed),
+            'worker_utilization': round(busy / (elapsed * args.workers), 3),
+            'min_host_gap_sec': round(min(min_gap.values()), 3),
+            'max_host_delay_sec': max(s['delay'] for s in stats.values()),
+        }
+
+    async def hot_host(tmp):
+        """一个大主机的URL全部排在众多小主机之前：限时内小主机也应得到抓取（不被队首阻塞）"""
+        frontier = spider.UrlFrontier(spider.FrontierConfig(directory=tmp, hot_capacity=args.hot_urls // 2))
+        scheduler = spider.HostScheduler(frontier, spider.SchedulerConfig(), (args.hot_delay, args.hot_delay))
+        for i in range(args.hot_urls):
+            scheduler.add(f"https://big.example/page/{i}")
+        for i in range(args.cold_hosts * args.cold_urls):
+            scheduler.add(f"https://small{i % args.cold_hosts}.example/page/{i}")
+        fetched = defaultdict(int)
+
+        async def worker():
+            while True:
+                url = await scheduler.get()
+                await asyncio.sleep(args.latency)
+                fetched['big' if url.startswith('https://big.') else 'small'] += 1
+                scheduler.release(url)
+
+        scheduler.start()
+        cpu = time.process_time()
+        workers = [asyncio.create_task(worker()) for _ in range(args.hot_workers)]
+        await asyncio.sleep(args.hot_seconds)
+        cpu = time.process_time() - cpu
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await scheduler.close()
+        frontier.close()
+        return {
+            'hot_urls': args.hot_urls,
+            'cold_urls': args.cold_hosts * args.cold_urls,
+            'seconds': args.hot_seconds,
+            'fetched_hot': fetched['big'],
+            'fetched_cold': fetched['small'],
+            'hosts_known': len(scheduler.hosts),
+            'cpu_sec': round(cpu, 2),
+        }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = asyncio.run(crawl(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        result['hot_host'] = asyncio.run(hot_host(tmp))
+    _report('scheduler', result)
+
+
+# ----------------------
+# 磁盘缓存
+# ----------------------
+
+class LegacyDiskCache:
+    """旧版一键一文件的磁盘缓存（仅作对比基线）"""
+    def __init__(self, cache_dir: str, ttl: int = 3600):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.cache_dir.mkdir(exist_ok=True)
+
+    def _get_path(self, key: str) -> Path:
+        return self.cache_dir / f"{hash(key)}.pkl"
+
+    async def get(self, key: str):
+        file_path = self._get_path(key)
+        if not file_path.exists():
+            return None
+        if time.time() - file_path.stat().st_mtime > self.ttl:
+            return None
+        with open(file_path, 'rb') as f:
+            return pickle.load(f)
+
+    async def set(self, key: str, value):
+        with open(self._get_path(key), 'wb') as f:
+            pickle.dump(value, f)
+
+
+def _disk_usage(path: str) -> tuple:
+    files = [p for p in Path(path).rglob('*') if p.is_file()]
+    return len(files), sum(p.stat().st_size for p in files)
+
+
+def bench_disk_cache(args):
+    """磁盘缓存：日志结构实现与旧版一键一文件实现对比"""
+    value = os.urandom(args.value_bytes)
+    keys = [f"https://host{i % 997}.example/page/{i}" for i in range(args.entries)]
+    sample = random.Random(0).sample(keys, min(len(keys), args.reads))
+
+    async def run(cache):
+        # 事件循环卡顿：同步磁盘IO期间心跳协程得不到调度
+        loop = asyncio.get_running_loop()
+        max_lag = 0.0
+
+        async def heartbeat():
+            nonlocal max_lag
+            while True:
+                tick = loop.time()
+                await asyncio.sleep(0.001)
+                max_lag = max(max_lag, loop.time() - tick - 0.001)
+
+        monitor = asyncio.create_task(heartbeat())
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        for key in keys:
+            await cache.set(key, value)
+        write = time.perf_counter() - start
+        start = time.perf_counter()
+        for key in sample:
+            assert await cache.get(key) == value
+        read = time.perf_counter() - start
+        await asyncio.sleep(0.002)
+        monitor.cancel()
+        if hasattr(cache, 'close'):
+            await cache.close()
+        return write, read, max_lag
+
+    results = {}
+    for name, factory in (('legacy', LegacyDiskCache), ('segmented', spider.DiskCache)):
+        with tempfile.TemporaryDirectory() as tmp:
+            write, read, max_lag = asyncio.run(run(factory(tmp)))
+            files, size = _disk_usage(tmp)
+        results[name] = {
+            'set_ops_per_sec': round(args.entries / write),
+            'get_ops_per_sec': round(len(sample) / read),
+            'max_loop_lag_ms': round(max_lag * 1000, 1),
+            'files': files,
+            'disk_mb': round(size / 2 ** 20, 1),
+        }
+    _report('disk-cache', {'entries': args.entries, 'value_bytes': args.value_bytes, **results})
+
+
+# ----------------------
+# Redis缓存
+# ----------------------
+
+class FakeRedis:
+    """进程内 Redis 替身
+
+    每次往返（单条命令或一条流水线）先占用连接池中的一条连接（最多
+    max_connections 条，与 BlockingConnectionPool 一致），再排进单线程服务端
+    的处理队列：每个请求固定开销 request_cost，每条命令另加 command_cost，
+    请求之间串行；最后加上网络往返 rtt。服务端时间按虚拟时钟累计，不实际占用 CPU。
+    """
+    def __init__(self, rtt: float, max_connections: int = 32,
+                 request_cost: float = 0.0, command_cost: float = 0.0):
+        self.rtt = rtt
+        self.request_cost = request_cost
+        self.command_cost = command_cost
+        self.connections = asyncio.Semaphore(max_connections)
+        self.busy_until = 0.0
+        self.data = {}
+        self.round_trips = 0
+
+    def serve(self, commands: int) -> float:
+        """把请求排进服务端队列，返回从现在起到响应回到客户端的时长"""
+        now = time.perf_counter()
+        start = max(now, self.busy_until)
+        self.busy_until = start + self.request_cost + commands * self.command_cost
+        return self.busy_until - now + self.rtt
+
+    def pipeline(self, transaction: bool = True):
+        return FakePipeline(self)
+
+    async def aclose(self):
+        pass
+
+
+class FakePipeline:
+    def __init__(self, server: FakeRedis):
+        self.server = server
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def setex(self, name, time, value):
+        self.commands.append(('setex', name, value))
+
+    def mget(self, keys):
+        self.commands.append(('mget', keys, None))
+
+    async def execute(self):
+        async with self.server.connections:
+            self.server.round_trips += 1
+            commands = sum(len(arg) if command == 'mget' else 1 for command, arg, _ in self.commands)
+            await asyncio.sleep(self.server.serve(commands))
+        results = []
+        for command, arg, value in self.commands:
+            if command == 'setex':
+                self.server.data[arg] = value
+                results.append(True)
+            else:
+                results.append([self.server.data.get(key) for key in arg])
+        return results
+
+
+def bench_redis(args):
+    """Redis缓存：逐条往返与时间窗合并流水线的吞吐对比"""
+    keys = [f"https://host{i % 97}.example/page/{i}" for i in range(args.keys)]
+    value = os.urandom(args.value_bytes)
+
+    async def run(max_batch):
+        if args.redis_url:
+            pool = redis.asyncio.BlockingConnectionPool.from_url(
+                args.redis_url, max_connections=args.max_connections
+            )
+            client = redis.asyncio.Redis(connection_pool=pool)
+        else:
+            client = FakeRedis(args.rtt, args.max_connections, args.request_cost, args.command_cost)
+        cache = spider.RedisCache(client=client, max_batch=max_batch, batch_window=args.window)
+
+        async def worker(offset):
+            for i in range(offset, len(keys), args.concurrency):
+                await cache.set(keys[i], value)
+                assert await cache.get(keys[i]) == value
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        round_trips = getattr(client, 'round_trips', None)
+        await cache.close()
+        return {
+            'ops_per_sec': round(2 * len(keys) / elapsed),
+            'round_trips': round_trips,
+        }
+
+    _report('redis', {
+        'backend': args.redis_url or (
+            f"fake(rtt={args.rtt * 1000:g}ms, request={args.request_cost * 1e6:g}us, "
+            f"command={args.command_cost * 1e6:g}us)"
+        ),
+        'max_connections': args.max_connections,
+        'keys': args.keys,
+        'concurrency': args.concurrency,
+        'per_call': asyncio.run(run(max_batch=1)),
+        'coalesced': asyncio.run(run(max_batch=args.max_batch)),
+    })
+
+
+# ----------------------
+# 解析阶段
+# ----------------------
+
+def synthetic_page(index: int, links: int = 200, paragraphs: int = 200) -> bytes:
+    """生成带标题、正文段落和站内链接的HTML页面"""
+    anchors = ''.join(
+        f'<li><a href="/section/{index % 50}/page-{index * 7 + i}.html?ref=nav">link {i}</a></li>'
+        for i in range(links)
+    )
+    body = ''.join(f'<p>paragraph {i} of page {index} lorem ipsum dolor sit amet</p>' for i in range(paragraphs))
+    return (f'<html><head><title>Page {index}</title></head><body>'
+            f'<ul>{anchors}</ul>{body}</body></html>').encode()
+
+
+def bench_parse(args):
+    """解析阶段：进程池解析吞吐随进程数的扩展情况"""
+    pages = [synthetic_page(i) for i in range(args.pages)]
+    parser = spider.HybridParser({'paragraphs': r'<p>(.*?)</p>'})
+    results = {}
+
+    async def run(workers):
+        links = spider.LinkExtractor(spider.LinkConfig())
+        stage = spider.ParseStage(parser, links, spider.ParseConfig(workers=workers, max_in_flight=args.in_flight))
+        # 预热：进程池启动不计入吞吐
+        await asyncio.gather(*(stage.parse("https://example.com/", pages[0]) for _ in range(max(workers, 1))))
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            stage.parse(f"https://example.com/p/{i}", page) for i, page in enumerate(pages)
+        ))
+        elapsed = time.perf_counter() - start
+        stage.close()
+        return round(len(pages) / elapsed, 1)
+
+    counts = sorted({0, 1, *(2 ** i for i in range(1, 8) if 2 ** i <= args.max_workers), args.max_workers})
+    for workers in counts:
+        results['inline' if workers == 0 else f'{workers}_workers'] = asyncio.run(run(workers))
+    _report('parse', {
+        'pages': args.pages,
+        'page_kb': round(len(pages[0]) / 1024, 1),
+        'cpu_count': os.cpu_count(),
+        'pages_per_sec': results,
+    })
+
+
+# ----------------------
+# 链接提取
+# ----------------------
+
+LEGACY_LINK_PATTERN = re.compile(rb'''href\s*=\s*["']?([^"'\s>#]+)''', re.I)
+
+
+def legacy_extract_links(base_url: str, content: bytes) -> list:
+    """改造前的实现：逐个 urljoin，不做规范化和缓存"""
+    links = []
+    for match in LEGACY_LINK_PATTERN.finditer(content):
+        link = urljoin(base_url, match.group(1).decode('utf-8', errors='ignore'))
+        if link.startswith(('http://', 'https://')):
+            links.append(link)
+    return links
+
+
+def link_corpus_page(index: int) -> bytes:
+    """贴近真实站点的页面：公共导航/页脚、正文相对链接、外链、锚点和实体编码的查询串"""
+    nav = ''.join(f'<a class="nav" href="/category/{c}/">Category {c}</a>' for c in range(40))
+    footer = ''.join(f'<a href="https://www.example.com/about/{c}.html#top">About {c}</a>' for c in range(20))
+    body = ''.join(
+        f'<p>Text <a href="../articles/{index * 13 + i}.html?utm_source=feed&amp;id={i}">article</a>'
+        f' <a href=\'https://cdn{i % 3}.Example.com:443/img/{i}.png\'>img</a>'
+        f' <a href="#section-{i}">§</a> <a href="mailto:editor{i}@example.com">mail</a></p>'
+        for i in range(60)
+    )
+    return (f'<html><head><title>Page {index}</title></head><body><nav>{nav}</nav>'
+            f'<main>{body}</main><footer>{footer}</footer></body></html>').encode()
+
+
+def bench_links(args):
+    """链接提取：旧的正则+urljoin 与字节级提取器（含规范化和LRU缓存）的吞吐对比"""
+    if args.corpus:
+        files = sorted(Path(args.corpus).rglob('*.htm*'))
+        pages = [(f"https://example.com/{path.relative_to(args.corpus).as_posix()}", path.read_bytes())
+                 for path in files]
+    else:
+        pages = [(f"https://www.example.com/section/{i % 20}/page-{i}.html", link_corpus_page(i))
+                 for i in range(args.pages)]
+    if not pages:
+        raise SystemExit(f"语料目录中没有HTML文件: {args.corpus}")
+
+    def run(extract):
+        start = time.perf_counter()
+        found = sum(len(extract(url, content)) for url, content in pages)
+        return time.perf_counter() - start, found
+
+    extractor = spider.LinkExtractor(spider.LinkConfig(cache_size=args.cache_size))
+    results = {}
+    for name, extract in (('legacy', legacy_extract_links), ('extractor', extractor.extract)):
+        elapsed, found = run(extract)
+        results[name] = {
+            'pages_per_sec': round(len(pages) / elapsed),
+            'links_per_page': round(found / len(pages), 1),
+        }
+    info = extractor._resolve_cached.cache_info()
+    _report('links', {
+        'pages': len(pages),
+        'corpus': args.corpus or 'synthetic',
+        'page_kb': round(sum(len(content) for _, content in pages) / len(pages) / 1024, 1),
+        'cache_hit_rate': round(info.hits / max(info.hits + info.misses, 1), 3),
+        **results,
+    })
+
+
+# ----------------------
+# 多进程分片
+# ----------------------
+
+def bench_sharding(args):
+    """一致性哈希分片：主机分布均衡度与增加一个分片时迁移的主机比例"""
+    hosts = [f"host{i}.example" for i in range(args.hosts)]
+    before = spider.HashRing(args.shards)
+    after = spider.HashRing(args.shards + 1)
+
+    start = time.perf_counter()
+    owners = [before.owner(host) for host in hosts]
+    lookup = time.perf_counter() - start
+
+    counts = [owners.count(shard) for shard in range(args.shards)]
+    moved = sum(1 for host, owner in zip(hosts, owners) if after.owner(host) != owner)
+    _report('sharding', {
+        'hosts': args.hosts,
+        'shards': args.shards,
+        'lookups_per_sec': round(args.hosts / lookup),
+        'max_over_mean_load': round(max(counts) / (args.hosts / args.shards), 3),
+        'moved_share_on_add': round(moved / args.hosts, 4),
+        'ideal_moved_share': round(1 / (args.shards + 1), 4),
+    })
+
+
+# ----------------------
+# 存储管道
+# ----------------------
+
+def bench_storage(args):
+    """存储管道：批量写入吞吐与批次落盘延迟"""
+    items = [
+        {'url': f"https://host{i % 97}.example/page/{i}", 'title': f"Page {i}",
+         'paragraphs': [f"paragraph {j} of page {i}" for j in range(10)]}
+        for i in range(args.items)
+    ]
+
+    async def run(factory, directory):
+        pipeline = factory('bench', spider.StorageConfig(directory=directory, batch_rows=args.batch_rows))
+        start = time.perf_counter()
+        for item in items:
+            await pipeline.write(item)
+        await pipeline.close()
+        elapsed = time.perf_counter() - start
+        stats = pipeline.stats
+        return {
+            'rows_per_sec': round(len(items) / elapsed),
+            'flushes': stats['flushes'],
+            'mean_flush_ms': round(stats['flush_seconds'] / max(stats['flushes'], 1) * 1000, 2),
+            'max_flush_ms': round(stats['max_flush_seconds'] * 1000, 2),
+            'file_mb': round(pipeline.path.stat().st_size / 2 ** 20, 2),
+        }
+
+    results = {}
+    for name, factory in (('json', spider.JsonPipeline), ('parquet', spider.ParquetPipeline)):
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                results[name] = asyncio.run(run(factory, tmp))
+            except ImportError as e:
+                results[name] = {'skipped': str(e)}
+    _report('storage', {'items': args.items, 'batch_rows': args.batch_rows, **results})
+
+
+# ----------------------
+# 数据加工
+# ----------------------
+
+def bench_pipeline(args):
+    """数据加工：逐条 process 与微批次 process_batch 的吞吐对比"""
+    def make_items():
+        return [
+            {'url': f"https://host{i % 97}.example/page/{i}",
+             'title': f"  <b>Page&nbsp;{i}</b>\n  &amp; more  ",
+             'paragraphs': [f"<p>paragraph  {j}\tof page {i}</p>" for j in range(10)]}
+            for i in range(args.items)
+        ]
+
+    pipeline = spider.DataPipeline(None)
+
+    async def per_item(items):
+        return [await pipeline.process(item) for item in items]
+
+    async def batched(items):
+        results = []
+        for start in range(0, len(items), args.batch_size):
+            results.extend(await pipeline.process_batch(items[start:start + args.batch_size]))
+        return results
+
+    results = {}
+    for name, runner in (('per_item', per_item), ('batched', batched)):
+        items = make_items()
+        start = time.perf_counter()
+        asyncio.run(runner(items))
+        results[f'{name}_items_per_sec'] = round(args.items / (time.perf_counter() - start))
+    _report('pipeline', {'items': args.items, 'batch_size': args.batch_size, **results})
+
+
+
+# ----------------------
+# 连接池与DNS
+# ----------------------
+
+class SlowResolver(AbstractResolver):
+    """模拟上游DNS：所有虚拟主机都解析到本机，每次查询带固定延迟"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.lookups = 0
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        self.lookups += 1
+        await asyncio.sleep(self.latency)
+        return [{'hostname': host, 'host': '127.0.0.1', 'port': port,
+                 'family': socket.AF_INET, 'proto': 0, 'flags': socket.AI_NUMERICHOST}]
+
+    async def close(self):
+        pass
+
+
+def bench_connections(args):
+    """连接池与DNS：本地多虚拟主机服务器上对比不缓存/不限主机连接与调优后的客户端"""
+    body = synthetic_page(0, links=20, paragraphs=20)
+
+    async def handle(request):
+        await asyncio.sleep(args.server_latency)
+        return web.Response(body=body, content_type='text/html', headers={'X-Vhost': request.host})
+
+    async def run(overrides):
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        config = spider.RequestConfig(concurrency=args.concurrency, retries=0, **overrides)
+        upstream = SlowResolver(args.dns_latency)
+        resolver = spider.CachingResolver(config, upstream)
+        rng = random.Random(7)
+        urls = [f"http://site{rng.randrange(args.vhosts)}.bench:{port}/page/{i}" for i in range(args.requests)]
+        window = asyncio.Semaphore(args.concurrency)
+        request_seconds = 0.0
+
+        async def fetch(client, url):
+            nonlocal request_seconds
+            async with window:
+                started = time.perf_counter()
+                await client.fetch(url)
+                request_seconds += time.perf_counter() - started
+
+        async with spider.AsyncHttpClient(config, resolver) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(fetch(client, url) for url in urls))
+            elapsed = time.perf_counter() - start
+            stats = client.stats
+        await runner.cleanup()
+
+        acquired = stats['connections_new'] + stats['connections_reused']
+        return {
+            'requests_per_sec': round(len(urls) / elapsed),
+            'upstream_dns_lookups': upstream.lookups,
+            'connections_opened': stats['connections_new'],
+            'reuse_ratio': round(stats['connections_reused'] / max(acquired, 1), 3),
+            'connect_share': round(stats['connect_seconds'] / request_seconds, 3),
+            'dns_share': round(resolver.stats['lookup_seconds'] / request_seconds, 3),
+            'pool_wait_share': round(stats['pool_wait_seconds'] / request_seconds, 3),
+        }
+
+    _report('connections', {
+        'vhosts': args.vhosts,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'dns_latency_ms': args.dns_latency * 1000,
+        'uncached_unlimited': asyncio.run(run({'limit_per_host': 0, 'dns_ttl': 0, 'dns_negative_ttl': 0})),
+        'tuned': asyncio.run(run({'limit_per_host': args.limit_per_host})),
+    })
+
+
+# ----------------------
+# 压缩传输与压缩缓存
+# ----------------------
+
+def templated_page(host: int, index: int, words: int = 300) -> bytes:
+    """同一主机的页面共用样式、脚本和导航模板，只有标题和正文不同（贴近真实小HTML页面）"""
+    rng = random.Random(host)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 9)))
+                  for _ in range(2_000)]
+    style = ' '.join(f'.c{i}{{margin:{rng.randint(0, 20)}px;color:#{rng.randrange(1 << 24):06x}}}' for i in range(60))
+    nav = ''.join(f'<li><a href="/{rng.choice(vocabulary)}/">{rng.choice(vocabulary)}</a></li>' for _ in range(100))
+    rng = random.Random(host * 1_000_003 + index)
+    text = ' '.join(rng.choice(vocabulary) for _ in range(words))
+    return (f'<html><head><title>{host}-{index}</title><style>{style}</style>'
+            f'<script src="/static/app.{host}.js"></script></head><body><nav><ul>{nav}</ul></nav>'
+            f'<main><h1>Article {index}</h1><p>{text}</p></main>'
+            f'<footer>site {host} all rights reserved</footer></body></html>').encode()
+
+
+def _encode(body: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        return gzip.compress(body, 6)
+    if encoding == 'br':
+        import brotli
+        return brotli.compress(body, quality=5)
+    if encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return body
+
+
+def bench_compression(args):
+    """传输压缩与缓存压缩：按 Accept-Encoding 协商的线上字节数，以及各缓存编码的占用与读写开销"""
+    pages = [(n % args.hosts, n) for n in range(args.pages)]
+    bodies = {key: templated_page(*key) for key in pages}
+    raw_bytes = sum(len(body) for body in bodies.values())
+
+    async def transfer(preferred):
+        sent = 0
+        encoded = {}
+
+        async def handle(request):
+            nonlocal sent
+            key = (int(request.match_info['host']), int(request.match_info['n']))
+            offered = [e.strip() for e in request.headers.get('Accept-Encoding', '').split(',')]
+            encoding = next((e for e in ('zstd', 'br', 'gzip') if e in offered), 'identity')
+            if (key, encoding) not in encoded:
+                encoded[key, encoding] = _encode(bodies[key], encoding)
+            payload = encoded[key, encoding]
+            sent += len(payload)
+            headers = {'Content-Encoding': encoding} if encoding != 'identity' else {}
+            return web.Response(body=payload, content_type='text/html', headers=headers)
+
+        app = web.Application()
+        app.router.add_get('/{host}/{n}', handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        config = spider.RequestConfig(concurrency=args.concurrency, retries=0, accept_encoding=preferred)
+        window = asyncio.Semaphore(args.concurrency)
+        mismatched = 0
+
+        async def fetch(client, key):
+            nonlocal mismatched
+            async with window:
+                response = await client.fetch(f"http://127.0.0.1:{port}/{key[0]}/{key[1]}")
+                mismatched += response is None or response.body != bodies[key]
+
+        async with spider.AsyncHttpClient(config) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(fetch(client, key) for key in pages))
+            elapsed = time.perf_counter() - start
+        await runner.cleanup()
+        return {
+            'accept_encoding': spider.AsyncHttpClient.accept_encoding(preferred),
+            'wire_mb': round(sent / 2 ** 20, 2),
+            'wire_ratio': round(sent / raw_bytes, 3),
+            'pages_per_sec': round(len(pages) / elapsed),
+            'mismatched_bodies': mismatched,
+        }
+
+    async def cache(compression, dictionary_samples):
+        with tempfile.TemporaryDirectory() as tmp:
+            # 内存层只放得下极少条目：读路径走磁盘层
+            config = spider.CacheConfig(disk_dir=tmp, memory_bytes=1, compression=compression,
+                                        dictionary_samples=dictionary_samples,
+                                        offload_bytes=args.offload_bytes)
+            tiered = spider.TieredCache(config)
+            stats = tiered.codec.stats
+            for i, key in enumerate(pages):
+                await tiered.set(f"http://site{key[0]}.bench/page/{key[1]}",
+                                 spider.CachedResponse(bodies[key], {'ETag': f'"{i}"'}))
+                if i % 64 == 0:
+                    await asyncio.sleep(0)  # 让后台训练好的字典生效
+            await asyncio.gather(*tiered.codec.training)
+            first_pass = stats['stored_bytes'] / raw_bytes
+            disk = sum(path.stat().st_size for path in Path(tmp).glob('*.seg'))
+
+            # 第二遍（如重新抓取后覆盖写入）：字典已就绪，反映长期运行时的压缩率与写入开销
+            stored = stats['stored_bytes']
+            start = time.perf_counter()
+            for i, key in enumerate(pages):
+                await tiered.set(f"http://site{key[0]}.bench/page/{key[1]}",
+                                 spider.CachedResponse(bodies[key], {'ETag': f'"{i}"'}))
+            write_seconds = time.perf_counter() - start
+            steady = (stats['stored_bytes'] - stored) / raw_bytes
+
+            sample = random.Random(1).sample(pages, min(len(pages), args.reads))
+            responses = []
+            start = time.perf_counter()
+            for key in sample:
+                responses.append(await tiered.get(f"http://site{key[0]}.bench/page/{key[1]}"))
+            lookup_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            mismatched = sum(response.body != bodies[key] for response, key in zip(responses, sample))
+            decode_seconds = time.perf_counter() - start
+            await tiered.close()
+        return {
+            'first_pass_disk_mb': round(disk / 2 ** 20, 2),
+            'first_pass_ratio': round(first_pass, 3),
+            'steady_ratio': round(steady, 3),
+            'dictionaries': stats['dictionaries'],
+            'write_us_per_page': round(write_seconds / len(pages) * 1e6, 1),
+            'lookup_us_per_page': round(lookup_seconds / len(sample) * 1e6, 1),
+            'decode_us_per_page': round(decode_seconds / len(sample) * 1e6, 1),
+            'mismatched_bodies': mismatched,
+        }
+
+    _report('compression', {
+        'pages': args.pages,
+        'hosts': args.hosts,
+        'raw_mb': round(raw_bytes / 2 ** 20, 2),
+        'avg_page_kb': round(raw_bytes / len(pages) / 1024, 1),
+        'transfer': {
+            'identity': asyncio.run(transfer(['identity'])),
+            'gzip': asyncio.run(transfer(['gzip', 'deflate'])),
+            'negotiated': asyncio.run(transfer(spider.RequestConfig().accept_encoding)),
+        },
+        'cache': {
+            'none': asyncio.run(cache('none', 0)),
+            'zlib': asyncio.run(cache('zlib', 0)),
+            'zstd': asyncio.run(cache('zstd', 0)),
+            'zstd_host_dictionary': asyncio.run(cache('zstd', args.dictionary_samples)),
+        },
+    })
+
+
+# ----------------------
+# 断点续爬
+# ----------------------
+
+def bench_checkpoint(args):
+    """断点续爬：截取状态占用事件循环的时间、全量/增量检查点耗时与恢复耗时"""
+    def url(i):
+        return f"https://host{i % 997}.example/page/{i}"
+
+    async def nothing():
+        pass
+
+    async def run(tmp):
+        frontier_config = spider.FrontierConfig(
+            directory=f"{tmp}/frontier", expected_urls=args.urls * 2, hot_capacity=args.hot_capacity
+        )
+        checkpoint_config = spider.CheckpointConfig(enabled=True, directory=f"{tmp}/checkpoint")
+
+        frontier = spider.UrlFrontier(frontier_config, checkpoint=True)
+        scheduler = spider.HostScheduler(frontier, spider.SchedulerConfig(), (0, 0))
+        checkpointer = spider.Checkpointer(checkpoint_config, frontier, scheduler, nothing)
+        # 模拟长时间爬取后的状态：大部分URL已处理，剩余 pending 个待抓取
+        for i in range(args.urls):
+            frontier.add(url(i))
+        for _ in range(args.urls - args.pending):
+            frontier.pop()
+            frontier.task_done()
+        await checkpointer.checkpoint()
+        first = dict(checkpointer.stats)
+
+        for i in range(args.urls, args.urls + args.urls // 10):
+            frontier.add(url(i))
+        await checkpointer.checkpoint()
+        second = dict(checkpointer.stats)
+        frontier.close()
+        await checkpointer.close()
+
+        start = time.perf_counter()
+        frontier = spider.UrlFrontier(frontier_config, checkpoint=True, resume=True)
+        scheduler = spider.HostScheduler(frontier, spider.SchedulerConfig(), (0, 0))
+        spider.Checkpointer(checkpoint_config, frontier, scheduler, nothing).restore()
+        restore = time.perf_counter() - start
+        queued = len(frontier)
+        duplicate_rejected = not frontier.add(url(0))
+        frontier.close()
+        return first, second, restore, queued, duplicate_rejected
+
+    with tempfile.TemporaryDirectory() as tmp:
+        first, second, restore, queued, duplicate_rejected = asyncio.run(run(tmp))
+    _report('checkpoint', {
+        'seen_urls': args.urls + args.urls // 10,
+        'full_checkpoint_s': round(first['last_seconds'], 3),
+        'full_capture_ms': round(first['last_capture_seconds'] * 1000, 2),
+        'incremental_checkpoint_s': round(second['last_seconds'], 3),
+        'incremental_capture_ms': round(second['last_capture_seconds'] * 1000, 2),
+        'restore_s': round(restore, 3),
+        'restored_queue': queued,
+        'dedup_survives_restore': duplicate_rejected,
+    })
+
+
+# ----------------------
+# 启动开销
+# ----------------------
+
+# 子进程中执行：冷启动导入爬虫模块并构造引擎，输出各阶段耗时与已加载的可选依赖
+STARTUP_SCRIPT = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import 可扩展版爬虫程序 as spider
+imported = time.perf_counter()
+tmp, optional = sys.argv[1], sys.argv[2].split(',')
+config = spider.SpiderConfig(
+    name='startup', start_urls=[], request=spider.RequestConfig(), pipelines=['json'], metrics_port=None,
+    frontier=spider.FrontierConfig(directory=tmp + '/frontier'),
+    cache=spider.CacheConfig(disk_dir=tmp + '/cache'),
+    storage=spider.StorageConfig(directory=tmp + '/output'),
+)
+container = spider.Container()
+container.config.from_dict(config.dict())
+engine = spider.SpiderEngine(container)
+built = time.perf_counter()
+
+async def first_get():
+    start = time.perf_counter()
+    await engine.cache.get('https://startup.example/')
+    elapsed = time.perf_counter() - start
+    await engine.cache.close()
+    return elapsed
+
+first_get_seconds = asyncio.run(first_get())
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'engine_ms': (built - imported) * 1000,
+    'first_cache_get_ms': first_get_seconds * 1000,
+    'loaded': [name for name in optional if name in sys.modules],
+}))
+"""
+
+STARTUP_OPTIONAL = ('redis', 'zstandard', 'pyarrow', 'pandas')
+
+
+def _import_times(cwd: str) -> dict:
+    """-X importtime：爬虫模块的总导入耗时与其直接导入的各模块耗时（毫秒）"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import 可扩展版爬虫程序'],
+                            cwd=cwd, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, name = line.split('|')
+            rows.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative) / 1000))
+    # 子模块的行先于父模块输出：从爬虫模块所在行往回取缩进深一级的行，直到上一个顶层导入
+    position = next(i for i, (_, name, _) in enumerate(rows) if name == '可扩展版爬虫程序')
+    depth = rows[position][0]
+    times = {'可扩展版爬虫程序': rows[position][2]}
+    for indent, name, cumulative in reversed(rows[:position]):
+        if indent <= depth:
+            break
+        if indent == depth + 2:
+            times[name] = cumulative
+    return times
+
+
+def bench_startup(args):
+    """冷启动：导入耗时（-X importtime 按模块拆分）、引擎构造耗时与加载了哪些可选依赖；
+    预置磁盘缓存时索引回放不在构造期间进行，而是推迟到首次访问"""
+    cwd = str(Path(spider.__file__).resolve().parent)
+    runs = [_import_times(cwd) for _ in range(args.repeat)]
+    total = statistics.median(run.pop('可扩展版爬虫程序') for run in runs)
+    modules = {name: statistics.median(run.get(name, 0.0) for run in runs) for name in runs[0]}
+    top = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+    def launch(tmp) -> dict:
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, tmp, ','.join(STARTUP_OPTIONAL)],
+                                    cwd=cwd, capture_output=True, text=True, check=True).stdout
+            samples.append({**json.loads(output), 'process_ms': (time.perf_counter() - start) * 1000})
+        result = {key: round(statistics.median(sample[key] for sample in samples), 1)
+                  for key in ('process_ms', 'import_ms', 'engine_ms', 'first_cache_get_ms')}
+        result['optional_loaded'] = samples[0]['loaded']
+        return result
+
+    async def fill_cache(directory: str):
+        cache = spider.DiskCache(directory)
+        value = os.urandom(args.value_bytes)
+        for i in range(args.cache_entries):
+            await cache.set(f"https://host{i % 997}.example/page/{i}", value)
+        await cache.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cold = launch(tmp)
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(fill_cache(f"{tmp}/cache"))
+        warm = launch(tmp)
+
+    _report('startup', {
+        'python': sys.version.split()[0],
+        'import_ms': round(total, 1),
+        'top_imports_ms': {name: round(ms, 1) for name, ms in top},
+        'empty_cache': cold,
+        'cache_entries': args.cache_entries,
+        'warm_cache': warm,
+    })
+
+
+
+# ----------------------
+# 端到端爬取（本地模拟站点）
+# ----------------------
+
+class MockSite:
+    """合成站点图：页面 n 属于虚拟主机 n % hosts，链接到 fanout 个伪随机页面和下一页
+
+    页面内容、链接和是否出错都由 (seed, n) 决定，同样的参数每次生成同一个站点；正文
+    由按种子生成的词语料中随机位置的短片段拼成，不同页面几乎不共享连续词序列。比例为 duplicate_rate 的页面是某个更早页面的
+    近重复副本（同样的正文和链接，只多了会话号和“打印版”字样）。比例为 listing_rate 的页面
+    是标签/分页列表页（URL 为 /tag/n?page=k，锚文本为“next »”），其余是正文页。
+    robots 非空时各主机的 /robots.txt 返回该文本，否则返回 404。
+    编号小于 down_hosts 的主机整体宕机：等待 down_latency 秒后返回 503。
+    capacity > 0 时服务端同时只处理 capacity 个请求，超出的立即返回 503（限流）；
+    swing > 1 时平均延迟每 swing_period 秒在 latency 与 latency * swing 之间切换。
+    """
+
+    def __init__(self, pages: int, hosts: int, fanout: int, page_kb: float,
+                 latency: float, error_rate: float, seed: int = 7,
+                 down_hosts: int = 0, down_latency: float = 1.0,
+                 capacity: int = 0, swing: float = 1.0, swing_period: float = 5.0,
+                 duplicate_rate: float = 0.0, listing_rate: float = 0.0, robots: str = ''):
+        self.pages = pages
+        self.hosts = hosts
+        self.fanout = fanout
+        self.page_bytes = int(page_kb * 1024)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.down_hosts = down_hosts
+        self.down_latency = down_latency
+        self.capacity = capacity
+        self.swing = swing
+        self.swing_period = swing_period
+        self.duplicate_rate = duplicate_rate
+        self.listing_rate = listing_rate
+        self.robots = robots
+        self.active = 0
+        self.started = None
+        rng = random.Random(seed)
+        vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 9)))
+                      for _ in range(5_000)]
+        self.corpus = ' '.join(rng.choice(vocabulary) for _ in range(200_000))
+
+    def url(self, port: int, n: int) -> str:
+        if self.listing(n):
+            return f"http://site{n % self.hosts}.bench:{port}/tag/{n}?page={n % 20 + 2}"
+        return f"http://site{n % self.hosts}.bench:{port}/page/{n}"
+
+    def listing(self, n: int) -> bool:
+        return n > 0 and random.Random(self.seed * 131 + n).random() < self.listing_rate
+
+    def useful(self, n: int) -> bool:
+        """正文页且能正常返回（起始页算作正文页）"""
+        return n < self.pages and not self.listing(n) and not self.failing(n) and not self.down(n)
+
+    def links(self, n: int) -> List[int]:
+        rng = random.Random(self.seed * 1_000_003 + n)
+        return [(n + 1) % self.pages] + [rng.randrange(self.pages) for _ in range(self.fanout)]
+
+    def failing(self, n: int) -> bool:
+        return random.Random(self.seed * 7_919 + n).random() < self.error_rate
+
+    def duplicate_of(self, n: int) -> Optional[int]:
+        """页面 n 若是近重复副本，返回原页面编号（副本的副本追溯到原页面）"""
+        source = None
+        while n:
+            rng = random.Random(self.seed * 31 + n)
+            if rng.random() >= self.duplicate_rate:
+                break
+            source = n = rng.randrange(n)
+        return source
+
+    def render(self, port: int, n: int) -> bytes:
+        source = self.duplicate_of(n)
+        variant = '' if source is None else f'<!-- session {n} --><p>printer friendly version</p>'
+        source = n if source is None else source
+        anchors = ''.join(
+            f'<a href="{self.url(port, link)}">{"next &raquo;" if self.listing(link) else f"page {link}"}</a>'
+            for link in self.links(source)
+        )
+        head = f'<html><head><title>Page {source}</title></head><body><nav>{anchors}</nav>{variant}'
+        filler = max(0, self.page_bytes - len(head) - 20)
+        rng = random.Random(self.seed * 17 + source)
+        chunks = (self.corpus[start:start + 120]
+                  for start in (rng.randrange(len(self.corpus) - 120) for _ in range(filler // 120 + 1)))
+        return f'{head}<p>{" ".join(chunks)[:filler]}</p></body></html>'.encode()
+
+    def down(self, n: int) -> bool:
+        return n % self.hosts < self.down_hosts
+
+    def current_latency(self) -> float:
+        """当前阶段的平均延迟（从第一个请求开始计时）"""
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        if self.swing > 1 and int((now - self.started) / self.swing_period) % 2:
+            return self.latency * self.swing
+        return self.latency
+
+    async def handle_robots(self, request):
+        await asyncio.sleep(self.latency)
+        if not self.robots:
+            return web.Response(status=404)
+        return web.Response(text=self.robots, content_type='text/plain')
+
+    async def handle(self, request):
+        n = int(request.match_info['n'])
+        if self.down(n):
+            await asyncio.sleep(self.down_latency)
+            return web.Response(status=503)
+        if self.capacity and self.active >= self.capacity:
+            return web.Response(status=503)
+        self.active += 1
+        try:
+            latency = self.current_latency()
+            if latency:
+                # 指数分布的服务端延迟，均值为当前阶段延迟
+                await asyncio.sleep(random.expovariate(1 / latency))
+        finally:
+            self.active -= 1
+        if n >= self.pages or self.failing(n):
+            return web.Response(status=500 if n < self.pages else 404)
+        return web.Response(body=self.render(request.url.port, n), content_type='text/html')
+
+
+def serve_mock_site(site: MockSite, ports):
+    """子进程入口：在随机端口上启动模拟站点，把端口号回传给父进程"""
+    async def main():
+        app = web.Application()
+        app.router.add_get('/page/{n}', site.handle)
+        app.router.add_get('/tag/{n}', site.handle)
+        app.router.add_get('/robots.txt', site.handle_robots)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        server = web.TCPSite(runner, '127.0.0.1', 0)
+        await server.start()
+        ports.put(server._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+class MockResolver(AbstractResolver):
+    """所有虚拟主机都解析到本机"""
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        return [{'hostname': host, 'host': '127.0.0.1', 'port': port,
+                 'family': socket.AF_INET, 'proto': 0, 'flags': socket.AI_NUMERICHOST}]
+
+    async def close(self):
+        pass
+
+
+class TimedHttpClient(spider.AsyncHttpClient):
+    """记录每次抓取耗时与顺序的客户端（通过容器覆盖注入引擎）"""
+
+    def __init__(self, config, resolver=None):
+        super().__init__(config, resolver)
+        self.samples = []
+        self.urls = []
+        self.started = []
+        self.failures = 0
+
+    async def request(self, url, cached=None, consumer=None, retain=True, truncate=None):
+        started = time.perf_counter()
+        self.urls.append(url)
+        self.started.append(started)
+        response, outcome = await super().request(url, cached, consumer, retain, truncate)
+        self.samples.append(time.perf_counter() - started)
+        self.failures += response is None or not response.body
+        return response, outcome
+
+
+def _percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def start_mock_site(site: MockSite):
+    """在子进程中启动模拟站点，返回 (进程, 端口)"""
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_mock_site, args=(site, ports), daemon=True)
+    process.start()
+    return process, ports.get(timeout=30)
+
+
+def crawl_config(args, tmp: str, port: int, site: MockSite, request: dict = None,
+                 **overrides) -> spider.SpiderConfig:
+    """指向模拟站点的引擎配置：关闭指标端点、缓存和 robots.txt，所有状态写入临时目录"""
+    values = dict(
+        name='bench',
+        start_urls=[site.url(port, site.down_hosts)],
+        request=spider.RequestConfig(**{
+            'concurrency': args.concurrency, 'retries': 0, 'delay_range': (0, args.delay),
+            'limit_per_host': args.concurrency, **(request or {})
+        }),
+        frontier=spider.FrontierConfig(directory=f"{tmp}/frontier", expected_urls=max(args.pages * 2, 1000)),
+        parse=spider.ParseConfig(workers=args.parse_workers),
+        pipelines=['json'],
+        storage=spider.StorageConfig(directory=f"{tmp}/output"),
+        cache_enabled=False,
+        robots=spider.RobotsConfig(enabled=False),
+        metrics_port=None,
+    )
+    values.update(overrides)
+    return spider.SpiderConfig(**values)
+
+
+def run_engine(config: spider.SpiderConfig,
+               observe: Optional[Callable[[spider.SpiderEngine, 'TimedHttpClient'], dict]] = None,
+               prepare: Optional[Callable[[spider.SpiderEngine], None]] = None) -> dict:
+    """用真实引擎跑完一次爬取，返回吞吐、抓取延迟分位数与资源占用
+
+    prepare(引擎) 在启动前调用（替换组件、注册采样函数）；observe(引擎, 客户端) 返回的
+    额外指标并入结果。
+    """
+    container = spider.Container()
+    container.config.from_dict(config.dict())
+    container.resolver.override(providers.Singleton(MockResolver))
+    container.http_client.override(providers.Singleton(
+        TimedHttpClient,
+        config=providers.Callable(spider.RequestConfig.parse_obj, container.config.request),
+        resolver=container.resolver
+    ))
+
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    start = time.perf_counter()
+    engine = spider.SpiderEngine(container)
+    if prepare is not None:
+        prepare(engine)
+    asyncio.run(engine.run())
+    elapsed = time.perf_counter() - start
+    cpu = sum(
+        (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+        for before, after in zip(usage, (resource.getrusage(resource.RUSAGE_SELF),
+                                         resource.getrusage(resource.RUSAGE_CHILDREN)))
+    )
+
+    client = container.http_client()
+    client_stats = client.stats
+    lag = engine.monitor.stats
+    fetched = len(client.samples)
+    stored = sum(1 for _ in open(Path(config.storage.directory) / f"{config.name}.jsonl", 'rb'))
+    result = {
+        'pages_fetched': fetched,
+        'pages_stored': stored,
+        'fetch_failures': client.failures,
+        'elapsed_s': round(elapsed, 2),
+        'pages_per_sec': round(fetched / elapsed, 1),
+        'fetch_p50_ms': round(_percentile(client.samples, 0.5) * 1000, 2),
+        'fetch_p99_ms': round(_percentile(client.samples, 0.99) * 1000, 2),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'cpu_ms_per_page': round(cpu / max(fetched, 1) * 1000, 3),
+        'loop_lag_mean_ms': round(lag['total_lag'] / max(lag['samples'], 1) * 1000, 2),
+        'loop_lag_max_ms': round(lag['max_lag'] * 1000, 2),
+        'retries': client_stats['retries'],
+        'retries_denied': client_stats['retries_denied'],
+        'short_circuited': client_stats['short_circuited'],
+    }
+    if observe is not None:
+        result.update(observe(engine, client))
+    return result
+
+
+def bench_crawl(args):
+    """端到端：真实引擎爬取本地模拟站点，输出可跨版本对比的JSON"""
+    site = MockSite(args.pages, args.hosts, args.fanout, args.page_kb, args.latency, args.error_rate, args.seed)
+    server, port = start_mock_site(site)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            result = run_engine(crawl_config(args, tmp, port, site))
+    finally:
+        server.terminate()
+
+    report = {
+        'site': {
+            'pages': args.pages, 'hosts': args.hosts, 'fanout': args.fanout, 'page_kb': args.page_kb,
+            'latency_ms': args.latency * 1000, 'error_rate': args.error_rate, 'seed': args.seed,
+        },
+        'engine': {'concurrency': args.concurrency, 'parse_workers': args.parse_workers, 'delay': args.delay},
+        **result,
+    }
+    _report('crawl', report)
+    if args.output:
+        Path(args.output).write_text(json.dumps({'benchmark': 'crawl', **report}, indent=2), 'utf-8')
+
+
+def bench_breaker(args):
+    """主机宕机时的熔断与重试预算：对比不熔断、不限重试的配置"""
+    site = MockSite(args.pages, args.hosts, args.fanout, args.page_kb, args.latency, 0.0, args.seed,
+                    down_hosts=args.down_hosts, down_latency=args.down_latency)
+    healthy = sum(1 for n in range(args.pages) if not site.down(n))
+    variants = {
+        'unprotected': {'retries': args.retries, 'breaker_failures': 0,
+                        'retry_budget_ratio': 1.0, 'retry_budget_burst': 1e9},
+        'breaker_and_budget': {'retries': args.retries, 'breaker_cooldown': args.cooldown,
+                               'breaker_give_up': args.give_up},
+    }
+    server, port = start_mock_site(site)
+    results = {}
+    try:
+        for name, request in variants.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                result = run_engine(crawl_config(args, tmp, port, site, request=request))
+            result['healthy_pages_per_sec'] = round(result['pages_stored'] / result['elapsed_s'], 1)
+            results[name] = result
+    finally:
+        server.terminate()
+    _report('breaker', {
+        'pages': args.pages, 'healthy_pages': healthy, 'hosts': args.hosts,
+        'down_hosts': args.down_hosts, 'down_latency_s': args.down_latency, 'retries': args.retries,
+        **results,
+    })
+
+
+def bench_concurrency(args):
+    """服务端容量有限且延迟周期变化时：固定并发与 AIMD 自适应并发的稳态吞吐"""
+    site = MockSite(args.pages, args.hosts, args.fanout, args.page_kb, args.latency, args.error_rate, args.seed,
+                    capacity=args.capacity, swing=args.swing, swing_period=args.swing_period)
+    variants = {
+        f'fixed_{args.concurrency}': spider.AdaptiveConfig(adaptive=False),
+        f'fixed_{args.capacity}': spider.AdaptiveConfig(adaptive=False),
+        'aimd': spider.AdaptiveConfig(initial=args.initial, host_maximum=args.host_maximum),
+    }
+    healthy = sum(1 for n in range(args.pages) if not site.failing(n))
+    results = {}
+    for name, adaptive in variants.items():
+        # 每个变体用新的站点进程，延迟阶段从头开始
+        server, port = start_mock_site(site)
+        try:
+            request = {'retries': args.retries}
+            if name == f'fixed_{args.capacity}':
+                request['concurrency'] = args.capacity
+            with tempfile.TemporaryDirectory() as tmp:
+                result = run_engine(crawl_config(args, tmp, port, site, request=request, concurrency=adaptive))
+        finally:
+            server.terminate()
+        result['stored_pages_per_sec'] = round(result['pages_stored'] / result['elapsed_s'], 1)
+        result['completeness'] = round(result['pages_stored'] / healthy, 3)
+        results[name] = result
+    _report('concurrency', {
+        'pages': args.pages, 'healthy_pages': healthy, 'hosts': args.hosts, 'capacity': args.capacity,
+        'latency_ms': args.latency * 1000, 'swing': args.swing, 'swing_period_s': args.swing_period,
+        **results,
+    })
+
+
+def bench_dedup(args):
+    """近重复检测：指纹与查询耗时、索引内存、检出率，以及开启后端到端省下的解析与存储"""
+    site = MockSite(args.pages, args.hosts, args.fanout, args.page_kb, args.latency, args.error_rate, args.seed,
+                    duplicate_rate=args.duplicate_rate)
+    config = spider.DedupConfig()
+
+    # 检出率：按站点生成顺序检查，对照已知的副本
+    index = spider.NearDuplicateIndex(config)
+    pages = [(n, site.render(0, n)) for n in range(args.pages)]
+    start = time.perf_counter()
+    fingerprints = [(n, spider.simhash(body, config)) for n, body in pages]
+    fingerprint_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    flagged = {n for n, fingerprint in fingerprints if index.check(fingerprint)}
+    check_seconds = time.perf_counter() - start
+    actual = {n for n in range(args.pages) if site.duplicate_of(n) is not None}
+
+    # 大索引上的查询耗时与每个指纹的内存
+    rng = random.Random(args.seed)
+    big = spider.NearDuplicateIndex(config)
+    for _ in range(args.fingerprints):
+        big.add(rng.getrandbits(64))
+    probes = [rng.getrandbits(64) for _ in range(10_000)]
+    start = time.perf_counter()
+    for fingerprint in probes:
+        big.find(fingerprint)
+    find_seconds = time.perf_counter() - start
+    bytes_per_fingerprint = big.nbytes / len(big)
+    del big
+
+    variants = {'dedup_off': spider.DedupConfig(enabled=False), 'dedup_on': config}
+    crawls = {}
+    server, port = start_mock_site(site)
+    try:
+        for name, dedup in variants.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                crawls[name] = run_engine(crawl_config(args, tmp, port, site, dedup=dedup))
+    finally:
+        server.terminate()
+
+    _report('dedup', {
+        'pages': args.pages,
+        'page_kb': args.page_kb,
+        'duplicate_rate': args.duplicate_rate,
+        'fingerprint_us_per_page': round(fingerprint_seconds / args.pages * 1e6, 1),
+        'check_us_per_page': round(check_seconds / args.pages * 1e6, 1),
+        'duplicates_actual': len(actual),
+        'duplicates_detected': len(flagged & actual),
+        'false_positives': len(flagged - actual),
+        'index_fingerprints': args.fingerprints,
+        'find_us': round(find_seconds / len(probes) * 1e6, 2),
+        'bytes_per_fingerprint': round(bytes_per_fingerprint, 1),
+        'projected_mb_at_capacity': round(bytes_per_fingerprint * config.capacity / 2 ** 20),
+        **crawls,
+    })
+
+
+def bench_priority(args):
+    """优先级队列：百万级条目的入队/出队吞吐，以及聚焦抓取时每千次抓取的有价值页面数"""
+    rng = random.Random(args.seed)
+    urls = [f"https://host{i % 997}.example/{'tag' if rng.random() < args.listing_rate else 'page'}/{i}"
+            for i in range(args.urls)]
+    frontier_ops = {}
+    for name, levels in (('fifo', 1), ('scored', spider.FrontierConfig().priority_levels)):
+        with tempfile.TemporaryDirectory() as tmp:
+            frontier = spider.UrlFrontier(
+                spider.FrontierConfig(directory=tmp, expected_urls=args.urls, priority_levels=levels),
+                scorer=spider.UrlScorer(spider.ScoringConfig())
+            )
+            start = time.perf_counter()
+            for i, url in enumerate(urls):
+                frontier.add(url, i % 8)
+            enqueue = time.perf_counter() - start
+            start = time.perf_counter()
+            while frontier.pop() is not None:
+                pass
+            dequeue = time.perf_counter() - start
+            frontier.close()
+        frontier_ops[name] = {
+            'enqueue_ops_per_sec': round(args.urls / enqueue),
+            'dequeue_ops_per_sec': round(args.urls / dequeue),
+        }
+
+    site = MockSite(args.pages, args.hosts, args.fanout, args.page_kb, args.latency, args.error_rate, args.seed,
+                    listing_rate=args.listing_rate)
+    page_number = re.compile(r'/(?:page|tag)/(\d+)')
+
+    def useful(engine, client) -> dict:
+        first = client.urls[:args.budget]
+        hits = sum(site.useful(int(page_number.search(url).group(1))) for url in first)
+        return {'useful_per_1000_fetches': round(hits / max(len(first), 1) * 1000, 1)}
+
+    # 调度器缓冲按并发数收紧：否则小站点的全部URL一进缓冲就与优先级无关了
+    scheduler = spider.SchedulerConfig(buffer_size=args.buffer)
+    variants = {
+        'fifo': spider.FrontierConfig(priority_levels=1),
+        'scored': spider.FrontierConfig(),
+    }
+    crawls = {}
+    server, port = start_mock_site(site)
+    try:
+        for name, frontier in variants.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                frontier = frontier.copy(update={'directory': f"{tmp}/frontier", 'expected_urls': args.pages * 2})
+                crawls[name] = run_engine(
+                    crawl_config(args, tmp, port, site, frontier=frontier, scheduler=scheduler),
+                    useful
+                )
+    finally:
+        server.terminate()
+
+    _report('priority', {
+        'pages': args.pages,
+        'listing_rate': args.listing_rate,
+        'useful_pages': sum(map(site.useful, range(args.pages))),
+        'budget': args.budget,
+        'frontier_urls': args.urls,
+        'frontier': frontier_ops,
+        **crawls,
+    })
+
+
+def sample_robots(rules: int, crawl_delay: float = 0.0) -> str:
+    """规模可调的 robots.txt：目录前缀、Allow 例外、通配符与 $ 结尾规则，外加其他爬虫的组"""
+    lines = ['User-agent: Googlebot', 'Disallow: /nogoogle/', '', 'User-agent: *']
+    for i in range(rules // 4):
+        lines += [f'Disallow: /section{i}/private/', f'Allow: /section{i}/private/public/',
+                  f'Disallow: /*/archive{i}/*?sessionid=', f'Disallow: /files{i}/*.pdf$']
+    if crawl_delay:
+        lines.append(f'Crawl-delay: {crawl_delay}')
+    lines.append('Sitemap: https://www.example.com/sitemap.xml')
+    return '\n'.join(lines) + '\n'
+
+
+def bench_robots(args):
+    """robots.txt：编译后的单次正则匹配与每次重新解析、标准库逐条扫描的对比；
+    以及端到端的合并抓取、禁止规则与 Crawl-delay"""
+    text = sample_robots(args.rules)
+    rng = random.Random(args.seed)
+    paths = [rng.choice([f'/section{rng.randrange(args.rules)}/private/public/{i}',
+                         f'/section{rng.randrange(args.rules)}/private/{i}',
+                         f'/blog/archive{rng.randrange(args.rules)}/{i}?sessionid=1',
+                         f'/files{rng.randrange(args.rules)}/{i}.pdf',
+                         f'/articles/{i}.html'])
+             for i in range(args.checks)]
+
+    start = time.perf_counter()
+    rules = spider.RobotsRules.parse(text, 'hyperspider')
+    compile_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    allowed = sum(map(rules.allowed, paths))
+    compiled = time.perf_counter() - start
+
+    sample = paths[:max(1, args.checks // 100)]
+    start = time.perf_counter()
+    for path in sample:
+        spider.RobotsRules.parse(text, 'hyperspider').allowed(path)
+    reparse = time.perf_counter() - start
+
+    parser = robotparser.RobotFileParser()
+    parser.parse(text.splitlines())
+    start = time.perf_counter()
+    for path in sample:
+        parser.can_fetch('HyperSpider', 'https://www.example.com' + path)
+    stdlib = time.perf_counter() - start
+
+    site = MockSite(args.pages, args.hosts, args.fanout, args.page_kb, args.latency, args.error_rate, args.seed,
+                    listing_rate=args.listing_rate,
+                    robots=f'User-agent: *\nDisallow: /tag/\nCrawl-delay: {args.crawl_delay}\n')
+
+    def observe(engine, client) -> dict:
+        pages = [(url, started) for url, started in zip(client.urls, client.started)
+                 if not url.endswith('/robots.txt')]
+        by_host = defaultdict(list)
+        for url, started in pages:
+            by_host[spider.HostScheduler.host_of(url)].append(started)
+        gaps = [later - earlier for times in by_host.values() for earlier, later in zip(times, times[1:])]
+        return {
+            'robots_requests': len(client.urls) - len(pages),
+            'robots_collapsed': engine.robots.stats['collapsed'],
+            'disallowed_fetched': sum('/tag/' in url for url, _ in pages),
+            'rejected_before_queue': engine.frontier.stats['rejected'],
+            'disallowed_at_fetch': engine.robots.stats['disallowed'],
+            'min_host_gap_s': round(min(gaps), 3) if gaps else None,
+        }
+
+    # 主机内允许并发，同一主机的多个工作协程会同时查询 robots.txt
+    adaptive = spider.AdaptiveConfig(host_maximum=args.host_maximum, adaptive=False)
+    server, port = start_mock_site(site)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            crawl = run_engine(crawl_config(
+                args, tmp, port, site, robots=spider.RobotsConfig(), concurrency=adaptive
+            ), observe)
+    finally:
+        server.terminate()
+
+    _report('robots', {
+        'rules': args.rules,
+        'compile_ms': round(compile_ms, 2),
+        'compiled_checks_per_sec': round(len(paths) / compiled),
+        'reparse_checks_per_sec': round(len(sample) / reparse),
+        'stdlib_checks_per_sec': round(len(sample) / stdlib),
+        'allowed_share': round(allowed / len(paths), 3),
+        'hosts': args.hosts,
+        'crawl_delay_s': args.crawl_delay,
+        'crawl': crawl,
+    })
+
+
+# ----------------------
+# 站点地图播种
+# ----------------------
+
+class MockSitemaps:
+    """合成的大型站点地图：一个索引 + files 个 gzip 子文件，每个 urls_per_file 条 <url>
+
+    第 1 代所有页面的 lastmod 都早于 BASE。advance() 生成第 2 代：编号最小的 changed
+    比例的页面（集中在前几个子文件，如同新内容总写进最新的站点地图）lastmod 改为当前
+    时间，这些子文件在索引中的 lastmod 随之更新，其余子文件不变。
+    """
+    BASE = 1_700_000_000
+
+    def __init__(self, files: int, urls_per_file: int, changed: float):
+        self.files = files
+        self.urls_per_file = urls_per_file
+        self.changed = changed
+        self.modified_at = {}  # 子文件编号 -> 第 2 代的修改时间
+        self.bodies = {}
+
+    @staticmethod
+    def page(n: int) -> str:
+        return f"https://www{n % 50}.example.com/articles/{n // 50}/story-{n}.html"
+
+    @staticmethod
+    def w3c(timestamp: float) -> str:
+        return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='seconds')
+
+    def changed_page(self, n: int) -> bool:
+        return n < self.files * self.urls_per_file * self.changed
+
+    def file_body(self, index: int) -> bytes:
+        body = self.bodies.get(index)
+        if body is None:
+            modified = self.modified_at.get(index)
+            old = [self.w3c(self.BASE - hours * 3600) for hours in range(24)]
+            entries = ''.join(
+                f'<url><loc>{self.page(n)}</loc><lastmod>'
+                f'{self.w3c(modified) if modified is not None and self.changed_page(n) else old[n % 24]}'
+                f'</lastmod><changefreq>daily</changefreq></url>\n'
+                for n in range(index * self.urls_per_file, (index + 1) * self.urls_per_file)
+            )
+            body = self.bodies[index] = gzip.compress(
+                ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+                 f'{entries}</urlset>\n').encode(), compresslevel=6)
+        return body
+
+    def index_body(self, port: int) -> bytes:
+        entries = ''.join(
+            f'<sitemap><loc>http://127.0.0.1:{port}/sitemap-{i}.xml.gz</loc>'
+            f'<lastmod>{self.w3c(self.modified_at.get(i, self.BASE))}</lastmod></sitemap>\n'
+            for i in range(self.files)
+        )
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+                f'{entries}</sitemapindex>\n').encode()
+
+    def advance(self):
+        now = time.time()
+        for index in range(self.files):
+            if self.changed_page(index * self.urls_per_file):
+                self.modified_at[index] = now
+                self.bodies.pop(index, None)
+                self.file_body(index)
+
+    async def handle_index(self, request):
+        return web.Response(body=self.index_body(request.url.port), content_type='application/xml')
+
+    async def handle_file(self, request):
+        return web.Response(body=self.file_body(int(request.match_info['n'])),
+                            content_type='application/x-gzip')
+
+    async def handle_advance(self, request):
+        self.advance()
+        return web.Response(text='ok')
+
+
+def serve_sitemaps(site: MockSitemaps, ports):
+    """子进程入口：预先压缩好所有子文件，再在随机端口上提供站点地图"""
+    async def main():
+        for index in range(site.files):
+            site.file_body(index)
+        app = web.Application()
+        app.router.add_get('/sitemap_index.xml', site.handle_index)
+        app.router.add_get('/sitemap-{n}.xml.gz', site.handle_file)
+        app.router.add_post('/advance', site.handle_advance)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        server = web.TCPSite(runner, '127.0.0.1', 0)
+        await server.start()
+        ports.put(server._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def bench_sitemaps(args):
+    """站点地图播种：流式读取吞吐、背压下的队列积压、解析内存（对比整文件读入）
+    与按 lastmod 增量重读"""
+    site = MockSitemaps(args.files, args.urls_per_file, args.changed)
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve_sitemaps, args=(site, ports), daemon=True)
+    server.start()
+    port = ports.get(timeout=120)
+    root = f"http://127.0.0.1:{port}/sitemap_index.xml"
+    total = args.files * args.urls_per_file
+    links = spider.LinkExtractor(spider.LinkConfig())
+
+    async def ingest(tmp: str, config: spider.SitemapConfig, drain_rate: int) -> dict:
+        """读入真实的 UrlFrontier；同时按 drain_rate（0 表示不限）从队列取出，模拟抓取消耗"""
+        frontier = spider.UrlFrontier(spider.FrontierConfig(
+            directory=f"{tmp}/frontier", expected_urls=total * 2, hot_capacity=args.hot_capacity
+        ))
+        reader = spider.SitemapReader(config, spider.RequestConfig(), links.canonicalize)
+        peak, done = 0, False
+
+        async def drain():
+            nonlocal peak
+            while not done:
+                peak = max(peak, len(frontier))
+                for _ in range(drain_rate // 100 if drain_rate else len(frontier)):
+                    if frontier.pop() is None:
+                        break
+                await asyncio.sleep(0.01)
+
+        def emit(urls):
+            for url in urls:
+                frontier.add(url)
+
+        drainer = asyncio.create_task(drain())
+        start = time.perf_counter()
+        await reader.read([root], emit, lambda: len(frontier))
+        elapsed = time.perf_counter() - start
+        done = True
+        await drainer
+        reader.commit()
+        frontier.close()
+        stats = reader.stats
+        return {
+            'urls_queued': frontier.stats['added'],
+            'unchanged': stats['unchanged'],
+            'files_read': stats['files'],
+            'files_skipped': stats['skipped'],
+            'failed': stats['failed'],
+            'elapsed_s': round(elapsed, 2),
+            'urls_per_sec': round(stats['urls'] / elapsed),
+            'peak_backlog': peak,
+            'paused_s': round(stats['paused_seconds'], 2),
+        }
+
+    async def streaming_peak(files: int) -> int:
+        """只读前 files 个子文件（逐个读），返回读取器的内存峰值"""
+        config = spider.SitemapConfig(concurrency=1)
+        reader = spider.SitemapReader(config, spider.RequestConfig(), links.canonicalize)
+        roots = [f"http://127.0.0.1:{port}/sitemap-{i}.xml.gz" for i in range(files)]
+        tracemalloc.start()
+        await reader.read(roots, lambda urls: None)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    async def buffered_peak() -> int:
+        """对照：整个文件读入内存、一次性解压并建树"""
+        import xml.etree.ElementTree as ElementTree
+        tracemalloc.start()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/sitemap-0.xml.gz") as resp:
+                body = await resp.read()
+        tree = ElementTree.fromstring(gzip.decompress(body))
+        urls = [links.canonicalize(element.text) for element in tree.iter('{*}loc')]
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del tree, urls
+        return peak
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            state = f"{tmp}/sitemaps.json"
+            full = asyncio.run(ingest(tmp, spider.SitemapConfig(state_file=state), 0))
+            pressured = asyncio.run(ingest(tmp, spider.SitemapConfig(max_pending=args.max_pending), args.drain_rate))
+            urllib.request.urlopen(urllib.request.Request(f"http://127.0.0.1:{port}/advance", method='POST')).read()
+            recrawl = asyncio.run(ingest(tmp, spider.SitemapConfig(state_file=state), 0))
+        memory = {
+            'streaming_1_file_kb': round(asyncio.run(streaming_peak(1)) / 1024),
+            f'streaming_{args.memory_files}_files_kb': round(asyncio.run(streaming_peak(args.memory_files)) / 1024),
+            'buffered_1_file_kb': round(asyncio.run(buffered_peak()) / 1024),
+        }
+    finally:
+        server.terminate()
+
+    _report('sitemaps', {
+        'files': args.files,
+        'urls': total,
+        'full': full,
+        'backpressure': {'max_pending': args.max_pending, 'drain_per_sec': args.drain_rate, **pressured},
+        'recrawl': {'changed_share': args.changed, **recrawl},
+        'memory': memory,
+    })
+
+
+# ----------------------
+# 阶段间背压
+# ----------------------
+
+class SlowJsonPipeline(spider.JsonPipeline):
+    """限速的 JSON 存储：每个批次按 rate 行/秒 额外占用写线程，模拟慢速下游"""
+
+    def __init__(self, name: str, config: spider.StorageConfig, rate: float):
+        super().__init__(name, config)
+        self.rate = rate
+
+    def _write_batch(self, batch: List[bytes]):
+        time.sleep(len(batch) / self.rate)
+        super()._write_batch(batch)
+
+
+def _current_rss() -> int:
+    with open('/proc/self/statm', 'rb') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _backpressure_variant(args, port: int, site: MockSite, backpressure: dict, results):
+    """子进程入口：每个变体独占一个进程，峰值 RSS 互不干扰"""
+    with tempfile.TemporaryDirectory() as tmp:
+        if backpressure.pop('headroom_mb', None):
+            backpressure['memory_high'] = _current_rss() + args.headroom_mb * 1024 * 1024
+        config = crawl_config(
+            args, tmp, port, site,
+            parsing_rules={'body': r'<p>(.*?)</p>'},
+            storage=spider.StorageConfig(directory=f"{tmp}/output", batch_rows=args.batch_rows),
+            batch=spider.BatchConfig(size=args.batch_rows),
+            backpressure=spider.BackpressureConfig(**backpressure),
+        )
+        occupancy = defaultdict(list)
+
+        def sample_occupancy():
+            for stage in ('fetch', 'parse', 'collect', 'store'):
+                occupancy[stage].append(REGISTRY.get_sample_value('stage_occupancy', {'stage': stage}) or 0.0)
+
+        def prepare(engine: spider.SpiderEngine):
+            engine.storages = [SlowJsonPipeline(config.name, config.storage, args.store_rate)]
+            engine.monitor.add_sampler(sample_occupancy)
+
+        def observe(engine: spider.SpiderEngine, client) -> dict:
+            collector = engine.collector.stats
+            result = {
+                'max_collector_items': collector['max_held'],
+                'collector_waits': collector['waits'],
+                'collector_wait_s': round(collector['wait_seconds'], 2),
+                'occupancy_mean': {stage: round(statistics.fmean(values), 2)
+                                   for stage, values in occupancy.items() if values},
+            }
+            if engine.memory is not None:
+                memory = engine.memory.stats
+                result.update({
+                    'memory_high_mb': round(engine.memory.high / 2 ** 20, 1),
+                    'pauses': memory['pauses'],
+                    'paused_s': round(memory['paused_seconds'], 2),
+                })
+            return result
+
+        results.put(run_engine(config, observe, prepare))
+
+
+def bench_backpressure(args):
+    """存储慢于抓取时：不设上限的阶段间缓冲、有界通道、内存高水位暂停三者的峰值内存与吞吐"""
+    site = MockSite(args.pages, args.hosts, args.fanout, args.page_kb, args.latency, args.error_rate, args.seed)
+    unbounded = {'collect_capacity': 10 ** 9, 'store_batches': 10 ** 6}
+    variants = {
+        'unbounded': unbounded,
+        'bounded': {'collect_capacity': args.capacity, 'store_batches': args.store_batches},
+        'watermark': {**unbounded, 'headroom_mb': args.headroom_mb},
+    }
+    server, port = start_mock_site(site)
+    report = {}
+    try:
+        for name, backpressure in variants.items():
+            results = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_backpressure_variant, args=(args, port, site, backpressure, results)
+            )
+            process.start()
+            report[name] = results.get()
+            process.join()
+    finally:
+        server.terminate()
+    _report('backpressure', {
+        'pages': args.pages, 'page_kb': args.page_kb, 'store_rows_per_sec': args.store_rate,
+        'capacity': args.capacity, 'store_batches': args.store_batches, 'headroom_mb': args.headroom_mb,
+        **report,
+    })
+
+
+def add_mock_site_arguments(command):
+    """模拟站点与引擎的公共参数（其他端到端基准复用）"""
+    command.add_argument('--pages', type=int, default=5_000)
+    command.add_argument('--hosts', type=int, default=100)
+    command.add_argument('--fanout', type=int, default=8)
+    command.add_argument('--page-kb', type=float, default=16)
+    command.add_argument('--latency', type=float, default=0.02, help="服务端平均延迟（秒）")
+    command.add_argument('--error-rate', type=float, default=0.01)
+    command.add_argument('--seed', type=int, default=7)
+    command.add_argument('--concurrency', type=int, default=100)
+    command.add_argument('--parse-workers', type=int, default=0)
+    command.add_argument('--delay', type=float, default=0.0, help="同一主机两次请求的最小间隔（秒）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HyperSpider 基准测试")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    frontier = commands.add_parser('frontier', help="URL队列吞吐与内存")
+    frontier.add_argument('--urls', type=int, default=1_000_000)
+    frontier.add_argument('--hot-capacity', type=int, default=100_000)
+    frontier.set_defaults(func=bench_frontier)
+
+    scheduler = commands.add_parser('scheduler', help="按主机礼貌调度")
+    scheduler.add_argument('--urls', type=int, default=100_000)
+    scheduler.add_argument('--hosts', type=int, default=5_000)
+    scheduler.add_argument('--workers', type=int, default=1_000)
+    scheduler.add_argument('--latency', type=float, default=0.02)
+    scheduler.add_argument('--min-delay', type=float, default=0.05)
+    scheduler.add_argument('--max-delay', type=float, default=1.0)
+    scheduler.add_argument('--hot-urls', type=int, default=2_000, help="排在最前的大主机URL数")
+    scheduler.add_argument('--cold-hosts', type=int, default=100)
+    scheduler.add_argument('--cold-urls', type=int, default=5, help="每个小主机的URL数")
+    scheduler.add_argument('--hot-workers', type=int, default=200)
+    scheduler.add_argument('--hot-delay', type=float, default=0.2)
+    scheduler.add_argument('--hot-seconds', type=float, default=3.0)
+    scheduler.set_defaults(func=bench_scheduler)
+
+    disk_cache = commands.add_parser('disk-cache', help="磁盘缓存新旧实现对比")
+    disk_cache.add_argument('--entries', type=int, default=1_000_000)
+    disk_cache.add_argument('--value-bytes', type=int, default=512)
+    disk_cache.add_argument('--reads', type=int, default=100_000)
+    disk_cache.set_defaults(func=bench_disk_cache)
+
+    redis_cache = commands.add_parser('redis', help="Redis缓存合并流水线吞吐")
+    redis_cache.add_argument('--redis-url', help="真实Redis地址，如 redis://localhost:6379/0；默认使用进程内替身")
+    redis_cache.add_argument('--rtt', type=float, default=0.0005, help="替身模拟的往返延迟（秒）")
+    redis_cache.add_argument('--keys', type=int, default=50_000)
+    redis_cache.add_argument('--value-bytes', type=int, default=512)
+    redis_cache.add_argument('--concurrency', type=int, default=500)
+    redis_cache.add_argument('--window', type=float, default=0.002)
+    redis_cache.add_argument('--max-batch', type=int, default=512)
+    redis_cache.add_argument('--max-connections', type=int, default=32, help="连接池上限，与 redis_max_connections 一致")
+    redis_cache.add_argument('--request-cost', type=float, default=0.00002, help="替身服务端每个请求的处理时间（秒）")
+    redis_cache.add_argument('--command-cost', type=float, default=0.000001, help="替身服务端每条命令的处理时间（秒）")
+    redis_cache.set_defaults(func=bench_redis)
+
+    parse = commands.add_parser('parse', help="进程池解析阶段扩展性")
+    parse.add_argument('--pages', type=int, default=2_000)
+    parse.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parse.add_argument('--in-flight', type=int, default=64)
+    parse.set_defaults(func=bench_parse)
+
+    links = commands.add_parser('links', help="链接提取与URL规范化吞吐")
+    links.add_argument('--corpus', help="HTML页面目录（递归读取 *.htm*）；默认使用合成页面")
+    links.add_argument('--pages', type=int, default=2_000)
+    links.add_argument('--cache-size', type=int, default=65_536)
+    links.set_defaults(func=bench_links)
+
+    sharding = commands.add_parser('sharding', help="一致性哈希分片均衡度与迁移比例")
+    sharding.add_argument('--hosts', type=int, default=100_000)
+    sharding.add_argument('--shards', type=int, default=8)
+    sharding.set_defaults(func=bench_sharding)
+
+    storage = commands.add_parser('storage', help="批量存储管道吞吐")
+    storage.add_argument('--items', type=int, default=200_000)
+    storage.add_argument('--batch-rows', type=int, default=10_000)
+    storage.set_defaults(func=bench_storage)
+
+    pipeline = commands.add_parser('pipeline', help="数据加工逐条与批量对比")
+    pipeline.add_argument('--items', type=int, default=100_000)
+    pipeline.add_argument('--batch-size', type=int, default=256)
+    pipeline.set_defaults(func=bench_pipeline)
+
+    connections = commands.add_parser('connections', help="DNS缓存与按主机连接池调优对比")
+    connections.add_argument('--vhosts', type=int, default=200)
+    connections.add_argument('--requests', type=int, default=20_000)
+    connections.add_argument('--concurrency', type=int, default=200)
+    connections.add_argument('--limit-per-host', type=int, default=8)
+    connections.add_argument('--dns-latency', type=float, default=0.02, help="模拟上游DNS查询延迟（秒）")
+    connections.add_argument('--server-latency', type=float, default=0.002)
+    connections.set_defaults(func=bench_connections)
+
+    checkpoint = commands.add_parser('checkpoint', help="检查点与恢复耗时")
+    checkpoint.add_argument('--urls', type=int, default=1_000_000)
+    checkpoint.add_argument('--pending', type=int, default=200_000)
+    checkpoint.add_argument('--hot-capacity', type=int, default=100_000)
+    checkpoint.set_defaults(func=bench_checkpoint)
+
+    startup = commands.add_parser('startup', help="冷启动导入耗时（-X importtime）与引擎构造耗时")
+    startup.add_argument('--repeat', type=int, default=7, help="每项启动子进程的次数（取中位数）")
+    startup.add_argument('--top', type=int, default=10, help="列出耗时最多的直接导入模块数")
+    startup.add_argument('--cache-entries', type=int, default=200_000, help="预置磁盘缓存的条目数")
+    startup.add_argument('--value-bytes', type=int, default=512)
+    startup.set_defaults(func=bench_startup)
+
+    compression = commands.add_parser('compression', help="压缩传输协商与压缩缓存")
+    compression.add_argument('--pages', type=int, default=4_000)
+    compression.add_argument('--hosts', type=int, default=40)
+    compression.add_argument('--reads', type=int, default=2_000)
+    compression.add_argument('--concurrency', type=int, default=32)
+    compression.add_argument('--dictionary-samples', type=int, default=32)
+    compression.add_argument('--offload-bytes', type=int, default=64 * 1024,
+                             help="不小于此大小的正文交给磁盘缓存执行器压缩，0 表示全部交出")
+    compression.set_defaults(func=bench_compression)
+
+    crawl = commands.add_parser('crawl', help="真实引擎爬取本地模拟站点的端到端吞吐")
+    add_mock_site_arguments(crawl)
+    crawl.add_argument('--output', help="同时把结果写入该JSON文件，便于跨版本对比")
+    crawl.set_defaults(func=bench_crawl)
+
+    breaker = commands.add_parser('breaker', help="主机宕机时熔断与重试预算的效果")
+    add_mock_site_arguments(breaker)
+    breaker.set_defaults(pages=1_000, hosts=50)
+    breaker.add_argument('--down-hosts', type=int, default=3)
+    breaker.add_argument('--down-latency', type=float, default=0.5)
+    breaker.add_argument('--retries', type=int, default=2)
+    breaker.add_argument('--cooldown', type=float, default=2.0)
+    breaker.add_argument('--give-up', type=float, default=5.0)
+    breaker.set_defaults(func=bench_breaker)
+
+    concurrency = commands.add_parser('concurrency', help="AIMD 自适应并发与固定并发对比")
+    add_mock_site_arguments(concurrency)
+    concurrency.add_argument('--capacity', type=int, default=40, help="服务端同时处理的请求数，超出返回503")
+    concurrency.add_argument('--swing', type=float, default=4.0, help="慢阶段延迟倍数")
+    concurrency.add_argument('--swing-period', type=float, default=3.0, help="快慢阶段各持续秒数")
+    concurrency.add_argument('--initial', type=int, default=16)
+    concurrency.add_argument('--host-maximum', type=int, default=1)
+    concurrency.add_argument('--retries', type=int, default=2)
+    concurrency.set_defaults(func=bench_concurrency, concurrency=200, latency=0.05, hosts=200)
+
+    dedup = commands.add_parser('dedup', help="近重复检测的准确率、开销与端到端收益")
+    add_mock_site_arguments(dedup)
+    dedup.add_argument('--duplicate-rate', type=float, default=0.3)
+    dedup.add_argument('--fingerprints', type=int, default=2_000_000, help="测查询耗时的索引规模")
+    dedup.set_defaults(func=bench_dedup, pages=3_000)
+
+    priority = commands.add_parser('priority', help="优先级队列吞吐与聚焦抓取的有效抓取比例")
+    add_mock_site_arguments(priority)
+    priority.add_argument('--listing-rate', type=float, default=0.6, help="标签/分页列表页的比例")
+    priority.add_argument('--budget', type=int, default=1_000, help="统计前多少次抓取")
+    priority.add_argument('--buffer', type=int, default=200, help="调度器缓冲的URL数")
+    priority.add_argument('--urls', type=int, default=1_000_000, help="队列吞吐测试的条目数")
+    priority.set_defaults(func=bench_priority)
+
+    robots = commands.add_parser('robots', help="robots.txt 匹配吞吐与端到端的合并抓取、Crawl-delay")
+    add_mock_site_arguments(robots)
+    robots.add_argument('--rules', type=int, default=400, help="robots.txt 中的规则数")
+    robots.add_argument('--checks', type=int, default=200_000)
+    robots.add_argument('--listing-rate', type=float, default=0.3, help="被 Disallow 的 /tag/ 页面比例")
+    robots.add_argument('--crawl-delay', type=float, default=0.2)
+    robots.add_argument('--host-maximum', type=int, default=4, help="同一主机的在途请求上限")
+    robots.set_defaults(func=bench_robots, pages=1_000, hosts=20)
+
+    sitemaps = commands.add_parser('sitemaps', help="站点地图流式读取吞吐、背压、内存与增量重读")
+    sitemaps.add_argument('--files', type=int, default=16, help="索引中的子站点地图数")
+    sitemaps.add_argument('--urls-per-file', type=int, default=50_000)
+    sitemaps.add_argument('--changed', type=float, default=0.05, help="第 2 代中 lastmod 更新的页面比例")
+    sitemaps.add_argument('--max-pending', type=int, default=100_000)
+    sitemaps.add_argument('--drain-rate', type=int, default=50_000, help="背压测试中每秒从队列取出的URL数")
+    sitemaps.add_argument('--hot-capacity', type=int, default=100_000)
+    sitemaps.add_argument('--memory-files', type=int, default=4, help="测内存峰值时连续读取的文件数")
+    sitemaps.set_defaults(func=bench_sitemaps)
+
+    backpressure = commands.add_parser('backpressure', help="慢速存储下有界通道与内存高水位暂停的峰值内存与吞吐")
+    add_mock_site_arguments(backpressure)
+    backpressure.add_argument('--store-rate', type=float, default=25, help="存储每秒写入的行数")
+    backpressure.add_argument('--batch-rows', type=int, default=64, help="微批次与存储批次的行数")
+    backpressure.add_argument('--capacity', type=int, default=128, help="收集器至多积压的条目数")
+    backpressure.add_argument('--store-batches', type=int, default=2)
+    backpressure.add_argument('--headroom-mb', type=int, default=48, help="高水位比启动时 RSS 高出的量")
+    backpressure.set_defaults(func=bench_backpressure, pages=1_200, hosts=20, page_kb=64)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()